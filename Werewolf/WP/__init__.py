@@ -5,4 +5,8 @@ The protocol for the werewolf game
 import os
 import socket
 import sys
-from .api import ChunckedData, ReceiveThread, _recv, TimeLock, KillableThread, ReadInput
+from .api import ChunckedData, FrameBuffer, ReceiveThread, _recv, TimeLock, ReadInput, InputMismatchError, parseInput, setConnectionCodec
+from .cancel import CancelToken, CancellationError
+from .scheduler import Scheduler, getScheduler
+from .terminal import TerminalInput, getTerminal
+from .codec import Codec, registerCodec, getCodec, listCodecs, negotiateCodec
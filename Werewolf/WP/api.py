@@ -1,75 +1,232 @@
-import ctypes
-import gzip
 import json
+import re
+import select
 import socket
+import struct
 import threading
-from io import BytesIO
-from time import sleep
-from typing import Any, Callable, Dict, Optional, Tuple
+import weakref
+import zlib
+from time import monotonic
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
 
-from .utils import _checkParam
+from .cancel import CancelToken
+from .codec import Codec, CompressionPolicy, Compressor, Decompressor, GzipCodec, compressShared, defaultCodec, defaultPolicy, getCodec
+from .schema import PacketFieldMismatchException, PacketTypeMismatchException, getValidator
+from .scheduler import Timer, getScheduler
+from .terminal import TerminalInput, getTerminal
 
+# Every packet on the wire is prefixed by a fixed size header: the length of the payload (unsigned, 4 bytes),
+# the packet type (signed, 1 byte), the id of the codec encoding the payload (unsigned, 1 byte)
+# and the compression flags (unsigned, 1 byte)
+_frameHeader: struct.Struct = struct.Struct('!IbBB')
+MAX_FRAME_SIZE: int = 16 * 1024 * 1024
+RECV_BUFSIZE: int = 65536
 
-class PacketTypeMismatchException(Exception):
 
-    def __init__(self, packetType: int, fieldName: str):
+class NotConnectedError(Exception):
+
+    def __init__(self):
         super().__init__()
-        self.type: int = packetType
-        self.field: str = fieldName
 
     def __str__(self):
-        return "Packet type %d requires field '%s', which is not found." % (self.type, self.field)
+        return 'The socket is not connected.'
 
 
-class PacketFieldMismatchException(Exception):
+class ReceiveTimeoutError(Exception):
 
-    def __init__(self, packetType: int, fieldName: str, fieldType: type, expectedType: type):
-        super().__init__()
-        self.type: int = packetType
-        self.name: str = fieldName
-        self.field: type = fieldType
-        self.expected: type = expectedType
+    def __init__(self, timeout: float):
+        self.timeout: float = timeout
+        super(ReceiveTimeoutError).__init__()
 
     def __str__(self):
-        return "Field %s of packet type %d requires type %s, got %s." % (self.name, self.type, str(self.expected), str(self.field))
+        return "Data receive timeout."
 
 
-class NotConnectedError(Exception):
+class PacketFrameError(Exception):
 
-    def __init__(self):
+    def __init__(self, length: int):
         super().__init__()
+        self.length: int = length
 
     def __str__(self):
-        return 'The socket is not connected.'
+        return "Frame length %d exceeds the limit of %d bytes." % (self.length, MAX_FRAME_SIZE)
 
 
-class ReceiveTimeoutError(Exception):
+class PacketDecodeError(Exception):
+    """
+    The frame received cannot be decoded: the codec is unknown, or the payload is corrupted. The connection should be treated as lost.
+    """
 
-    def __init__(self, timeout: float):
-        self.timeout: float = timeout
-        super(ReceiveTimeoutError).__init__()
+    def __init__(self, packetType: int, codec: int, reason: BaseException):
+        super().__init__()
+        self.type: int = packetType
+        self.codec: int = codec
+        self.reason: BaseException = reason
 
     def __str__(self):
-        return "Data receive timeout."
+        return "Cannot decode packet type %d with codec %d: %r." % (self.type, self.codec, self.reason)
+
+
+class Frame(NamedTuple):
+    packetType: int
+    codec: int
+    payload: bytes
+
+
+class FrameBuffer(object):
+    """
+    Incremental reassembly buffer of the frames received from a connection.
+
+    Methods:
+
+        FrameBuffer.feed(data): append the bytes received to the buffer
+        FrameBuffer.pop(): take a complete frame out of the buffer
+
+    Notice:
+
+        **The buffer holds a lock, which should be acquired when the buffer is shared between threads.**
+    """
+
+    def __init__(self):
+        self.buffer: bytearray = bytearray()
+        self.lock: threading.Lock = threading.Lock()
+        self.decompressor: Decompressor = Decompressor()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def feed(self, data: bytes):
+        self.buffer.extend(data)
+
+    def pop(self) -> Optional[Frame]:
+        """
+        Get the first complete frame in the buffer
+
+        Returns:
+
+        - `Frame`: if a complete frame is buffered
+        - `None`: if more data is required
+        """
+        if len(self.buffer) < _frameHeader.size:
+            return None
+        length, packetType, codec, flags = _frameHeader.unpack_from(self.buffer)
+        if length > MAX_FRAME_SIZE:
+            raise PacketFrameError(length)
+        end = _frameHeader.size + length
+        if len(self.buffer) < end:
+            return None
+        try:
+            payload = self.decompressor.decompress(
+                flags, bytes(self.buffer[_frameHeader.size:end]), MAX_FRAME_SIZE)
+        except OverflowError:
+            raise PacketFrameError(MAX_FRAME_SIZE + 1)
+        except zlib.error as e:
+            raise PacketDecodeError(packetType, codec, e)
+        del self.buffer[:end]
+        return Frame(packetType, codec, payload)
+
+
+_frameBuffers: 'weakref.WeakKeyDictionary[socket.socket, FrameBuffer]' = weakref.WeakKeyDictionary()
+_frameBuffersLock: threading.Lock = threading.Lock()
+
+
+def _getFrameBuffer(connection: socket.socket) -> FrameBuffer:
+    """
+    Get the reassembly buffer bound to the connection, the bytes received but not yet decoded are kept between calls.
+    """
+    with _frameBuffersLock:
+        ret = _frameBuffers.get(connection)
+        if ret is None:
+            ret = _frameBuffers[connection] = FrameBuffer()
+        return ret
+
+
+class FrameEncoder(object):
+    """
+    The sending side of a connection: encodes the packets with the codec negotiated and compresses the payloads.
+
+    Attributes:
+
+        codec: Codec, the codec negotiated in the handshake
+        compressor: Compressor, the deflate stream of the connection, the counters are in `compressor.stats`
+
+    Notice:
+
+        **The lock should be held from encoding a packet until the frame is written, so the frames are sent in the order of the deflate stream.**
+    """
+
+    def __init__(self, codec: Codec = defaultCodec, policy: CompressionPolicy = defaultPolicy):
+        self.codec: Codec = codec
+        self.compressor: Compressor = Compressor(policy)
+        self.lock: threading.Lock = threading.Lock()
+
+    def encode(self, packet: 'ChunckedData') -> bytes:
+        payload = self.codec.encode(packet.type, packet.content)
+        flags = 0
+        if self.codec.compressible:
+            flags, payload = self.compressor.compress(payload)
+        return _frameHeader.pack(len(payload), packet.type, self.codec.id, flags) + payload
+
+
+def encodeShared(packet: 'ChunckedData', codec: Codec, policy: CompressionPolicy = defaultPolicy) -> bytes:
+    """
+    Encode a frame which can be sent to every connection using the codec, whatever the state of its deflate stream.
+    """
+    payload = codec.encode(packet.type, packet.content)
+    flags = 0
+    if codec.compressible:
+        flags, payload = compressShared(policy, payload)
+    return _frameHeader.pack(len(payload), packet.type, codec.id, flags) + payload
+
+
+def groupByCodec(connections: Iterable[socket.socket]) -> Dict[Codec, List[socket.socket]]:
+    """
+    Group the connections by the codec negotiated, the packets sent to a group are encoded once.
+    """
+    ret: Dict[Codec, List[socket.socket]] = {}
+    for connection in connections:
+        ret.setdefault(getFrameEncoder(connection).codec, []).append(connection)
+    return ret
+
+
+_frameEncoders: 'weakref.WeakKeyDictionary[socket.socket, FrameEncoder]' = weakref.WeakKeyDictionary()
+
+
+def getFrameEncoder(connection: socket.socket) -> FrameEncoder:
+    """
+    Get the encoder bound to the connection.
+    """
+    with _frameBuffersLock:
+        ret = _frameEncoders.get(connection)
+        if ret is None:
+            ret = _frameEncoders[connection] = FrameEncoder()
+        return ret
+
+
+def setConnectionCodec(connection: socket.socket, codec: Union[Codec, int, str], policy: Optional[CompressionPolicy] = None):
+    """
+    Set the codec used to send packets through the connection, the codec is negotiated in the handshake.
+
+    If the policy is not `None`, a new deflate stream is started with the policy.
+    """
+    encoder = getFrameEncoder(connection)
+    with encoder.lock:
+        encoder.codec = codec if isinstance(codec, Codec) else getCodec(codec)
+        if policy is not None:
+            encoder.compressor = Compressor(policy)
 
 
 class ChunckedData(object):
 
     @staticmethod
     def _compress(content: str) -> bytearray:
-        buffer: BytesIO = BytesIO()
-        with gzip.GzipFile(mode="wb", fileobj=buffer) as compressor:
-            compressor.write(content.encode(encoding='utf-8'))
-        return bytearray(buffer.getvalue())
+        return GzipCodec.compress(content)
 
     @staticmethod
     def _decompress(data: bytearray) -> str:
-        buffer: BytesIO = BytesIO(bytes(data))
-        with gzip.GzipFile(mode='rb', fileobj=buffer) as output:
-            ret = output.read().decode(encoding="utf-8")
-            # REVIEW for debugging
-            # print(ret)
-            return ret
+        # REVIEW for debugging
+        # print(GzipCodec.decompress(data))
+        return GzipCodec.decompress(data)
 
     def __init__(self, packetType: int, **kwargs: Any):
         """
@@ -86,18 +243,18 @@ class ChunckedData(object):
             del self.content['type']
         else:
             self.content = kwargs
-            # Check the content
-            try:
-                for i in _checkParam[''].keys():
-                    if not isinstance(self.content[i], _checkParam[''][i]):
-                        raise PacketFieldMismatchException(self.type, i, type(
-                            self.content[i]), _checkParam[''][i])
-                for i in _checkParam[self.type].keys():
-                    if not isinstance(self.content[i], _checkParam[self.type][i]):
-                        raise PacketFieldMismatchException(self.type, i, type(
-                            self.content[i]), _checkParam[self.type][i])
-            except KeyError as a:
-                raise PacketTypeMismatchException(self.type, *a.args)
+        # Check the content
+        getValidator(self.type).validate(self.content)
+
+    @classmethod
+    def trusted(cls, packetType: int, **kwargs: Any) -> 'ChunckedData':
+        """
+        Defines a new data packet without checking the content, used for the packets built by the server from values of known types.
+        """
+        ret = cls.__new__(cls)
+        ret.type = packetType
+        ret.content = kwargs
+        return ret
 
     def __getitem__(self, index):
         return self.content[index]
@@ -122,21 +279,65 @@ class ChunckedData(object):
         # print(json.dumps(c))
         return self._compress(json.dumps(c))
 
+    def toFrame(self, codec: Codec = defaultCodec) -> bytes:
+        """
+        Encode the packet with the codec and prefix it with the frame header, the payload is not compressed.
+        """
+        payload = codec.encode(self.type, self.content)
+        return _frameHeader.pack(len(payload), self.type, codec.id, 0) + payload
+
+    @classmethod
+    def fromFrame(cls, frame: Frame) -> 'ChunckedData':
+        """
+        Decode a frame taken out of a `FrameBuffer` and check the content, raises `PacketDecodeError` if the payload cannot be decoded or does not match `_checkParam`.
+        """
+        ret = cls.__new__(cls)
+        ret.type = frame.packetType
+        try:
+            validator = getValidator(frame.packetType)
+            codec = getCodec(frame.codec)
+            ret.content = codec.decode(frame.packetType, frame.payload)
+            if not codec.checked:
+                validator.validate(ret.content)
+        except (AttributeError, EOFError, IndexError, KeyError, OSError, TypeError, ValueError, struct.error, zlib.error,
+                PacketFieldMismatchException, PacketTypeMismatchException) as e:
+            raise PacketDecodeError(frame.packetType, frame.codec, e)
+        return ret
+
     def send(self, connection: socket.socket):
-        connection.send(bytes(self.toBytesArray()))
+        encoder = getFrameEncoder(connection)
+        with encoder.lock:
+            connection.sendall(encoder.encode(self))
 
 
-def _recv(connection: socket.socket) -> ChunckedData:
+def _recv(connection: socket.socket, timeout: float = 0) -> ChunckedData:
     """
     Wrapper for receiving thread.
-    """
-    ret = ChunckedData(0, rawData=connection.recv(16384))
-    return ret
 
+    Reads from the connection until a complete frame is reassembled, the remaining bytes are kept for the next call.
 
-class TimeLock(threading.Thread):
+    Raises `ReceiveTimeoutError` if no complete frame is received within the timeout, 0 for no limit. The bytes already received are kept in the buffer.
     """
-    Start a thread waiting in the background.
+    buffer = _getFrameBuffer(connection)
+    deadline = monotonic() + timeout
+    with buffer.lock:
+        frame = buffer.pop()
+        while frame is None:
+            if timeout:
+                remaining = deadline - monotonic()
+                if remaining <= 0 or not select.select([connection], [], [], remaining)[0]:
+                    raise ReceiveTimeoutError(timeout)
+            data = connection.recv(RECV_BUFSIZE)
+            if not data:
+                raise ConnectionResetError("The connection is closed by the peer.")
+            buffer.feed(data)
+            frame = buffer.pop()
+    return ChunckedData.fromFrame(frame)
+
+
+class TimeLock(object):
+    """
+    A deadline registered in the scheduler of the process, no thread is started.
 
     Initialization:
 
@@ -146,73 +347,95 @@ class TimeLock(threading.Thread):
 
         TimeLock.start(): start waiting
         TimeLock.getStatus(): get current status
-
-    Notice:
-
-        **TimeLock.setDeamon(True) should be called before starting.**
+        TimeLock.wait(): block until the deadline
+        TimeLock.cancel(): stop waiting
     """
 
     def __init__(self, timeout: float):
-        super().__init__()
-        self.end = False
-        self.timeout = timeout
+        self.timeout: float = timeout
+        self.expired: threading.Event = threading.Event()
+        self.timer: Optional[Timer] = None
 
-    def run(self):
-        sleep(self.timeout)
-        self.end = True
+    def setDaemon(self, daemonic: bool):
+        """
+        Kept for compatibility, the deadline does not start a thread.
+        """
+        pass
+
+    def start(self):
+        self.timer = getScheduler().callLater(self.timeout, self.expired.set)
+
+    def getStatus(self) -> bool:
+        return self.expired.is_set()
 
-    def getStatus(self):
-        return self.end
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.expired.wait(timeout)
 
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
 
-class KillableThread(threading.Thread):
+
+class InputMismatchError(ValueError):
     """
-    A thread class extending threading.Thread, provides a kill() method to stop the thread and a getResult() method to get the return value of the thread.
+    The line typed by the player does not match the format expected, or chooses a seat that cannot be chosen.
     """
 
-    def __init__(self, func: Callable, *args, **kwargs):
-        super().__init__()
-        self.func: Callable = func
-        self.funcArg: dict = kwargs
-        self.funcTup: Tuple = args
-        self.result: Any = None
-        self.exception: Any = None
+    def __init__(self, message: str = "你的输入格式不匹配"):
+        super().__init__(message)
 
-    def run(self):
-        """
-        Executes the function here
-        """
-        try:
-            self.result = self.func(*self.funcTup, **self.funcArg)
-        except BaseException as e:
-            self.exception = e
 
-    def get_id(self):
-        """
-        Get the id of the thread
-        """
-        if hasattr(self, '_thread_id'):
-            return self._thread_id
-        for id, thread in threading._active.items():
-            if thread is self:
-                return id
+_trueWords = frozenset(('true', 't', 'yes', 'y', '1', '是'))
+_falseWords = frozenset(('false', 'f', 'no', 'n', '0', '否'))
+_seatSeparators = re.compile(r'[\s,，、]+')
+_integer = re.compile(r'[+-]?[0-9]+')
 
-    def kill(self):
-        """
-        Stops the thread
-        """
-        thread_id = self.get_id()
-        res = ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id,
-                                                         ctypes.py_object(SystemExit))
-        if res > 1:
-            ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id, 0)
-            print('Exception raise failure')
-
-    def getResult(self):
-        if self.exception is None:
-            return self.result
-        else:
-            raise self.exception
+
+def _parseSeat(text: str, choices: Optional[Iterable[int]]) -> int:
+    if not _integer.fullmatch(text):
+        raise InputMismatchError()
+    ret = int(text)
+    if choices is not None and ret not in choices:
+        raise InputMismatchError("%d号玩家不能被选择" % (ret, ))
+    return ret
+
+
+def parseInput(text: str, inputType: Any = str, choices: Optional[Iterable[int]] = None) -> Any:
+    """
+    Convert a line typed by the player to the type expected, nothing typed is evaluated.
+
+    Parameters:
+
+        text: str, the line typed
+        inputType: the type expected, a type or the `format` of an `ActionPrompt`: `str`, `int`, `bool`, or `seats` for a list of seats separated by commas or spaces
+        choices: the values an `int` or the seats of a list can take, any value if `None`
+
+    Returns:
+
+        the value typed
+
+    Raises `InputMismatchError`, a `ValueError`, if the line does not match.
+    """
+    inputType = getattr(inputType, '__name__', inputType)
+    if inputType == 'str':
+        return text
+    text = text.strip()
+    if choices is not None:
+        choices = frozenset(choices)
+    if inputType == 'int':
+        return _parseSeat(text, choices)
+    if inputType == 'bool':
+        if text.lower() in _trueWords:
+            return True
+        if text.lower() in _falseWords:
+            return False
+        raise InputMismatchError()
+    if inputType in ('seats', 'list'):
+        ret = [_parseSeat(_, choices) for _ in _seatSeparators.split(text) if _]
+        if len(set(ret)) != len(ret):
+            raise InputMismatchError("同一名玩家不能被选择两次")
+        return ret
+    raise InputMismatchError("未知的输入格式%s" % (inputType, ))
 
 
 def getInput(prompt: str, inputType: type = str, allowInterrupt: bool = False) -> Any:
@@ -225,56 +448,98 @@ def getInput(prompt: str, inputType: type = str, allowInterrupt: bool = False) -
                 return KeyboardInterrupt()
             else:
                 continue
-        if inputType != str:
-            try:
-                return eval(temp)
-            except:
-                print("你的输入格式不匹配")
-        else:
-            return temp
+        try:
+            return parseInput(temp, inputType)
+        except ValueError as e:
+            print(e)
 
 
-class ReadInput(KillableThread):
+class ReadInput(object):
     """
-    The input thread, will be interrupted by KeyBoardInterruption
+    A timed prompt on the standard input.
+
+    The lines are read from the `TerminalInput` of the process in the thread calling `join()`, no thread is started. The prompt stops reading at its deadline or when its token is cancelled, so no reader is left blocked on the terminal to take the answer of a later prompt.
     """
 
-    def __init__(self, prompt: str, inputType: type = str, timeout: float = 0, allowInterrupt: bool = False):
-        super().__init__(getInput)
+    def __init__(self, prompt: str, inputType: Any = str, timeout: float = 0, allowInterrupt: bool = False, token: Optional[CancelToken] = None, terminal: Optional[TerminalInput] = None, choices: Optional[Iterable[int]] = None):
         self.inputType = inputType
+        self.choices: Optional[Iterable[int]] = choices
         self.timeout = timeout
         self.result: Any = None
         self.prompt = prompt
         self.allowInterrupt: bool = allowInterrupt
+        self.token: Optional[CancelToken] = token
+        self.terminal: TerminalInput = terminal if terminal is not None else getTerminal()
+        self.deadline: Optional[float] = None
+        self.done: bool = False
+        self.timedOut: bool = False
 
-    def run(self) -> Any:
-        if self.timeout == 0:
-            self.result = getInput(self.prompt, self.inputType)
-        else:
-            dest: ReadInput = ReadInput(
-                self.prompt, self.inputType, 0, self.allowInterrupt)
-            dest.setDaemon(True)
-            dest.start()
-            dest.join(self.timeout)
-            self.result = dest.getResult()
-            if self.result is None:
-                print("Input timeout.")
+    def setDaemon(self, daemonic: bool):
+        """
+        Kept for compatibility, no thread is started.
+        """
+        pass
+
+    def start(self):
+        if self.timeout:
+            self.deadline = monotonic() + self.timeout
+        if self.prompt:
+            print(self.prompt, end='', flush=True)
+
+    def is_alive(self) -> bool:
+        return not self.done and not self.timedOut
+
+    def join(self, timeout: Optional[float] = None):
+        """
+        Read the lines typed until one matches the type expected, the deadline of the prompt or the cancellation of the token. If `timeout` expires first, the prompt can be joined again.
+        """
+        end = None if timeout is None else monotonic() + timeout
+        while self.is_alive():
+            stops = [_ for _ in (self.deadline, end) if _ is not None]
+            remaining = max(min(stops) - monotonic(), 0) if stops else None
+            try:
+                line = self.terminal.readLine(remaining, self.token)
+            except EOFError:
+                if self.allowInterrupt:
+                    self.result = KeyboardInterrupt()
+                    self.done = True
+                    return
+                # Nothing can be typed anymore
+                self.timedOut = True
+                return
+            if line is None:
+                if self.token is not None and self.token.isCancelled():
+                    self.timedOut = True
+                elif self.deadline is not None and self.deadline <= monotonic():
+                    self.timedOut = True
+                    print("Input timeout.")
+                if end is not None and end <= monotonic():
+                    return
+                continue
+            try:
+                self.result = parseInput(line, self.inputType, self.choices)
+                self.done = True
+            except ValueError as e:
+                print(e)
 
     def getResult(self) -> Any:
         """
         Get the return value of the input
 
         - inputType: if the input is correctly processed
-        - `None`: if timeout
-        - `KeyboardInterrupt`: if Ctrl-C is pressed
+        - `None`: if timeout or cancelled
+        - `KeyboardInterrupt`: if the end of the input is reached and `allowInterrupt` is set
         """
-        return self.result
+        return None if self.timedOut else self.result
 
 
-class ReceiveThread(KillableThread):
+class ReceiveThread(threading.Thread):
+    """
+    The receiving thread, the timeout is checked by the thread itself, no other thread is started.
+    """
 
     def __init__(self, connection: socket.socket, timeout: float = 0):
-        super(ReceiveThread, self).__init__(_recv, *(connection, ))
+        super(ReceiveThread, self).__init__(daemon=True)
         self.result: Any = None
         self.timeout: float = timeout
         self.connection: socket.socket = connection
@@ -282,18 +547,12 @@ class ReceiveThread(KillableThread):
 
     def run(self):
         try:
-            if not self.timeout:
-                self.result = _recv(self.connection)
-            else:
-                dest: ReceiveThread = ReceiveThread(self.connection)
-                dest.setDaemon(True)
-                dest.start()
-                dest.join(self.timeout)
-                self.result = dest.getResult()
-                if self.result is None:
-                    self.exitcode = 1
-                    self.exception = ReceiveTimeoutError(self.timeout)
-                    self.exc_traceback = str(self.exception)
+            self.result = _recv(self.connection, self.timeout)
+        except ReceiveTimeoutError as e:
+            self.exitcode = 1
+            self.exception = e
+            self.exc_traceback = str(self.exception)
+            self.result = None
         except BaseException as e:
             self.exception = e
             self.result = None
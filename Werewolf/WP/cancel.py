@@ -0,0 +1,95 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+
+class CancellationError(Exception):
+    """
+    Raised by `CancelToken.check()` in a task whose token is cancelled.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    def __str__(self):
+        return "The operation is cancelled."
+
+
+class CancelToken(object):
+    """
+    A cooperative cancellation signal, shared by the tasks of a phase.
+
+    Cancelling the token never interrupts a thread: the callbacks registered wake up what is blocked, e.g. cancel a pending request or set an event, and the task stops at its next `check()`. A thread blocked on the network or the terminal is woken by the event loop it waits on, so no thread or socket is left behind.
+
+    Methods:
+
+        CancelToken.cancel(): cancel the token, the callbacks are called once
+        CancelToken.isCancelled(): whether the token is cancelled
+        CancelToken.check(): raise `CancellationError` if the token is cancelled
+        CancelToken.onCancel(): register a callback, called at once if the token is already cancelled
+        CancelToken.removeCallback(): unregister a callback
+        CancelToken.link(): cancel a future with the token
+        CancelToken.wait(): block until the token is cancelled
+    """
+
+    def __init__(self):
+        self.lock: threading.Lock = threading.Lock()
+        self.cancelled: threading.Event = threading.Event()
+        self.callbacks: Dict[int, Callable[[], Any]] = {}
+        self.handles: int = 0
+
+    def cancel(self):
+        with self.lock:
+            if self.cancelled.is_set():
+                return
+            self.cancelled.set()
+            callbacks = list(self.callbacks.values())
+            self.callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print("Cancel callback failed: %r" % (e, ))
+
+    def isCancelled(self) -> bool:
+        return self.cancelled.is_set()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise CancellationError()
+
+    def onCancel(self, callback: Callable[[], Any]) -> int:
+        """
+        Register a callback, called in the thread cancelling the token.
+
+        Returns:
+
+            int, the handle of the callback for `removeCallback()`, 0 if the callback is already called
+        """
+        with self.lock:
+            if not self.cancelled.is_set():
+                self.handles += 1
+                self.callbacks[self.handles] = callback
+                return self.handles
+        callback()
+        return 0
+
+    def removeCallback(self, handle: int):
+        with self.lock:
+            self.callbacks.pop(handle, None)
+
+    def link(self, future: Future) -> Future:
+        """
+        Cancel the future when the token is cancelled, the callback is removed once the future is done.
+        """
+        handle = self.onCancel(future.cancel)
+        if handle:
+            future.add_done_callback(lambda _: self.removeCallback(handle))
+        return future
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.cancelled.wait(timeout)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.callbacks)
@@ -0,0 +1,393 @@
+import gzip
+import json
+import struct
+import zlib
+from io import BytesIO
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+from .schema import PacketFieldMismatchException, _validators
+from .utils import _checkParam
+
+
+class Codec(object):
+    """
+    Base class of the packet encodings.
+
+    Attributes:
+
+        id: int, the identifier of the codec, sent in the frame header
+        name: str, the name of the codec, used in the handshake
+        priority: int, codecs with higher priority are preferred in the handshake
+        compressible: bool, whether the payload is compressed by the `CompressionPolicy` of the connection
+        checked: bool, whether the content decoded always matches `_checkParam`, so that it is not validated again
+
+    Methods:
+
+        Codec.encode(packetType, content): encode the content of a packet
+        Codec.decode(packetType, data): decode the content of a packet
+    """
+
+    id: int = -1
+    name: str = ''
+    priority: int = 0
+    compressible: bool = True
+    checked: bool = False
+
+    def encode(self, packetType: int, content: Dict[str, Any]) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, packetType: int, data: bytes) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class GzipCodec(Codec):
+    """
+    The original encoding: the content is dumped to JSON and compressed with gzip.
+    """
+
+    id = 0
+    name = 'gzip'
+    priority = 0
+    compressible = False
+
+    @staticmethod
+    def compress(content: str) -> bytearray:
+        buffer: BytesIO = BytesIO()
+        with gzip.GzipFile(mode="wb", fileobj=buffer) as compressor:
+            compressor.write(content.encode(encoding='utf-8'))
+        return bytearray(buffer.getvalue())
+
+    @staticmethod
+    def decompress(data: bytearray) -> str:
+        buffer: BytesIO = BytesIO(bytes(data))
+        with gzip.GzipFile(mode='rb', fileobj=buffer) as output:
+            return output.read().decode(encoding="utf-8")
+
+    def encode(self, packetType: int, content: Dict[str, Any]) -> bytes:
+        c = content.copy()
+        c['type'] = packetType
+        return bytes(self.compress(json.dumps(c)))
+
+    def decode(self, packetType: int, data: bytes) -> Dict[str, Any]:
+        ret = json.loads(self.decompress(data))
+        ret.pop('type', None)
+        return ret
+
+
+def _writeVarint(buffer: bytearray, value: int):
+    while value > 0x7f:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _readVarint(data: bytes, pos: int) -> Tuple[int, int]:
+    ret, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        ret |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return ret, pos
+        shift += 7
+
+
+_double: struct.Struct = struct.Struct('!d')
+
+
+def _writeBool(buffer: bytearray, value: bool):
+    buffer.append(1 if value else 0)
+
+
+def _readBool(data: bytes, pos: int) -> Tuple[bool, int]:
+    return data[pos] != 0, pos + 1
+
+
+def _writeInt(buffer: bytearray, value: int):
+    # zigzag encoding, small negative numbers are also short
+    _writeVarint(buffer, value << 1 if value >= 0 else ((-value) << 1) - 1)
+
+
+def _readInt(data: bytes, pos: int) -> Tuple[int, int]:
+    value, pos = _readVarint(data, pos)
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1), pos
+
+
+def _writeFloat(buffer: bytearray, value: float):
+    buffer.extend(_double.pack(value))
+
+
+def _readFloat(data: bytes, pos: int) -> Tuple[float, int]:
+    return _double.unpack_from(data, pos)[0], pos + _double.size
+
+
+def _writeBytes(buffer: bytearray, value: bytes):
+    _writeVarint(buffer, len(value))
+    buffer.extend(value)
+
+
+def _readBytes(data: bytes, pos: int) -> Tuple[bytes, int]:
+    length, pos = _readVarint(data, pos)
+    if pos + length > len(data):
+        raise IndexError("The string is truncated.")
+    return bytes(data[pos:pos + length]), pos + length
+
+
+def _writeStr(buffer: bytearray, value: str):
+    _writeBytes(buffer, value.encode(encoding='utf-8'))
+
+
+def _readStr(data: bytes, pos: int) -> Tuple[str, int]:
+    value, pos = _readBytes(data, pos)
+    return value.decode(encoding='utf-8'), pos
+
+
+def _readBytearray(data: bytes, pos: int) -> Tuple[bytearray, int]:
+    value, pos = _readBytes(data, pos)
+    return bytearray(value), pos
+
+
+_fieldWriters: Dict[type, Callable[[bytearray, Any], None]] = {
+    bool: _writeBool,
+    int: _writeInt,
+    float: _writeFloat,
+    str: _writeStr,
+    bytearray: _writeBytes
+}
+
+_fieldReaders: Dict[type, Callable[[bytes, int], Tuple[Any, int]]] = {
+    bool: _readBool,
+    int: _readInt,
+    float: _readFloat,
+    str: _readStr,
+    bytearray: _readBytearray
+}
+
+
+class BinaryCodec(Codec):
+    """
+    Compact binary encoding driven by `_checkParam`.
+
+    The fields listed in `_checkParam` are written without names in a fixed order: the common fields first, then the fields of the packet type. Integers are zigzag varints, floats are 8-byte doubles, strings are length-prefixed UTF-8. The fields not listed in `_checkParam` are appended as a length-prefixed JSON object, which is empty for most packets.
+    """
+
+    id = 1
+    name = 'binary'
+    priority = 10
+
+    checked = True
+
+    def __init__(self):
+        self.common: Tuple[Tuple[str, type], ...] = tuple(_checkParam[''].items())
+        self.schema: Dict[int, Tuple[Tuple[str, type], ...]] = {
+            packetType: validator.fields for packetType, validator in _validators.items()
+        }
+
+    def fields(self, packetType: int) -> Tuple[Tuple[str, type], ...]:
+        return self.schema.get(packetType, self.common)
+
+    def encode(self, packetType: int, content: Dict[str, Any]) -> bytes:
+        ret = bytearray()
+        fields = self.fields(packetType)
+        for name, fieldType in fields:
+            value = content[name]
+            if not isinstance(value, fieldType):
+                raise PacketFieldMismatchException(
+                    packetType, name, type(value), fieldType)
+            _fieldWriters[fieldType](ret, value)
+        if len(content) > len(fields):
+            names = {_[0] for _ in fields}
+            extra = {i: content[i] for i in content if i not in names}
+            _writeStr(ret, json.dumps(extra, separators=(',', ':')))
+        else:
+            _writeVarint(ret, 0)
+        return bytes(ret)
+
+    def decode(self, packetType: int, data: bytes) -> Dict[str, Any]:
+        ret: Dict[str, Any] = {}
+        pos = 0
+        for name, fieldType in self.fields(packetType):
+            ret[name], pos = _fieldReaders[fieldType](data, pos)
+        extra, pos = _readStr(data, pos)
+        if pos != len(data):
+            raise ValueError("%d bytes left after the packet." % (len(data) - pos, ))
+        if extra:
+            # The fields in the schema are not overridden by the extra fields
+            extra = json.loads(extra)
+            extra.update(ret)
+            return extra
+        return ret
+
+
+# Flags in the frame header
+FLAG_STREAM: int = 1    # The payload is compressed by the deflate stream of the connection
+FLAG_DEFLATE: int = 2   # The payload is a standalone deflate block, which can be sent to many connections
+
+
+class CompressionPolicy(object):
+    """
+    Decides how the payloads sent through a connection are compressed.
+
+    Attributes:
+
+        threshold: int, payloads shorter than the threshold are sent without compression
+        level: int, the compression level of zlib
+    """
+
+    def __init__(self, threshold: int = 128, level: int = 6):
+        self.threshold: int = threshold
+        self.level: int = level
+
+
+class CompressionStats(object):
+    """
+    Counters of a `Compressor`.
+
+    Attributes:
+
+        packets: int, the number of payloads
+        compressed: int, the number of payloads compressed
+        rawBytes: int, the length of the payloads before compression
+        wireBytes: int, the length of the payloads sent
+        seconds: float, the time spent in compression
+    """
+
+    def __init__(self):
+        self.packets: int = 0
+        self.compressed: int = 0
+        self.rawBytes: int = 0
+        self.wireBytes: int = 0
+        self.seconds: float = 0
+
+    @property
+    def saved(self) -> int:
+        return self.rawBytes - self.wireBytes
+
+    def __str__(self):
+        return "%d/%d packets compressed, %d bytes saved of %d, %.3fms spent" % (
+            self.compressed, self.packets, self.saved, self.rawBytes, self.seconds * 1000)
+
+
+class Compressor(object):
+    """
+    The sending side of the deflate stream of a connection.
+
+    The stream is flushed after each payload, so a payload can be decompressed as soon as it is received, while the history of the stream is shared by all the payloads: the addresses and the prompts repeated in every packet are compressed to a few bytes.
+
+    Notice:
+
+        **The payloads must be sent in the order they are compressed.**
+    """
+
+    def __init__(self, policy: CompressionPolicy):
+        self.policy: CompressionPolicy = policy
+        self.stream = zlib.compressobj(policy.level, zlib.DEFLATED, -15)
+        self.stats: CompressionStats = CompressionStats()
+
+    def compress(self, data: bytes) -> Tuple[int, bytes]:
+        """
+        Compress a payload if it is not shorter than the threshold.
+
+        Returns:
+
+            `(flags, payload)`, the flags are written to the frame header
+        """
+        self.stats.packets += 1
+        self.stats.rawBytes += len(data)
+        if len(data) < self.policy.threshold:
+            self.stats.wireBytes += len(data)
+            return 0, data
+        start = perf_counter()
+        ret = self.stream.compress(data) + self.stream.flush(zlib.Z_SYNC_FLUSH)
+        self.stats.seconds += perf_counter() - start
+        self.stats.compressed += 1
+        self.stats.wireBytes += len(ret)
+        return FLAG_STREAM, ret
+
+
+def compressShared(policy: CompressionPolicy, data: bytes) -> Tuple[int, bytes]:
+    """
+    Compress a payload sent to many connections, the payload does not use the history of any deflate stream, so it is compressed only once.
+
+    Returns:
+
+        `(flags, payload)`, the flags are written to the frame header
+    """
+    if len(data) < policy.threshold:
+        return 0, data
+    stream = zlib.compressobj(policy.level, zlib.DEFLATED, -15)
+    return FLAG_DEFLATE, stream.compress(data) + stream.flush()
+
+
+class Decompressor(object):
+    """
+    The receiving side of the deflate stream of a connection, the frames must be decompressed in the order they are received.
+    """
+
+    def __init__(self):
+        self.stream = zlib.decompressobj(-15)
+
+    def decompress(self, flags: int, data: bytes, limit: int = 0) -> bytes:
+        """
+        Decompress a payload, raises `OverflowError` if the payload inflates beyond `limit` bytes (0 for no limit).
+        """
+        if flags & FLAG_STREAM:
+            stream = self.stream
+        elif flags & FLAG_DEFLATE:
+            stream = zlib.decompressobj(-15)
+        else:
+            return data
+        ret = stream.decompress(data, limit)
+        if stream.unconsumed_tail:
+            raise OverflowError("The payload inflates beyond %d bytes." % (limit, ))
+        return ret
+
+
+defaultPolicy: CompressionPolicy = CompressionPolicy()
+
+
+_codecs: Dict[int, Codec] = {}
+_codecNames: Dict[str, Codec] = {}
+
+
+def registerCodec(codec: Codec):
+    """
+    Add a codec to the registry, the id and the name of the codec must be unique.
+    """
+    assert 0 <= codec.id < 256, "The id of the codec must fit in a byte"
+    assert codec.id not in _codecs, "The id of the codec is already used"
+    assert codec.name not in _codecNames, "The name of the codec is already used"
+    _codecs[codec.id] = codec
+    _codecNames[codec.name] = codec
+
+
+def getCodec(key: Union[int, str]) -> Codec:
+    """
+    Get a codec by its id or name, raises `KeyError` if the codec is not registered.
+    """
+    return _codecs[key] if isinstance(key, int) else _codecNames[key]
+
+
+def listCodecs() -> List[str]:
+    """
+    Get the names of the codecs registered, the preferred codecs first.
+    """
+    return [_.name for _ in sorted(_codecs.values(), key=lambda _: -_.priority)]
+
+
+def negotiateCodec(offered: Iterable[str]) -> Codec:
+    """
+    Choose the codec of a connection from the codecs offered by the client in the `Establish` packet.
+
+    The first codec offered that is registered is chosen, `GzipCodec` is chosen if none is supported.
+    """
+    for name in offered:
+        if name in _codecNames:
+            return _codecNames[name]
+    return defaultCodec
+
+
+defaultCodec: Codec = GzipCodec()
+registerCodec(defaultCodec)
+registerCodec(BinaryCodec())
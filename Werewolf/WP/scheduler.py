@@ -0,0 +1,151 @@
+import heapq
+import threading
+from concurrent.futures import Future
+from time import monotonic
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class Timer(object):
+    """
+    A callback registered in a `Scheduler`.
+
+    Methods:
+
+        Timer.cancel(): the callback will not be called
+        Timer.remaining(): the time left before the deadline
+    """
+
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled', 'scheduler')
+
+    def __init__(self, scheduler: 'Scheduler', deadline: float, callback: Callable, args: Tuple):
+        self.scheduler: Scheduler = scheduler
+        self.deadline: float = deadline
+        self.callback: Callable = callback
+        self.args: Tuple = args
+        self.cancelled: bool = False
+
+    def __lt__(self, other: 'Timer') -> bool:
+        return self.deadline < other.deadline
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self.scheduler._cancelled()
+
+    def remaining(self) -> float:
+        return max(self.deadline - monotonic(), 0)
+
+
+class Scheduler(object):
+    """
+    Fire the callbacks at their deadlines from a single thread.
+
+    The timers are kept in a heap, so registering and firing a timer costs O(log n) and thousands of deadlines cost no extra threads. A cancelled timer is left in the heap and skipped, the heap is rebuilt when most of the timers are cancelled.
+
+    Methods:
+
+        Scheduler.callLater(): call a function after a delay
+        Scheduler.callAt(): call a function at a deadline of `time.monotonic()`
+        Scheduler.timeout(): get a future resolved after a delay
+        Scheduler.close(): stop the thread, the pending timers are dropped
+
+    Notice:
+
+        **The callbacks are called in the thread of the scheduler, they should return quickly: set an event, resolve a future, or hand the work to another thread.**
+    """
+
+    def __init__(self, name: str = "Werewolf scheduler"):
+        self.heap: List[Timer] = []
+        self.cancelledCount: int = 0
+        self.condition: threading.Condition = threading.Condition()
+        self.closed: bool = False
+        self.thread: threading.Thread = threading.Thread(
+            target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def __len__(self) -> int:
+        with self.condition:
+            return len(self.heap) - self.cancelledCount
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed and (not self.heap or self.heap[0].deadline > monotonic()):
+                    self.condition.wait(
+                        self.heap[0].deadline - monotonic() if self.heap else None)
+                if self.closed:
+                    return
+                timer = heapq.heappop(self.heap)
+                if timer.cancelled:
+                    self.cancelledCount -= 1
+                    continue
+                # A timer fired can no longer be cancelled
+                timer.cancelled = True
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                print("Timer callback failed: %r" % (e, ))
+
+    def _cancelled(self):
+        with self.condition:
+            self.cancelledCount += 1
+            if self.cancelledCount > 64 and self.cancelledCount * 2 > len(self.heap):
+                self.heap = [_ for _ in self.heap if not _.cancelled]
+                heapq.heapify(self.heap)
+                self.cancelledCount = 0
+
+    def callAt(self, deadline: float, callback: Callable, *args: Any) -> Timer:
+        """
+        Call the function at the deadline, the deadline is a value of `time.monotonic()`.
+        """
+        timer = Timer(self, deadline, callback, args)
+        with self.condition:
+            assert not self.closed, "The scheduler is closed"
+            heapq.heappush(self.heap, timer)
+            if self.heap[0] is timer:
+                # The thread is waiting for a later deadline
+                self.condition.notify()
+        return timer
+
+    def callLater(self, delay: float, callback: Callable, *args: Any) -> Timer:
+        """
+        Call the function after the delay in seconds.
+        """
+        return self.callAt(monotonic() + delay, callback, *args)
+
+    def timeout(self, delay: float, result: Any = None) -> Future:
+        """
+        Get a future resolved with `result` after the delay, the timer is cancelled if the future is cancelled.
+        """
+        future: Future = Future()
+
+        def fire():
+            if future.set_running_or_notify_cancel():
+                future.set_result(result)
+
+        timer = self.callLater(delay, fire)
+        future.add_done_callback(lambda _: timer.cancel())
+        return future
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.heap.clear()
+            self.cancelledCount = 0
+            self.condition.notify()
+        self.thread.join()
+
+
+_defaultScheduler: Optional[Scheduler] = None
+_defaultSchedulerLock: threading.Lock = threading.Lock()
+
+
+def getScheduler() -> Scheduler:
+    """
+    Get the scheduler shared in the process, the scheduler is created on the first call.
+    """
+    global _defaultScheduler
+    with _defaultSchedulerLock:
+        if _defaultScheduler is None:
+            _defaultScheduler = Scheduler()
+        return _defaultScheduler
@@ -0,0 +1,87 @@
+from typing import Any, Dict, Tuple
+
+from .utils import _checkParam
+
+
+class PacketTypeMismatchException(Exception):
+
+    def __init__(self, packetType: int, fieldName: str):
+        super().__init__()
+        self.type: int = packetType
+        self.field: str = fieldName
+
+    def __str__(self):
+        return "Packet type %d requires field '%s', which is not found." % (self.type, self.field)
+
+
+class PacketFieldMismatchException(Exception):
+
+    def __init__(self, packetType: int, fieldName: str, fieldType: type, expectedType: type):
+        super().__init__()
+        self.type: int = packetType
+        self.name: str = fieldName
+        self.field: type = fieldType
+        self.expected: type = expectedType
+
+    def __str__(self):
+        return "Field %s of packet type %d requires type %s, got %s." % (self.name, self.type, str(self.expected), str(self.field))
+
+
+class PacketValidator(object):
+    """
+    The fields required by a packet type, compiled from `_checkParam`.
+
+    Attributes:
+
+        type: int, the packet type
+        fields: tuple, the names and the types of the fields, the common fields first
+
+    Methods:
+
+        PacketValidator.validate(content): check the content of a packet
+    """
+
+    __slots__ = ('type', 'fields')
+
+    def __init__(self, packetType: int, fields: Tuple[Tuple[str, type], ...]):
+        self.type: int = packetType
+        self.fields: Tuple[Tuple[str, type], ...] = fields
+
+    def validate(self, content: Dict[str, Any]):
+        """
+        Raises `PacketTypeMismatchException` if a field is missing, and `PacketFieldMismatchException` if the type of a field is wrong.
+        """
+        for name, fieldType in self.fields:
+            try:
+                value = content[name]
+            except KeyError:
+                raise PacketTypeMismatchException(self.type, name)
+            # The exact type is the common case, `isinstance` is only called for the subclasses
+            if type(value) is not fieldType and not isinstance(value, fieldType):
+                raise PacketFieldMismatchException(
+                    self.type, name, type(value), fieldType)
+
+
+def compileSchema(schema: Dict[Any, Dict[str, type]]) -> Dict[int, PacketValidator]:
+    """
+    Compile a table in the format of `_checkParam` to the validators of the packet types.
+    """
+    common = tuple(schema[''].items())
+    return {
+        packetType: PacketValidator(packetType, common + tuple(fields.items()))
+        for packetType, fields in schema.items()
+        if packetType != ''
+    }
+
+
+_validators: Dict[int, PacketValidator] = compileSchema(_checkParam)
+
+
+def getValidator(packetType: int) -> PacketValidator:
+    """
+    Get the validator of the packet type, raises `PacketTypeMismatchException` if the packet type is unknown.
+    """
+    try:
+        return _validators[packetType]
+    except KeyError:
+        raise PacketTypeMismatchException(packetType, str(packetType))
@@ -0,0 +1,183 @@
+import codecs
+import os
+import selectors
+import socket
+import sys
+import threading
+from collections import deque
+from time import monotonic
+from typing import Any, Deque, Optional
+
+from .cancel import CancelToken
+
+
+class TerminalInput(object):
+    """
+    The lines typed on the standard input, read when the input is readable, so the reads never block and no thread is left waiting on the terminal.
+
+    The bytes are read from the file descriptor and split into lines by the object, so the lines typed ahead are kept in order and a partial line is completed by the next read. If the input cannot be watched by a selector, e.g. on Windows or when it is redirected from a regular file, a single thread of the process forwards the lines through a socket pair.
+
+    Initialization:
+
+        stream: the input, `sys.stdin` by default
+
+    Attributes:
+
+        closed: bool, whether the end of the input is reached
+
+    Methods:
+
+        TerminalInput.fileno(): the file descriptor to register in the selector of the caller
+        TerminalInput.onReadable(): read the data available, returns the number of lines completed
+        TerminalInput.popLine(): take the first line typed
+        TerminalInput.discard(): drop the lines typed before a prompt
+        TerminalInput.readLine(): block until a line is typed, the deadline or the cancellation of the token
+    """
+
+    def __init__(self, stream: Any = None):
+        self.stream: Any = sys.stdin if stream is None else stream
+        self.lines: Deque[str] = deque()
+        self.partial: str = ''
+        self.closed: bool = False
+        self.lock: threading.Lock = threading.Lock()
+        # Wakes up `readLine()` when its token is cancelled
+        self.waker, self.wakeup = socket.socketpair()
+        self.waker.setblocking(False)
+        self.forwarder: Optional[socket.socket] = None
+        self.fd: int = self._selectable(self.stream)
+        encoding = getattr(self.stream, 'encoding', None) or 'utf-8'
+        if self.fd < 0:
+            self.forwarder, writer = socket.socketpair()
+            self.fd = self.forwarder.fileno()
+            encoding = 'utf-8'
+            threading.Thread(target=self._forward, args=(writer, ),
+                             name="Werewolf terminal", daemon=True).start()
+        self.decoder: codecs.IncrementalDecoder = codecs.getincrementaldecoder(
+            encoding)(errors='replace')
+
+    @staticmethod
+    def _selectable(stream: Any) -> int:
+        if os.name == 'nt':
+            return -1
+        try:
+            fd = stream.fileno()
+            with selectors.DefaultSelector() as selector:
+                selector.register(fd, selectors.EVENT_READ)
+        except (AttributeError, OSError, ValueError):
+            return -1
+        return fd
+
+    def _forward(self, writer: socket.socket):
+        with writer:
+            for line in iter(self.stream.readline, ''):
+                writer.sendall(line.encode('utf-8'))
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def onReadable(self) -> int:
+        """
+        Read the data available, the input is readable so the read does not block.
+
+        Returns:
+
+            int, the number of lines completed
+        """
+        if self.closed:
+            return 0
+        if self.forwarder is not None:
+            data = self.forwarder.recv(4096)
+        else:
+            data = os.read(self.fd, 4096)
+        text = self.partial + self.decoder.decode(data, final=not data)
+        lines = text.split('\n')
+        if data:
+            self.partial = lines.pop()
+        else:
+            # The end of the input completes the last line
+            self.closed = True
+            self.partial = ''
+            if not lines[-1]:
+                lines.pop()
+        self.lines.extend(_.rstrip('\r') for _ in lines)
+        return len(lines)
+
+    def popLine(self) -> Optional[str]:
+        return self.lines.popleft() if self.lines else None
+
+    def discard(self):
+        self.lines.clear()
+
+    def readLine(self, timeout: Optional[float] = None, token: Optional[CancelToken] = None) -> Optional[str]:
+        """
+        Block until a line is typed.
+
+        Parameters:
+
+            timeout: float, the time to wait, no limit if `None`
+            token: `CancelToken`, stops waiting when the token is cancelled
+
+        Returns:
+
+            str, the line without the line break, `None` at the deadline or if the token is cancelled
+
+        Raises `EOFError` at the end of the input.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self.lock:
+            handle = token.onCancel(self._wake) if token is not None else 0
+            try:
+                with selectors.DefaultSelector() as selector:
+                    selector.register(self.fd, selectors.EVENT_READ)
+                    selector.register(self.waker, selectors.EVENT_READ)
+                    while not self.lines:
+                        if self.closed:
+                            raise EOFError()
+                        if token is not None and token.isCancelled():
+                            return None
+                        remaining = None if deadline is None else deadline - monotonic()
+                        if remaining is not None and remaining <= 0:
+                            return None
+                        for key, events in selector.select(remaining):
+                            if key.fileobj is self.waker:
+                                self._drainWakeup()
+                            else:
+                                self.onReadable()
+                    return self.lines.popleft()
+            finally:
+                if handle:
+                    token.removeCallback(handle)
+
+    def _wake(self):
+        try:
+            self.wakeup.send(b'\0')
+        except OSError:
+            pass
+
+    def _drainWakeup(self):
+        try:
+            while self.waker.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def close(self):
+        self.waker.close()
+        self.wakeup.close()
+        if self.forwarder is not None:
+            self.forwarder.close()
+
+
+_defaultTerminal: Optional[TerminalInput] = None
+_defaultTerminalLock: threading.Lock = threading.Lock()
+
+
+def getTerminal() -> TerminalInput:
+    """
+    Get the input of the process, the standard input is read by a single `TerminalInput`.
+    """
+    global _defaultTerminal
+    with _defaultTerminalLock:
+        if _defaultTerminal is None:
+            _defaultTerminal = TerminalInput()
+        return _defaultTerminal
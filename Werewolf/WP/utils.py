@@ -34,37 +34,50 @@ _checkParam = {
     0: {
         'rawData': bytearray            # 发送的原始数据，这一项本身不会被用到
     },
-    1: {},
+    1: {},                              # 可选字段 'room': int，连接大厅时要加入的房间号；'codecs': list，客户端支持的编码
     -1: {
         'seat': int,                    # 分配的座位号
         'identity': int                # 分配的身份
+        # 可选字段 'codec': str，服务器选择的编码，之后双方都使用该编码发送
     },
     3: {
+        'requestId': int,               # 请求编号，回复时原样返回
         # 'identityLimit': tuple,         # 能收到消息的玩家身份列表
         # 'playerNumber': int,          # 目的玩家编号（deprecated）
         'iskill': bool,                # 是否是晚上
         'format': str,                  # 玩家应当输入的格式，示例 "int"
         'prompt': str,                  # 输入提示
         'timeLimit': float                # 时间限制
+        # 可选字段 'choices': list，可以选择的玩家，客户端在发送前检查
     },
     -3: {
+        'requestId': int,               # 所回复请求的编号
         'action': bool,                 # 玩家是否执行操作（若回送，指玩家作用是否成功）
         'target': int                   # 玩家执行操作的目标
     },
-    4: {
+    4: {                            # 广播给所有玩家时只编码一次，地址为空字符串和0
         'content': str,             # 要公布的消息
     },
     5: {
         'content': str                 # 自由交谈的内容
         # 'type': tuple                   # 能收到消息的身份列表，空列表指全部玩家
     },
-    6: {'timeLimit': float},              # 时间限制
-    -6: {'content': str},               # 发送的消息
+    6: {
+        'requestId': int,
+        'timeLimit': float              # 时间限制
+    },
+    -6: {
+        'requestId': int,
+        'content': str                  # 发送的消息
+    },
     7: {
+        'requestId': int,
         'prompt': str,
         'timeLimit': float
+        # 可选字段 'choices': list，可以投票的玩家，客户端在发送前检查
     },                   # 当服务器第一次发送时，指是否可以投票，当第二次发送时，指投票是否有效
     -7: {
+        'requestId': int,
         'vote': bool,                   # 是否投票
         'candidate': int                # 投票候选人
     },
@@ -73,6 +86,6 @@ _checkParam = {
         'result': bool  # The result of the game
     },
     9: {
-        'id': int
+        'id': int                       # 自爆的玩家，通过游戏连接发送
     }
 }
@@ -0,0 +1,7 @@
+"""
+Headless bots playing the werewolf game through the real protocol
+"""
+
+from .strategy import EXPLODE, SILENT, View, Strategy, RandomStrategy, RuleBasedStrategy, ReplayStrategy
+from .client import BotClient, runBots
+from .harness import GameReport, playGame, playGames
@@ -0,0 +1,190 @@
+import selectors
+import socket
+from time import monotonic
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..WP import ChunckedData, FrameBuffer, listCodecs, setConnectionCodec
+from .strategy import EXPLODE, SILENT, Strategy, View
+
+
+class BotClient(object):
+    """
+    A headless client speaking the real protocol, the requests of the server are answered by a `Strategy`.
+
+    The client does not start a thread: `BotClient.onReadable()` is called when the socket is readable, so a single selector loop (`runBots()`) drives any number of bots.
+
+    Initialization:
+
+        strategy: `Strategy`, the decisions of the bot
+        host, port: the address of the server or the lobby
+        room: int, the room to join in a lobby, `None` for a game with its own port
+        codecs: the codecs offered in the handshake, all the codecs registered by default
+
+    Attributes:
+
+        view: `View`, what the bot knows, `None` before the seat is assigned
+        received: list, the packets received
+        decisions: list, the `(kind, value)` pairs decided by the strategy, replayed by `ReplayStrategy`
+        closed: bool, whether the server closed the connection
+    """
+
+    def __init__(self, strategy: Strategy, host: str, port: int, room: Optional[int] = None, codecs: Optional[List[str]] = None):
+        self.strategy: Strategy = strategy
+        self.room: Optional[int] = room
+        self.view: Optional[View] = None
+        self.received: List[ChunckedData] = []
+        self.decisions: List[Tuple[str, Any]] = []
+        self.closed: bool = False
+        self.lastSkill: Optional[int] = None
+        self.buffer: FrameBuffer = FrameBuffer()
+        self.socket: socket.socket = socket.create_connection((host, port))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        packet = self._getBasePacket()
+        if room is not None:
+            packet['room'] = room
+        packet['codecs'] = list(codecs) if codecs is not None else listCodecs()
+        ChunckedData(1, **packet).send(self.socket)
+
+    def fileno(self) -> int:
+        return self.socket.fileno()
+
+    def close(self):
+        self.closed = True
+        self.socket.close()
+
+    def _getBasePacket(self) -> Dict[str, Any]:
+        client = self.socket.getsockname()
+        server = self.socket.getpeername()
+        return {
+            'srcAddr': client[0],
+            'srcPort': client[1],
+            'destAddr': server[0],
+            'destPort': server[1]
+        }
+
+    def _reply(self, packetType: int, **kwargs: Any):
+        kwargs.update(self._getBasePacket())
+        ChunckedData(packetType, **kwargs).send(self.socket)
+
+    def _decide(self, kind: str, prompt: str = "") -> Any:
+        value = self.strategy.decide(kind, self.view, prompt)
+        self.decisions.append((kind, value))
+        return value
+
+    def onReadable(self) -> bool:
+        """
+        Read the data available and answer the packets completed.
+
+        Returns:
+
+            bool, `False` if the connection is closed
+        """
+        try:
+            data = self.socket.recv(65536)
+        except ConnectionError:
+            data = b''
+        if not data:
+            self.close()
+            return False
+        self.buffer.feed(data)
+        frame = self.buffer.pop()
+        while frame is not None:
+            self.handle(ChunckedData.fromFrame(frame))
+            frame = self.buffer.pop()
+        return True
+
+    def handle(self, packet: ChunckedData):
+        """
+        Update the view and answer the packet if it is a request.
+        """
+        self.received.append(packet)
+        view = self.view
+        if packet.type == -1:
+            self.view = View(packet['seat'], packet['identity'])
+            setConnectionCodec(
+                self.socket, packet.content.get('codec', 'gzip'))
+        elif packet.type in (4, 5):
+            view.update(packet['content'])
+        elif packet.type == -3:
+            # The result of the check of a predictor
+            if self.lastSkill is not None:
+                view.checked[self.lastSkill] = packet['action']
+        elif packet.type == 8:
+            view.isAlive = False
+        elif packet.type == -8:
+            view.result = packet['result']
+        elif packet.type == 9:
+            view.alive.discard(packet['id'])
+        elif packet.type == 3:
+            self._onAction(packet)
+        elif packet.type == 6:
+            speech = self._decide('speak')
+            if speech is SILENT:
+                return
+            if speech is EXPLODE and view.identity < 0:
+                self._reply(9, id=view.seat)
+            else:
+                self._reply(-6, requestId=packet['requestId'],
+                            content=speech if isinstance(speech, str) else "")
+        elif packet.type == 7:
+            kind = 'inherit' if packet['prompt'].startswith("请选择要继承警徽") else 'vote'
+            target = self._decide(kind)
+            if target is SILENT:
+                return
+            self._reply(-7, requestId=packet['requestId'], vote=target is not None,
+                        candidate=target if target is not None else 0)
+
+    def _onAction(self, packet: ChunckedData):
+        view = self.view
+        if packet['iskill'] and view.identity < 0 and packet['prompt'].startswith("狼人请刀人"):
+            kind = 'kill'
+        elif packet['format'] == 'bool':
+            kind = 'election' if packet['prompt'].startswith("请所有玩家上警") else 'sequence'
+        else:
+            kind = 'skill'
+        value = self._decide(kind, packet['prompt'])
+        if value is SILENT:
+            return
+        if kind in ('election', 'sequence'):
+            self._reply(-3, requestId=packet['requestId'],
+                        action=bool(value), target=int(bool(value)))
+            return
+        if kind == 'skill':
+            self.lastSkill = value if view.identity == 1 else None
+        if value is None:
+            self._reply(-3, requestId=packet['requestId'], action=False, target=-1)
+        else:
+            # The witch saves the victim with the target 0
+            self._reply(-3, requestId=packet['requestId'], action=True, target=value)
+
+
+def runBots(bots: Iterable[BotClient], idleTimeout: float = 30.0, deadline: Optional[float] = None):
+    """
+    Drive the bots in the current thread until the server closes all the connections.
+
+    Parameters:
+
+        bots: the bots to drive
+        idleTimeout: float, raises `TimeoutError` if no packet is received for this time
+        deadline: float, a value of `time.monotonic()`, raises `TimeoutError` if the games are not finished in time
+    """
+    selector = selectors.DefaultSelector()
+    remaining = 0
+    for bot in bots:
+        if not bot.closed:
+            selector.register(bot, selectors.EVENT_READ)
+            remaining += 1
+    try:
+        while remaining:
+            timeout = idleTimeout
+            if deadline is not None:
+                timeout = min(timeout, max(deadline - monotonic(), 0))
+            events = selector.select(timeout)
+            if not events:
+                raise TimeoutError("The bots received nothing for %.1f seconds" % (timeout, ))
+            for key, event in events:
+                if not key.fileobj.onReadable():
+                    selector.unregister(key.fileobj)
+                    remaining -= 1
+    finally:
+        selector.close()
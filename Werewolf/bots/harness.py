@@ -0,0 +1,164 @@
+import argparse
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .. import misc
+from ..server.abstraction import default_timeout
+from ..server.engine import Engine
+from ..server.journal import Journal
+from ..server.lobby import Lobby
+from ..server.logic import Game
+from .client import BotClient, runBots
+from .strategy import RandomStrategy, RuleBasedStrategy, Strategy
+
+strategies: Dict[str, Callable[[Any], Strategy]] = {
+    'random': RandomStrategy,
+    'rule': RuleBasedStrategy,
+}
+
+
+class GameReport(object):
+    """
+    The result of a game played by bots.
+
+    Attributes:
+
+        status: int, 1 if the villagers win, -1 if the wolves win, 0 if the game is broken
+        days: int, the number of days played
+        identities: dict, the seat and the identity code of each bot
+        packets: int, the number of packets received by the bots
+        seconds: float, the wall time of the game
+        bots: list, the bots, with the packets received and the decisions made
+    """
+
+    def __init__(self, game: Game, bots: List[BotClient], seconds: float):
+        self.status: int = game.status
+        self.days: int = game.day
+        self.identities: Dict[int, int] = {
+            bot.view.seat: bot.view.identity for bot in bots if bot.view is not None}
+        self.packets: int = sum(len(bot.received) for bot in bots)
+        self.seconds: float = seconds
+        self.bots: List[BotClient] = bots
+
+    def __str__(self):
+        return "%s win after %d days, %d packets in %.3fs" % (
+            {1: "Villagers", -1: "Wolves"}.get(self.status, "Nobody"),
+            self.days, self.packets, self.seconds)
+
+
+def getPreset(name: str) -> Dict[str, int]:
+    """
+    Get a preset in `Werewolf.misc` by its name, e.g. `Villager2Wolf2WitchPredictor`.
+    """
+    preset = getattr(misc, name, None)
+    assert isinstance(preset, dict), "Unknown preset %s" % (name, )
+    return preset
+
+
+def playGames(
+    count: int,
+    identityList: Dict[str, int],
+    strategy: Callable[[Any], Strategy] = RandomStrategy,
+    timeout: float = 2.0,
+    engine: Optional[Engine] = None,
+    seed: Optional[int] = None,
+    journal: Optional[Journal] = None
+) -> List[GameReport]:
+    """
+    Play complete games on loopback with no human input, the games are played concurrently in the rooms of a lobby.
+
+    Parameters:
+
+        count: int, the number of games
+        identityList: dict, the identity configuration, see `Game.setIdentityList()`
+        strategy: the factory of the strategies, called with the seed of each bot
+        timeout: float, the time limit of every request of the server, set through `default_timeout()` while the games are played, the previous value is restored after
+        engine: `Engine`, a new engine is created and closed by default
+        seed: int, the seeds of the bots are derived from it, random by default
+        journal: `Journal`, the events of the games are recorded in it, the journal is left open
+
+    Returns:
+
+        the reports of the games, in the order of the rooms
+    """
+    ownEngine = engine is None
+    engine = engine if engine is not None else Engine()
+    playerCount = sum(identityList.values())
+    lobby = Lobby('127.0.0.1', port=0, engine=engine, journal=journal)
+    bots: List[List[BotClient]] = []
+    previousTimeout = default_timeout()
+    default_timeout(timeout)
+    try:
+        games = [lobby.createRoom(i, playerCount, identityList)
+                 for i in range(count)]
+        threads = [lobby.launchRoom(i) for i in range(count)]
+        start = time.perf_counter()
+        bots = [
+            [
+                BotClient(
+                    strategy(None if seed is None else seed * 65536 + i * 256 + j),
+                    '127.0.0.1', lobby.port, room=i)
+                for j in range(playerCount)
+            ]
+            for i in range(count)
+        ]
+        # The requests time out at worst, so a game is stuck if nothing is received for a few timeouts
+        runBots([bot for room in bots for bot in room],
+                idleTimeout=max(30.0, timeout * 4))
+        for thread in threads:
+            thread.join(timeout)
+        seconds = time.perf_counter() - start
+        return [GameReport(game, room, seconds) for game, room in zip(games, bots)]
+    finally:
+        lobby.close()
+        for room in bots:
+            for bot in room:
+                bot.close()
+        if ownEngine:
+            engine.close()
+        default_timeout(previousTimeout)
+
+
+def playGame(identityList: Dict[str, int], strategy: Callable[[Any], Strategy] = RandomStrategy, **kwargs: Any) -> GameReport:
+    """
+    Play a single game, see `playGames()`.
+    """
+    return playGames(1, identityList, strategy, **kwargs)[0]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Play werewolf games with bots on loopback")
+    parser.add_argument('--preset', default='Villager2Wolf2WitchPredictor',
+                        help="the name of a preset in Werewolf.misc")
+    parser.add_argument('--games', type=int, default=10,
+                        help="the number of games played concurrently")
+    parser.add_argument('--strategy', choices=sorted(strategies), default='random')
+    parser.add_argument('--timeout', type=float, default=2.0,
+                        help="the time limit of every request")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--journal', default=None,
+                        help="the file the events of the games are appended to")
+    args = parser.parse_args(argv)
+    journal = Journal(args.journal) if args.journal else None
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        reports = playGames(args.games, getPreset(args.preset),
+                            strategies[args.strategy], args.timeout, seed=args.seed, journal=journal)
+    finally:
+        if journal is not None:
+            journal.close()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    for i, report in enumerate(reports):
+        print("Room %d: %s" % (i, report))
+    packets = sum(report.packets for report in reports)
+    print("%d games, villagers win %d, wolves win %d, broken %d" % (
+        len(reports),
+        sum(report.status == 1 for report in reports),
+        sum(report.status == -1 for report in reports),
+        sum(report.status == 0 for report in reports)))
+    print("%d packets in %.3fs wall, %.3fs CPU" % (packets, wall, cpu))
+
+
+if __name__ == '__main__':
+    main()
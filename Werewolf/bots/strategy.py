@@ -0,0 +1,219 @@
+import random
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+EXPLODE = object()  # Returned by `Strategy.speak()` to explode instead of speaking
+SILENT = object()   # Returned by any method of `Strategy` to leave the request unanswered, the server waits until the time is up
+
+_seatPattern = re.compile(r'(\d+)号玩家')
+
+
+class View(object):
+    """
+    What a bot knows about the game, updated by `BotClient` from the packets received.
+
+    Attributes:
+
+        seat: int, the seat of the bot
+        identity: int, the identity code of the bot, negative for the wolves
+        alive: set, the seats announced alive at the last sunrise or nightfall
+        wolves: set, the wolves known by a wolf
+        checked: dict, the seats checked by a predictor and whether they are good
+        killed: int, the seat killed by the wolves told to a witch, 0 if unknown
+        isAlive: bool, whether the bot is alive
+        result: bool or None, whether the villagers win, `None` until the game ends
+    """
+
+    def __init__(self, seat: int, identity: int):
+        self.seat: int = seat
+        self.identity: int = identity
+        self.alive: Set[int] = set()
+        self.wolves: Set[int] = set()
+        self.checked: Dict[int, bool] = {}
+        self.killed: int = 0
+        self.isAlive: bool = True
+        self.result: Optional[bool] = None
+
+    def others(self) -> List[int]:
+        """
+        The other players alive, sorted by seat.
+        """
+        return sorted(self.alive - {self.seat})
+
+    def update(self, content: str):
+        """
+        Update the view from an announcement of the server.
+        """
+        if "目前在场的玩家：" in content:
+            self.alive = {int(_) for _ in _seatPattern.findall(
+                content.split("目前在场的玩家：", 1)[1])}
+        elif content.startswith("目前在场的狼人："):
+            self.wolves = {int(_) for _ in _seatPattern.findall(content)}
+        elif content.startswith("晚上") and content.endswith("玩家死了"):
+            seats = _seatPattern.findall(content)
+            self.killed = int(seats[0]) if seats else 0
+
+
+class Strategy(object):
+    """
+    The decisions of a bot, called by `BotClient` for each request of the server.
+
+    A method returning `None` skips the action. The subclasses override the methods they care about, the base class passes every request.
+
+    Methods:
+
+        Strategy.kill(): the seat a wolf votes to kill at night
+        Strategy.skill(): the target of the skill of a predictor, a witch (0 to save the victim), a guard, a hunter or a white werewolf
+        Strategy.election(): whether to run for the police
+        Strategy.sequence(): whether the police lets the players speak clockwise
+        Strategy.speak(): the speech, or `EXPLODE` for a wolf to explode
+        Strategy.vote(): the seat to exile, or to vote as the police
+        Strategy.inherit(): the seat the police passes the badge to
+    """
+
+    def kill(self, view: View) -> Optional[int]:
+        return None
+
+    def skill(self, view: View, prompt: str) -> Optional[int]:
+        return None
+
+    def election(self, view: View) -> bool:
+        return False
+
+    def sequence(self, view: View) -> bool:
+        return True
+
+    def speak(self, view: View) -> Any:
+        return "过"
+
+    def vote(self, view: View) -> Optional[int]:
+        return None
+
+    def inherit(self, view: View) -> Optional[int]:
+        return None
+
+    def decide(self, kind: str, view: View, prompt: str = "") -> Any:
+        """
+        Dispatch a request by its kind, the name of one of the methods above.
+        """
+        if kind == 'skill':
+            return self.skill(view, prompt)
+        return getattr(self, kind)(view)
+
+
+class RandomStrategy(Strategy):
+    """
+    Uniformly random choices among the other players alive.
+
+    Initialization:
+
+        seed: the seed of the random generator, for a reproducible bot
+        skillRate: float, the probability to use a skill, run for the police or vote
+        explodeRate: float, the probability for a wolf to explode instead of speaking
+    """
+
+    def __init__(self, seed: Any = None, skillRate: float = 0.8, explodeRate: float = 0.0):
+        self.random: random.Random = random.Random(seed)
+        self.skillRate: float = skillRate
+        self.explodeRate: float = explodeRate
+
+    def _choose(self, candidates: Iterable[int]) -> Optional[int]:
+        candidates = list(candidates)
+        if not candidates or self.random.random() >= self.skillRate:
+            return None
+        return self.random.choice(candidates)
+
+    def kill(self, view: View) -> Optional[int]:
+        return self._choose(view.others())
+
+    def skill(self, view: View, prompt: str) -> Optional[int]:
+        if view.identity == 2 and view.killed and self.random.random() < 0.5:
+            return 0
+        return self._choose(view.others())
+
+    def election(self, view: View) -> bool:
+        return self.random.random() < self.skillRate / 2
+
+    def sequence(self, view: View) -> bool:
+        return self.random.random() < 0.5
+
+    def speak(self, view: View) -> Any:
+        if view.identity < 0 and self.random.random() < self.explodeRate:
+            return EXPLODE
+        return "过"
+
+    def vote(self, view: View) -> Optional[int]:
+        return self._choose(view.others())
+
+    def inherit(self, view: View) -> Optional[int]:
+        return self._choose(view.others())
+
+
+class RuleBasedStrategy(RandomStrategy):
+    """
+    Random choices guided by the rules a careful player follows.
+
+    - The wolves never kill or vote for the other wolves.
+    - The predictor checks the players not checked yet, and votes for the wolves found.
+    - The witch saves the victim and never uses the poison.
+    - The guard protects a different player every night.
+    """
+
+    def __init__(self, seed: Any = None):
+        super().__init__(seed, skillRate=1.0)
+        self.guarded: int = 0
+
+    def _targets(self, view: View) -> List[int]:
+        if view.identity < 0:
+            return [_ for _ in view.others() if _ not in view.wolves]
+        known = [_ for _ in view.others() if view.checked.get(_) is False]
+        return known or view.others()
+
+    def kill(self, view: View) -> Optional[int]:
+        return self._choose(self._targets(view))
+
+    def skill(self, view: View, prompt: str) -> Optional[int]:
+        if view.identity == 1:
+            return self._choose([_ for _ in view.others() if _ not in view.checked]) or \
+                self._choose(view.others())
+        if view.identity == 2:
+            return 0 if view.killed else None
+        if view.identity == 4:
+            target = self._choose([_ for _ in view.alive if _ != self.guarded])
+            self.guarded = target or 0
+            return target
+        return self._choose(self._targets(view))
+
+    def election(self, view: View) -> bool:
+        return view.identity == 1
+
+    def vote(self, view: View) -> Optional[int]:
+        return self._choose(self._targets(view))
+
+    def inherit(self, view: View) -> Optional[int]:
+        good = [_ for _ in view.others() if view.checked.get(_)]
+        return self._choose(good or self._targets(view))
+
+
+class ReplayStrategy(Strategy):
+    """
+    Replay the decisions recorded by a `BotClient`, e.g. to reproduce a game in a regression test.
+
+    The decisions of each kind are replayed in order, the requests after the script is exhausted are passed to the fallback strategy.
+
+    Initialization:
+
+        decisions: the `(kind, value)` pairs in `BotClient.decisions`
+        fallback: `Strategy`, passes every request by default
+    """
+
+    def __init__(self, decisions: Iterable[Tuple[str, Any]], fallback: Optional[Strategy] = None):
+        self.script: Dict[str, List[Any]] = {}
+        for kind, value in decisions:
+            self.script.setdefault(kind, []).append(value)
+        self.fallback: Strategy = fallback if fallback is not None else Strategy()
+
+    def decide(self, kind: str, view: View, prompt: str = "") -> Any:
+        if self.script.get(kind):
+            return self.script[kind].pop(0)
+        return self.fallback.decide(kind, view, prompt)
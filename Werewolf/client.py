@@ -1,13 +1,12 @@
-from Werewolf.WP.api import KillableThread
+import selectors
 import socket
 from socket import AF_INET, AF_INET6, SOCK_STREAM
-from threading import Thread
-from typing import Any, Dict, Optional, Tuple
-from time import sleep
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from time import monotonic
 try:
-    from .WP import ChunckedData, TimeLock, ReceiveThread, ReadInput
+    from .WP import ChunckedData, FrameBuffer, TerminalInput, getTerminal, listCodecs, parseInput, setConnectionCodec
 except ImportError:
-    from WP import ChunckedData, TimeLock, ReceiveThread, ReadInput
+    from WP import ChunckedData, FrameBuffer, TerminalInput, getTerminal, listCodecs, parseInput, setConnectionCodec
 
 BUFSIZE = 1024
 ROLE = 0
@@ -51,50 +50,247 @@ def getClientAddr(context: dict) -> Tuple[str, int]:
     )
 
 
-def ProcessPacket(toReply: ChunckedData, context: dict) -> bool:
+class Prompt(object):
     """
-    Ask for user input and build the corresponding packet.
+    A request of the server waiting for the input of the player.
+
+    The lines typed are passed to `onLine()` by the loop of the client until the prompt is answered or its deadline is reached, no thread is started.
+
+    Initialization:
+
+        packet: `ChunckedData`, the request
+        inputType: the type of the input expected, see `parseInput()`
+        answer: called with each input matching the type, returns whether the prompt is answered
+        choices: the seats that can be chosen, checked before the answer is sent, any seat if `None`
+
+    The prompt is abandoned at its deadline without a reply, the server does not wait for it anymore.
     """
-    if toReply is None:
-        return False
-    if context['isalive'] == False and toReply.type != -8:
-        return False
-    if toReply.type == -1:
+
+    def __init__(self, packet: ChunckedData, inputType: Any, answer: Callable[[Any], bool], choices: Optional[List[int]] = None):
+        self.packet: ChunckedData = packet
+        self.inputType: Any = inputType
+        self.choices: Optional[List[int]] = choices
+        self.answer: Callable[[Any], bool] = answer
+        self.deadline: float = monotonic() + packet['timeLimit']
+
+    def onLine(self, line: str) -> bool:
         """
-        -1: {
-            'seat': int,                    # 分配的座位号
-            'identity': int                # 分配的身份
-        },
-        Villager: 0
-        Wolf: -1
-        White Werewolf: -2
-        King of werewolves: -3
-        Predictor: 1
-        Witch: 2
-        Hunter: 3
-        Guard: 4
-        Idiot: 5
+        Returns whether the prompt is answered.
         """
-        context['id'] = toReply['seat']
-        context['identity'] = toReply['identity']
-        context['serverPort'] = toReply['srcPort']
-        context['serverAddr'] = toReply['srcAddr']
-        print("你的座位号是%d" % (context['id'], ))
-        print("你的身份是%s" %
-              (convertToString(context['identity']), )
-              )
-    elif toReply.type == -3:
+        try:
+            value = parseInput(line, self.inputType, self.choices)
+        except ValueError as e:
+            print(e)
+            return False
+        return self.answer(value)
+
+
+class Client(object):
+    """
+    The client of a human player.
+
+    The socket and the standard input are multiplexed by a selector in a single thread: the loop sleeps in `select()` until a packet or a line is received, or until the deadline of the prompt, so nothing is polled and a packet is handled as soon as it is received. The standard input is read through a `TerminalInput`, the lines typed when no prompt is waiting are dropped.
+
+    Initialization:
+
+        hostIP, hostPort: the address of the server or the lobby
+        room: int, the room to join in a lobby, `None` for a game with its own port
+        terminal: `TerminalInput`, the input of the player, the standard input by default
+
+    Methods:
+
+        Client.run(): play until the end of the game or until the connection is lost
+        Client.onReadable(): read the data available and handle the packets completed
+        Client.onInput(): read a line typed by the player
+        Client.handle(): handle a packet
+        Client.explode(): send the self-explosion
+    """
+
+    def __init__(self, hostIP: str = "localhost", hostPort: int = 21567, room: Optional[int] = None, terminal: Optional[TerminalInput] = None):
+        self.context: Dict[str, Any] = {'isalive': True}
+        self.context['serverAddr'] = hostIP
+        self.context['serverPort'] = hostPort
+        self.hostIP: str = hostIP
+        self.hostPort: int = hostPort
+        self.room: Optional[int] = room
+        self.terminal: TerminalInput = terminal if terminal is not None else getTerminal()
+        self.sockType = AF_INET6 if ":" in hostIP else AF_INET
+        self.socket: socket.socket = socket.socket(self.sockType, SOCK_STREAM)
+        self.socket.connect(getServerAddr(context=self.context))
+        self.context['socket'] = self.socket
+        self.context['serverAddr'], self.context['serverPort'] = self.socket.getpeername()[:2]
+        self.context['clientAddr'], self.context['clientPort'] = self.socket.getsockname()[:2]
+        self.buffer: FrameBuffer = FrameBuffer()
+        self.selector: selectors.BaseSelector = selectors.DefaultSelector()
+        self.prompt: Optional[Prompt] = None
+        self.closed: bool = False
+        self.ret: int = 0
+
+        basePacket: dict = getBasePacket(self.context)
+        if room is not None:
+            basePacket['room'] = room
+        basePacket['codecs'] = listCodecs()
+        ChunckedData(1, **basePacket).send(self.socket)
+
+    def _reply(self, packetType: int, **kwargs: Any):
+        kwargs.update(getBasePacket(self.context))
+        ChunckedData(packetType, **kwargs).send(self.socket)
+
+    def run(self) -> int:
         """
-        -3: {
-            'action': bool,                 # 玩家是否执行操作（若回送，指玩家作用是否成功）
-            'target': int                   # 玩家执行操作的目标
-        },
+        Returns:
+
+            int, 1 if the player wins, -1 if the player loses, 0 or 2 if the connection is lost before the end of the game
         """
-        assert context['identity'] == 1
-        print("你查验的玩家是%s" %
-              ("好人" if toReply['action'] else "狼人", )
-              )
-    elif toReply.type == 3:
+        self.selector.register(self.socket, selectors.EVENT_READ, self.onReadable)
+        if not self.terminal.closed:
+            self.selector.register(self.terminal, selectors.EVENT_READ, self.onInput)
+        try:
+            while not self.closed:
+                try:
+                    timeout = None if self.prompt is None else max(self.prompt.deadline - monotonic(), 0)
+                    for key, events in self.selector.select(timeout):
+                        key.data()
+                    if self.prompt is not None and self.prompt.deadline <= monotonic():
+                        self._onTimeout()
+                except KeyboardInterrupt:
+                    self.explode()
+        finally:
+            self.selector.close()
+            self.socket.close()
+        if self.ret == 1:
+            print("你赢了")
+        elif self.ret == -1:
+            print("你输了")
+        return self.ret
+
+    def onReadable(self):
+        try:
+            data = self.socket.recv(65536)
+        except ConnectionError:
+            data = b''
+        if not data:
+            if not self.closed:
+                print("与服务器断开连接")
+            self.closed = True
+            return
+        self.buffer.feed(data)
+        frame = self.buffer.pop()
+        while frame is not None and not self.closed:
+            self.handle(ChunckedData.fromFrame(frame))
+            frame = self.buffer.pop()
+
+    def onInput(self):
+        self.terminal.onReadable()
+        if self.terminal.closed:
+            # The standard input is closed, the prompts can only time out
+            self.selector.unregister(self.terminal)
+        line = self.terminal.popLine()
+        while line is not None:
+            if self.prompt is not None and self.prompt.onLine(line):
+                self.prompt = None
+            line = self.terminal.popLine()
+
+    def _onTimeout(self):
+        self.prompt = None
+        print("Input timeout.")
+
+    def handle(self, packet: ChunckedData):
+        """
+        Print the packet, or prompt the player if the packet is a request. A new request replaces the prompt not answered yet.
+        """
+        context = self.context
+        if packet.type == 8:
+            print("你死了")
+            self.ret = 2
+        elif packet.type == -8:
+            print("村民胜利" if packet['result'] else "狼人胜利")
+            self.ret = 1 if packet['result'] == (context['identity'] >= 0) else -1
+            self.closed = True
+            return
+        else:
+            self.ret = 0
+        if packet.type in (4, 5):
+            """
+            Only print the message, does not change the prompt
+            """
+            print(packet['content'])
+            return
+        # The request not answered yet is abandoned, the server does not wait for it anymore
+        self.prompt = None
+        if packet.type == 9:
+            """
+            监听到有玩家发生自爆，放弃当前的输入
+            """
+            print(str(packet['id']) + "号玩家自爆")
+        elif context['isalive'] == False:
+            return
+        elif packet.type == -1:
+            """
+            -1: {
+                'seat': int,                    # 分配的座位号
+                'identity': int                # 分配的身份
+            },
+            Villager: 0
+            Wolf: -1
+            White Werewolf: -2
+            King of werewolves: -3
+            Predictor: 1
+            Witch: 2
+            Hunter: 3
+            Guard: 4
+            Idiot: 5
+            """
+            context['id'] = packet['seat']
+            context['identity'] = packet['identity']
+            context['serverPort'] = packet['srcPort']
+            context['serverAddr'] = packet['srcAddr']
+            setConnectionCodec(self.socket, packet.content.get('codec', 'gzip'))
+            print("你的座位号是%d" % (context['id'], ))
+            print("你的身份是%s" %
+                  (convertToString(context['identity']), )
+                  )
+        elif packet.type == -3:
+            """
+            -3: {
+                'action': bool,                 # 玩家是否执行操作（若回送，指玩家作用是否成功）
+                'target': int                   # 玩家执行操作的目标
+            },
+            """
+            assert context['identity'] == 1
+            print("你查验的玩家是%s" %
+                  ("好人" if packet['action'] else "狼人", )
+                  )
+        elif packet.type == 3:
+            self._onAction(packet)
+        elif packet.type == 6:
+            """
+            6: {'timeLimit': int},              # 时间限制
+            """
+            print("轮到你进行发言：")
+            print('你有%d秒的发言时间' % (packet['timeLimit'], ))
+
+            def speak(content: str) -> bool:
+                self._reply(-6, requestId=packet['requestId'], content=content)
+                return True
+            self.prompt = Prompt(packet, str, speak)
+        elif packet.type == 7:
+            """
+            7: {
+                'prompt': str,
+                'choices': list                 # 可选字段，可以投票的玩家
+            },
+            """
+            print(packet['prompt'])
+            print("输入0弃票")
+            choices = packet.content.get('choices')
+
+            def vote(candidate: int) -> bool:
+                self._reply(-7, requestId=packet['requestId'], vote=candidate != 0, candidate=candidate)
+                return True
+            self.prompt = Prompt(packet, int, vote, None if choices is None else choices + [0])
+
+    def _onAction(self, packet: ChunckedData):
         """
         3: {
             # 'identityLimit': tuple,       # 能收到消息的玩家身份列表
@@ -102,252 +298,69 @@ def ProcessPacket(toReply: ChunckedData, context: dict) -> bool:
             'isnight': bool,                # 是否是晚上
             'format': str,                  # 玩家应当输入的格式，示例 "int"
             'prompt': str,                  # 输入提示
-            'timeLimit': int                # 时间限制
+            'timeLimit': int,               # 时间限制
+            'choices': list                 # 可选字段，可以选择的玩家
         },
         """
-        readThread: ReadInput
-        basePacket: dict = getBasePacket(context)
-
-        if context['identity'] < 0 and toReply['iskill']:
-            print(toReply['prompt'])
-            ret: int = 0
-            packetType: int
-            readThread = ReadInput("", str, toReply['timeLimit'], True)
-            readThread.setDaemon(True)
-            readThread.start()
-            readThread.join()
-
-            basePacket = getBasePacket(context)
-
-            try:
-                if isinstance(readThread.getResult(), KeyboardInterrupt):
-                    if context['identity'] >= 0:
-                        return True
-                    else:
-                        raise readThread.getResult()
-                ret = int(readThread.getResult())
-            except ValueError:
+        print(packet['prompt'])
+        choices = packet.content.get('choices')
+        if self.context['identity'] < 0 and packet['iskill']:
+            def kill(line: str) -> bool:
                 """
-                5: {
-                    'content': str                 # 自由交谈的内容
-                    # 'type': tuple                   # 能收到消息的身份列表，空列表指全部玩家
-                },
+                A number is the vote of the wolf, 0 or a negative number to kill nobody, any other text is sent to the other wolves
                 """
-                if type(readThread.getResult()) == str:
-                    basePacket['content'] = readThread.getResult()
-                    packetType = 5
-                else:
-                    basePacket['action'] = False
-                    packetType = -3
-            else:
+                try:
+                    target = parseInput(line, int)
+                except ValueError:
+                    """
+                    5: {
+                        'content': str                 # 自由交谈的内容
+                    },
+                    """
+                    self._reply(5, content=line)
+                    return False
+                if target > 0 and choices is not None and target not in choices:
+                    print("%d号玩家不能被选择" % (target, ))
+                    return False
                 """
                 -3: {
                     'action': bool,                 # 玩家是否执行操作（若回送，指玩家作用是否成功）
                     'target': int                   # 玩家执行操作的目标
                 },
                 """
-                basePacket['action'] = ret > 0
-                basePacket['target'] = ret
-                packetType = -3
-
-            packetSend = ChunckedData(packetType, **basePacket)
-            packetSend.send(context['socket'])
-
-            return packetType == 5
-
-        else:
-            print(toReply['prompt'])
-            print("你需要输入一个%s" % (toReply['format'], ))
-            print('你有%d秒的时间进行选择' % (toReply['timeLimit'], ))
-
-            readThread = ReadInput("", toReply['format'], toReply['timeLimit'])
-            readThread.setDaemon(True)
-            readThread.start()
-            readThread.join()
-
-            basePacket['target'] = readThread.getResult()
-            basePacket['action'] = readThread.getResult() >= 0
-            packetType = -3
-
-            packetSend = ChunckedData(packetType, **basePacket)
-            packetSend.send(context['socket'])
-
-    elif toReply.type == 4:
-        """
-        4: {
-            'content': str,             # 要公布的消息
-        },
-        """
-        print(toReply['content'])
-    elif toReply.type == 5:
-        """
-        5: {
-            'content': str                 # 自由交谈的内容
-            # 'type': tuple                   # 能收到消息的身份列表，空列表指全部玩家
-        },
-        """
-        print(toReply['content'])
-    elif toReply.type == 6:
-        """
-        6: {'timeLimit': int},              # 时间限制
-        """
-        print("轮到你进行发言：")
-        print('你有%d秒的发言时间' % (toReply['timeLimit'], ))
-
-        readThread = ReadInput("", str, toReply['timeLimit'])
-        readThread.setDaemon(True)
-        readThread.start()
-        readThread.join()
-        basePacket: dict = getBasePacket(context)
-        if isinstance(readThread.getResult(), str):
-            basePacket['content'] = readThread.getResult()
-        elif isinstance(readThread.getResult(), KeyboardInterrupt):
-            raise readThread.getResult()
-        packetType = -6
-
-        packetSend = ChunckedData(packetType, **basePacket)
-        packetSend.send(context['socket'])
+                self._reply(-3, requestId=packet['requestId'], action=target > 0, target=target)
+                return True
+            self.prompt = Prompt(packet, str, kill)
+            return
+        print("你需要输入一个%s" % (packet['format'], ))
+        print('你有%d秒的时间进行选择' % (packet['timeLimit'], ))
+
+        def act(target: Any) -> bool:
+            if isinstance(target, bool):
+                self._reply(-3, requestId=packet['requestId'], action=target, target=int(target))
+            elif isinstance(target, int):
+                self._reply(-3, requestId=packet['requestId'], action=target >= 0, target=target)
+            else:
+                print("你的输入格式不匹配")
+                return False
+            return True
+        self.prompt = Prompt(packet, packet['format'], act, choices)
 
-    elif toReply.type == 7:
+    def explode(self):
         """
-        7: {
-            'prompt': str
-        },
+        Send the self-explosion, only a wolf alive can explode.
         """
-        readThread = ReadInput(toReply['prompt'], int, toReply['timeLimit'])
-        readThread.setDaemon(True)
-        readThread.start()
-        readThread.join()
-
+        context = self.context
+        if context.get('identity', 0) >= 0:
+            return
+        if context["isalive"] == False:
+            print("你已经死了，请等待游戏结果")
+            return
         basePacket: dict = getBasePacket(context)
-        if type(readThread.getResult()) == int:
-            basePacket['vote'] = True
-            basePacket['candidate'] = readThread.getResult()
-        else:
-            basePacket['vote'] = False
-            basePacket['candidate'] = 0
-        packetType = -7
-
-        packetSend = ChunckedData(packetType, **basePacket)
-        packetSend.send(context['socket'])
-
-    return False
-
-
-def packetProcessWrapper(curPacket: ChunckedData, context: dict):
-    try:
-        timer = TimeLock(curPacket['timeLimit'])
-        timer.setDaemon(True)
-        timer.start()
-        while not timer.getStatus() and ProcessPacket(curPacket, context):
-            pass
-            # REVIEW for debugging
-            # print("Process Wrapper loop")
-    except KeyError:
-        # If no 'timeLimit' provided...
-        ProcessPacket(curPacket, context)
-
-
-def launchClient(hostIP: str = "localhost", hostPort: int = 21567):
-    context: Dict[str, Any] = {'isalive': True}
-    context['serverAddr'] = hostIP
-    context['serverPort'] = hostPort
-
-    sockType = AF_INET6 if ":" in hostIP else AF_INET
-    sock = socket.socket(sockType, SOCK_STREAM)
-    sock.connect(getServerAddr(context=context))
-    context['socket'] = sock
-    context['serverAddr'], context['serverPort'] = sock.getpeername()[:2]
-    context['clientAddr'], context['clientPort'] = sock.getsockname()[:2]
-
-    basePacket: dict = getBasePacket(context)
-    packetSend = ChunckedData(1, **basePacket)
-    receivingThread = ReceiveThread(sock, 120)
-    receivingThread.setDaemon(True)
-    receivingThread.start()
-    packetSend.send(context['socket'])
-    receivingThread.join()
-    curPacket: Optional[ChunckedData] = None
-    actionPacket: Optional[ChunckedData] = None
-
-    ret: int = 0
-    temp: Optional[KillableThread] = None
-    while ret ** 2 != 1:
-        """
-        不巧，有时候按下Ctrl+C的时候程序恰好执行到这里，无法捕获到异常
-        """
-        try:
-            if isinstance(curPacket, ChunckedData):
-                if curPacket.type == 8:
-                    print("你死了")
-                    ret = 2
-                elif curPacket.type == -8:
-                    print("村民胜利" if curPacket['result'] else "狼人胜利")
-                    ret = 1 if curPacket['result'] == (
-                        context['identity'] >= 0
-                    ) else -1
-                    break
-                else:
-                    ret = 0
-                if curPacket.type in [4, 5]:
-                    """
-                    Only print the message, does not change the loop status
-                    """
-                    packetProcessWrapper(curPacket, context)
-                elif curPacket.type == 9:
-                    """
-                    监听到有玩家发生自爆，杀掉当前线程
-                    """
-                    print(str(curPacket['id']) + "号玩家自爆")
-                    if temp is not None and temp.is_alive():
-                        temp.kill()
-                else:
-                    """
-                    Enter the wrapper loop. First check the running status of the wrapper.
-                    """
-                    if temp is not None and temp.is_alive():
-                        temp.kill()
-                    temp = KillableThread(packetProcessWrapper,
-                                          *(curPacket, context))
-                    temp.setDaemon(True)
-                    temp.start()
-
-                curPacket = None
-
-            if not receivingThread.is_alive():
-                curPacket = receivingThread.getResult()
-                receivingThread = ReceiveThread(sock, 1024)
-                receivingThread.setDaemon(True)
-                receivingThread.start()
-
-            sleep(0.05)
-
-        except KeyboardInterrupt:
-            if context['identity'] >= 0:
-                continue
-            if context["isalive"] == False:
-                print("你已经死了，请等待游戏结果")
-                continue
-            else:
-                basePacket: dict = getBasePacket(context)
-                basePacket['id'] = context['id']
-                packetSend = ChunckedData(9, **basePacket)
-                try:
-                    sockTemp = socket.socket(sockType, SOCK_STREAM)
-                    sockTemp.connect((hostIP, hostPort + 1))
-                    packetSend.send(sockTemp)
-                    del sockTemp
-                except ConnectionRefusedError:
-                    """
-                    The server is not ready for receiving messages
-                    """
-                    print("你现在不能自爆")
+        basePacket['id'] = context['id']
+        # The self-explosion is sent through the game connection, the server informs the player if it is refused
+        ChunckedData(9, **basePacket).send(self.socket)
 
-        except ConnectionResetError:
-            print("与服务器断开连接")
-            break
 
-    if ret == 1:
-        print("你赢了")
-    elif ret == -1:
-        print("你输了")
+def launchClient(hostIP: str = "localhost", hostPort: int = 21567, room: Optional[int] = None):
+    Client(hostIP, hostPort, room).run()
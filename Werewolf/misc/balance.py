@@ -0,0 +1,230 @@
+import argparse
+import math
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import preset6, preset8, preset10, preset12
+from ..server.rules import identityCodes
+from ..server.simulator import RandomPolicy, Simulator
+
+roleNames: Dict[int, str] = {
+    0: "Villager",
+    -1: "Wolf",
+    -2: "WhiteWerewolf",
+    -3: "KingOfWerewolves",
+    1: "Predictor",
+    2: "Witch",
+    3: "Hunter",
+    4: "Guard",
+    5: "Idiot"
+}
+
+
+def getPresets() -> Dict[str, Dict[str, int]]:
+    """
+    The presets shipped in `Werewolf.misc`, by name.
+    """
+    ret: Dict[str, Dict[str, int]] = {}
+    for module in (preset6, preset8, preset10, preset12):
+        for name, value in vars(module).items():
+            if not name.startswith('_') and isinstance(value, dict):
+                ret[name] = value
+    return ret
+
+
+def wilson(success: int, total: int, z: float = 1.96) -> Tuple[float, float]:
+    """
+    The Wilson score interval of a proportion, 95% by default.
+    """
+    if total == 0:
+        return 0.0, 1.0
+    p = success / total
+    denominator = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(center - margin, 0.0), min(center + margin, 1.0)
+
+
+class PresetStats(object):
+    """
+    The results of the games simulated with a preset, the results of the workers are merged with `merge()`.
+
+    Attributes:
+
+        games: int, the number of games
+        villagerWins: int, the number of games won by the villagers
+        days: Counter, the number of games by the number of days played
+        survived: Counter, for each role, the number of games the role survived
+        survivedWins: Counter, for each role, the number of games the role survived and the villagers won
+        seats: Counter, the number of players of each role
+        wins: Counter, for each role, the number of players in the games won by the villagers
+    """
+
+    def __init__(self):
+        self.games: int = 0
+        self.villagerWins: int = 0
+        self.days: Counter = Counter()
+        self.survived: Counter = Counter()
+        self.survivedWins: Counter = Counter()
+        self.seats: Counter = Counter()
+        self.wins: Counter = Counter()
+
+    def add(self, status: int, days: int, identities: Dict[int, int], dead: Iterable[int]):
+        self.games += 1
+        self.villagerWins += status == 1
+        self.days[days] += 1
+        dead = set(dead)
+        for seat, code in identities.items():
+            self.seats[code] += 1
+            self.wins[code] += status == 1
+            if seat not in dead:
+                self.survived[code] += 1
+                self.survivedWins[code] += status == 1
+
+    def merge(self, other: 'PresetStats'):
+        self.games += other.games
+        self.villagerWins += other.villagerWins
+        self.days.update(other.days)
+        self.survived.update(other.survived)
+        self.survivedWins.update(other.survivedWins)
+        self.seats.update(other.seats)
+        self.wins.update(other.wins)
+
+    def winRate(self) -> Tuple[float, float, float]:
+        """
+        The win rate of the villagers and its 95% confidence interval.
+        """
+        low, high = wilson(self.villagerWins, self.games)
+        return self.villagerWins / max(self.games, 1), low, high
+
+    def meanDays(self) -> Tuple[float, float]:
+        """
+        The mean number of days and the half width of its 95% confidence interval.
+        """
+        if not self.games:
+            return 0.0, 0.0
+        mean = sum(day * count for day, count in self.days.items()) / self.games
+        variance = sum(count * (day - mean) ** 2 for day, count in self.days.items()) / max(self.games - 1, 1)
+        return mean, 1.96 * math.sqrt(variance / self.games)
+
+    def impact(self) -> Dict[int, float]:
+        """
+        For each role, the win rate of the villagers when a player of the role survives the game minus the win rate when the player dies.
+        """
+        ret: Dict[int, float] = {}
+        for code, seats in self.seats.items():
+            survived, dead = self.survived[code], seats - self.survived[code]
+            if survived and dead:
+                ret[code] = self.survivedWins[code] / survived - \
+                    (self.wins[code] - self.survivedWins[code]) / dead
+        return ret
+
+    def __str__(self):
+        rate, low, high = self.winRate()
+        days, margin = self.meanDays()
+        return "%d games, villagers win %.2f%% [%.2f%%, %.2f%%], %.2f ± %.2f days" % (
+            self.games, rate * 100, low * 100, high * 100, days, margin)
+
+
+def simulateChunk(name: str, identityList: Dict[str, int], games: int, seed: str) -> Tuple[str, PresetStats]:
+    """
+    Simulate the games of a chunk, run in a worker process.
+    """
+    rng = random.Random(seed)
+    policy = RandomPolicy(rng)
+    stats = PresetStats()
+    for i in range(games):
+        result = Simulator(identityList, policy, rng).run()
+        stats.add(result.status, result.days, result.identities,
+                  (seat for seat, cause, day in result.deaths))
+    return name, stats
+
+
+def analyze(
+    presets: Dict[str, Dict[str, int]],
+    games: int,
+    workers: Optional[int] = None,
+    chunk: int = 2000,
+    seed: Optional[int] = None,
+    onProgress: Optional[Callable[[str, PresetStats], None]] = None,
+    executor: Optional[Executor] = None
+) -> Dict[str, PresetStats]:
+    """
+    Simulate the games of the presets across a pool of processes.
+
+    Parameters:
+
+        presets: dict, the name and the identity configuration of the presets
+        games: int, the number of games for each preset
+        workers: int, the number of processes, the number of CPUs by default
+        chunk: int, the number of games simulated by a task, the results are merged and reported after each task
+        seed: int, the seed of the tasks, for reproducible results
+        onProgress: called with the name and the merged statistics of a preset after each task
+        executor: the executor running the tasks, a new `ProcessPoolExecutor` by default
+
+    Returns:
+
+        the statistics of each preset
+    """
+    seed = seed if seed is not None else random.randrange(2 ** 32)
+    results: Dict[str, PresetStats] = {name: PresetStats() for name in presets}
+    pool = executor if executor is not None else ProcessPoolExecutor(workers)
+    try:
+        tasks = [
+            pool.submit(simulateChunk, name, identityList,
+                        min(chunk, games - start), "%d:%s:%d" % (seed, name, start))
+            for name, identityList in presets.items()
+            for start in range(0, games, chunk)
+        ]
+        for task in as_completed(tasks):
+            name, stats = task.result()
+            results[name].merge(stats)
+            if onProgress is not None:
+                onProgress(name, results[name])
+    finally:
+        if executor is None:
+            pool.shutdown(cancel_futures=True)
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    presets = getPresets()
+    parser = argparse.ArgumentParser(
+        description="Estimate the balance of the presets by simulating games")
+    parser.add_argument('presets', nargs='*', metavar='preset',
+                        help="the names of the presets, all presets by default")
+    parser.add_argument('--games', type=int, default=100000,
+                        help="the number of games for each preset")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+    selected = {name: presets[name] for name in (args.presets or sorted(presets))}
+    for name, identityList in selected.items():
+        assert all(_ in identityCodes for _ in identityList), "Unknown identity in %s" % (name, )
+
+    start = time.perf_counter()
+
+    def onProgress(name: str, stats: PresetStats):
+        print("[%7.1fs] %-48s %s" % (time.perf_counter() - start, name, stats), flush=True)
+
+    results = analyze(selected, args.games, args.workers, args.chunk, args.seed, onProgress)
+    seconds = time.perf_counter() - start
+    print()
+    for name, stats in results.items():
+        print(name)
+        print("    %s" % (stats, ))
+        for code, value in sorted(stats.impact().items(), key=lambda _: -abs(_[1])):
+            print("    %-18s survives %.1f%%, impact on the villagers' win rate %+.2f%%" % (
+                roleNames[code], stats.survived[code] * 100 / stats.seats[code], value * 100))
+    total = args.games * len(selected)
+    print("%d games in %.1fs with %d workers, %.0f games per hour" % (
+        total, seconds, args.workers, total * 3600 / seconds))
+
+
+if __name__ == '__main__':
+    main()
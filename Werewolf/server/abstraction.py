@@ -1,8 +1,16 @@
-import socket
-from threading import Thread
-from typing import Optional, List
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from ..WP.api import ChunckedData, ReceiveThread, TimeLock
+from ..WP.api import ChunckedData
+from ..WP.cancel import CancelToken
+from .engine import PendingPacket, PlayerConnection
+
+# The types of the replies to the requests
+responseTypes: Dict[int, Tuple[int, ...]] = {
+    3: (-3, ),  # ActionReq -> ActionResp
+    6: (-6, ),  # LimitedConversationReq -> LimitedConversationResp
+    7: (-7, )   # VoteReq -> VoteResp
+}
 
 defaultTimeout: float = 180.0  # 超时时间，是各方法的默认参数
 
@@ -36,19 +44,20 @@ class Person():
 
         id: the identifier of the player.
 
-        socket: the outgoing socket for communication with the client
-        recv: the incoming socket for communication with the client
+        socket: the connection to the client, see `PlayerConnection`
         client: the (ip, port) tuple format of address of the client
         server: the (ip, port) tuple format of address of the server
 
         police: bool, whether the player is the police
         innocent: bool, whether the player is innocent, this attribute is for the predictor
         alive: bool whether the player is alive
+        token: CancelToken, cancels the requests of the current phase, e.g. the day interrupted by a self-explosion, `None` if the phase cannot be cancelled
 
     Private methods:
 
         _getBasePacket(): Get a template of the packet
-        _startListening(): Listen to the port and return the data received
+        _startListening(): Wait for the data from the client
+        _request(): Send a request and wait for the reply
 
     Methods:
 
@@ -61,21 +70,19 @@ class Person():
 
     """
 
-    def __init__(self, id: int, connection: socket.socket):
+    def __init__(self, id: int, connection: PlayerConnection):
         """
         Initialize the player
 
         Parameters:
 
             id: int, provided by the upper layer
-            client: tuple, in form of (ip, port)
-            server: tuple, same with client
+            connection: PlayerConnection, the connection accepted by the engine
 
         Returns:
 
             Person, the objcet created.
         """
-        # AF_INET：使用TCP/IP-IPv4协议簇；SOCK_STREAM：使用TCP流
         self.socket = connection
         self.server = self.socket.getsockname()
         self.client = self.socket.getpeername()
@@ -83,6 +90,7 @@ class Person():
         self.police = False  # police的值由服务器进行分配，在__init__()方法中被初始化为False
         self.innocent = True  # 如果某个客户端是狼人，则innocent的值为False；否则为True
         self.alive = True
+        self.token: Optional[CancelToken] = None
 
     def _getBasePacket(self) -> dict:
         """
@@ -103,71 +111,89 @@ class Person():
         ret['destPort'] = self.client[1]
         return ret
 
-    def _startListening(self, timeout=0) -> ReceiveThread:
+    def _startListening(self, timeout=0, types: Optional[Tuple[int, ...]] = None, requestId: Optional[int] = None) -> PendingPacket:
         """
         Listen to the client for a specified time.
 
         Parameters:
 
             timeout: float, time to wait for the client
+            types: the types of the packets expected, any type if `None`
+            requestId: int, the request the reply is expected to
 
         Returns:
 
-            ChunckedData, the data received
+            PendingPacket, the data to be received, cancelled with the token of the phase
+        """
+        ret = self.socket.receive(timeout, types, requestId)
+        if self.token is not None:
+            self.token.link(ret.future)
+        return ret
+
+    def _request(self, packetType: int, packet: dict, timeout=0, types: Optional[Tuple[int, ...]] = None) -> PendingPacket:
         """
-        recevingThread = ReceiveThread(self.socket, timeout)
-        recevingThread.start()
-        return recevingThread
+        Send a request and listen to the reply, see `responseTypes`. The request gets a new `requestId`, echoed by the reply, so the stale replies to the earlier requests are dropped.
+
+        Parameters:
+
+            packetType: int, the type of the request
+            packet: dict, the content of the request without the `requestId`
+            timeout: float, time to wait for the client
+            types: the types of the packets expected, the reply to the request by default
+
+        Returns:
+
+            PendingPacket, the data to be received
+        """
+        if self.token is not None:
+            # No request is sent once the phase is cancelled, raises `CancellationError`
+            self.token.check()
+        types = responseTypes[packetType] if types is None else types
+        packet['requestId'] = self.socket.newRequest(types)
+        packetSend = ChunckedData(packetType, **packet)
+        packetSend.send(self.socket)
+        return self._startListening(timeout, types, packet['requestId'])
 
     def inform(self, content: str):
         packet = self._getBasePacket()
         packet['content'] = content
-        packetSend = ChunckedData(4, **packet)
-        sendingThread = Thread(target=packetSend.send,
-                               args=(self.socket, ))
-        sendingThread.setDaemon(True)
-        sendingThread.start()
+        # The announcements are built by the server, the content is not checked again
+        packetSend = ChunckedData.trusted(4, **packet)
+        packetSend.send(self.socket)
 
     def informDeath(self):
         packet = self._getBasePacket()
-        packetSend = ChunckedData(8, **packet)
-        sendingThread = Thread(
-            target=packetSend.send, args=(self.socket, ))
-        sendingThread.setDaemon(True)
-        sendingThread.start()
+        packetSend = ChunckedData.trusted(8, **packet)
+        packetSend.send(self.socket)
 
     def informResult(self, result: bool):
         packet = self._getBasePacket()
         packet['result'] = result
-        packetSend = ChunckedData(-8, **packet)
-        sendingThread = Thread(target=packetSend.send,
-                               args=(self.socket, ))
-        sendingThread.setDaemon(True)
-        sendingThread.start()
+        packetSend = ChunckedData.trusted(-8, **packet)
+        packetSend.send(self.socket)
 
-    def vote(self, timeout: float = defaultTimeout) -> ReceiveThread:
+    def vote(self, timeout: Optional[float] = None, choices: Optional[Iterable[int]] = None) -> PendingPacket:
         """
         Send a package to a player to vote for the exiled.
 
         Parameters:
 
             timeout: float, time to wait for the client
+            choices: the seats that can be voted for, checked by the client before the vote is sent
 
         Returns:
 
-            ReceiveThread, the thread receiving from the client
+            PendingPacket, the packet to be received from the client
         """
+        timeout = default_timeout() if timeout is None else timeout
         packet = self._getBasePacket()
         packet['prompt'] = "请投票要执行放逐的玩家：\n"
         packet['timeLimit'] = timeout
-        packetSend = ChunckedData(7, **packet)
-        sendingThread = Thread(target=packetSend.send,
-                               args=(self.socket, ))
-        sendingThread.setDaemon(True)
-        sendingThread.start()
-        return self._startListening(timeout=timeout)
+        if choices is not None:
+            packet['choices'] = list(choices)
+        return self._request(7, packet, timeout)
 
-    def joinElection(self, timeout: float = defaultTimeout) -> ReceiveThread:
+    def joinElection(self, timeout: Optional[float] = None) -> PendingPacket:
         """
         Send a package to a player to join the police election.
 
@@ -177,21 +203,18 @@ class Person():
 
         Returns:
 
-            ReceiveThread, the thread receiving from the client
+            PendingPacket, the packet to be received from the client
         """
+        timeout = default_timeout() if timeout is None else timeout
         packet = self._getBasePacket()
         packet['format'] = 'bool'
         packet['prompt'] = '请所有玩家上警\n你有%d秒的选择时间\n输入True选择上警，输入False选择不上警：\n' % (
             int(timeout), )
         packet['timeLimit'] = timeout
         packet['iskill'] = False
-        packetSend = ChunckedData(3, **packet)
-        sendingThread = Thread(target=packetSend.send, args=(self.socket,))
-        sendingThread.setDaemon(True)
-        sendingThread.start()
-        return self._startListening(timeout=timeout)
+        return self._request(3, packet, timeout)
 
-    def policeSetseq(self, timeout: float = defaultTimeout) -> Optional[ReceiveThread]:
+    def policeSetseq(self, timeout: Optional[float] = None) -> Optional[PendingPacket]:
         """
         Send a package to a player to vote for the police.
 
@@ -201,20 +224,16 @@ class Person():
 
         Returns:
 
-            receiveThread, the thread receiving from the client
+            PendingPacket, the packet to be received from the client
         """
+        timeout = default_timeout() if timeout is None else timeout
         if self.police:
             packet = self._getBasePacket()
             packet['prompt'] = "请选择玩家发言顺序，True表示顺时针发言，False表示逆时针发言：\n"
             packet['timeLimit'] = timeout
             packet['iskill'] = False
             packet['format'] = "bool"
-            packetSend = ChunckedData(3, **packet)
-            sendingThread = Thread(
-                target=packetSend.send, args=(self.socket, ))
-            sendingThread.setDaemon(True)
-            sendingThread.start()
-            return self._startListening(timeout=timeout)
+            return self._request(3, packet, timeout)
         else:
             return None
 
@@ -232,32 +251,31 @@ class Person():
         """
         self.police = val
 
-    def voteForPolice(self, timeout: float = defaultTimeout) -> Optional[ReceiveThread]:
+    def voteForPolice(self, timeout: Optional[float] = None, choices: Optional[Iterable[int]] = None) -> Optional[PendingPacket]:
         """
         Send a package to the police to choose the sequence.
 
         Parameters:
 
             timeout: float, time to wait for the client
+            choices: the candidates, checked by the client before the vote is sent
 
         Returns:
 
-            receiveThread, the thread receiving from the client
+            PendingPacket, the packet to be received from the client
         """
+        timeout = default_timeout() if timeout is None else timeout
         if not self.police:
             packet = self._getBasePacket()
             packet['prompt'] = "请投票："
             packet['timeLimit'] = timeout
-            packetSend = ChunckedData(7, **packet)
-            sendingThread = Thread(
-                target=packetSend.send, args=(self.socket, ))
-            sendingThread.setDaemon(True)
-            sendingThread.start()
-            return self._startListening(timeout=timeout)
+            if choices is not None:
+                packet['choices'] = list(choices)
+            return self._request(7, packet, timeout)
         else:
             return None
 
-    def speak(self, timeout: float = defaultTimeout) -> ReceiveThread:
+    def speak(self, timeout: Optional[float] = None) -> PendingPacket:
         """
         Send a package to a player to talk about the situation before the vote.
 
@@ -267,23 +285,18 @@ class Person():
 
         Returns:
 
-            ReceiveThread, the thread receiving from the client
+            PendingPacket, the packet to be received from the client
         """
+        timeout = default_timeout() if timeout is None else timeout
         packet = self._getBasePacket()
         packet['timeLimit'] = timeout
-        packetSend = ChunckedData(6, **packet)
-        sendingThread = Thread(target=packetSend.send,
-                               args=(self.socket, ))
-        sendingThread.setDaemon(True)
-        sendingThread.start()
-        return self._startListening(timeout=timeout)
+        return self._request(6, packet, timeout)
 
 #   def sendMessage(self, data: list = []):
 #       packet = self._getBasePacket()
 #       packet['description'] = '\n'.join(data)
 #       packet['parameter'] = tuple()
-#       sendingThread = Thread(target=packetSend.send(), args=(self.socket, ))
-#       sendingThread.start()
+#       packetSend.send(self.socket)
 
     def onDead(self, withFinalWords: bool, timeouts: float):
         """
@@ -306,24 +319,14 @@ class Person():
             packet = self._getBasePacket()
             packet['prompt'] = "请选择要继承警徽的玩家：\n"
             packet['timeLimit'] = timeouts
-            packetSend = ChunckedData(7, **packet)
-            sendingThread = Thread(
-                target=packetSend.send, args=(self.socket, ))
-            sendingThread.setDaemon(True)
-            sendingThread.start()
-            ret.append(self._startListening(timeout=timeouts))
+            ret.append(self._request(7, packet, timeouts))
             ret[-1].join()
         else:
             ret.append(None)
         if withFinalWords:
             packet = self._getBasePacket()
             packet['timeLimit'] = timeouts
-            packetSend = ChunckedData(6, **packet)
-            sendingThread = Thread(
-                target=packetSend.send, args=(self.socket, ))
-            sendingThread.setDaemon(True)
-            sendingThread.start()
-            ret.append(self._startListening(timeout=timeouts))
+            ret.append(self._request(6, packet, timeouts))
             ret[-1].join()
         else:
             ret.append(None)
@@ -337,7 +340,7 @@ class Villager(Person):
     Attributes and methods are inherited from class Person
     """
 
-    def __init__(self, id: int, connection: socket.socket):
+    def __init__(self, id: int, connection: PlayerConnection):
         super().__init__(id, connection)
         self.type = 0
 
@@ -362,7 +365,7 @@ class Wolf(Person):
         kill(): ask the client to kill a player
     """
 
-    def __init__(self, id: int, connection: socket.socket):
+    def __init__(self, id: int, connection: PlayerConnection):
         """
         Initialization method inherited from class Person
         """
@@ -383,52 +386,47 @@ class Wolf(Person):
         """
         self.peerList.remove(peer)
 
-    def kill(self, timeout: float = defaultTimeout) -> Optional[ReceiveThread]:
+    def kill(self, timeout: Optional[float] = None, choices: Optional[Iterable[int]] = None) -> Optional[PendingPacket]:
         """
         Wolves communicate with each other and specifying the victim
 
         Parameters:
 
             timeout: float, time to wait for the client
+            choices: the seats that can be killed, checked by the client before the vote is sent
 
         Returns:
 
-            receiveThread, the thread receiving from the client
+            PendingPacket, the packet to be received from the client
         """
+        timeout = default_timeout() if timeout is None else timeout
         packet = self._getBasePacket()
         packet['format'] = "int"
         packet['prompt'] = "狼人请刀人。\n你有%d秒的时间与同伴交流\n输入任何文本可以与同伴交流，输入数字投票" % (
             int(timeout), )
         packet['timeLimit'] = timeout
         packet['iskill'] = True
-        packetSend = ChunckedData(3, **packet)
-        sendingThread = Thread(target=packetSend.send,
-                               args=(self.socket,))
-        sendingThread.setDaemon(True)
-        sendingThread.start()
-        timer = TimeLock(timeout)
-        timer.setDaemon(True)
-        timer.start()
-        recv: Optional[ReceiveThread] = None
-        recv = self._startListening(timeout)
-        while not timer.getStatus():
-            if recv.getResult() is None:
-                continue
-            elif recv.getResult().type == -3:
+        if choices is not None:
+            packet['choices'] = list(choices)
+        deadline = monotonic() + timeout
+        # The vote, or a message to the other wolves
+        recv: PendingPacket = self._request(3, packet, timeout, (-3, 5))
+        while True:
+            # Block until a packet is received or the time is up, instead of polling
+            recv.join(max(deadline - monotonic(), 0))
+            if recv.is_alive() or recv.getResult() is None or recv.getResult().type == -3:
                 return recv
-            elif recv.getResult().type == 5:
+            if recv.getResult().type == 5:
                 packet: dict = recv.getResult().content.copy()
-                recv = self._startListening(timeout)
                 packet['content'] = "%d号玩家发言：\t" % (
                     self.id, ) + packet['content']
                 for peer in self.peerList:
                     packet.update(**peer._getBasePacket())
                     packetSend = ChunckedData(5, **packet)
-                    thread = Thread(target=packetSend.send,
-                                    args=(peer.socket, ))
-                    thread.setDaemon(True)
-                    thread.start()
-        return recv
+                    packetSend.send(peer.socket)
+            if deadline <= monotonic():
+                return recv
+            recv = self._startListening(deadline - monotonic(), (-3, 5), recv.requestId)
 
 
 class SkilledPerson(Person):
@@ -445,7 +443,7 @@ class SkilledPerson(Person):
         postSkill(): set ability availibity.
     """
 
-    def __init__(self, id: int, connection: socket.socket):
+    def __init__(self, id: int, connection: PlayerConnection):
         """
         Initialization method inherited from class Person
         """
@@ -458,7 +456,7 @@ class SkilledPerson(Person):
         """
         self.used += increment
 
-    def skill(self, prompt: str = "", timeout: float = defaultTimeout, format: str = "int") -> ReceiveThread:
+    def skill(self, prompt: str = "", timeout: Optional[float] = None, format: str = "int") -> PendingPacket:
         """
         Ask the player whether to use the skill
 
@@ -469,19 +467,15 @@ class SkilledPerson(Person):
 
         Returns:
 
-            receiveThread, the thread receiving from the client
+            PendingPacket, the packet to be received from the client
         """
+        timeout = default_timeout() if timeout is None else timeout
         packet = self._getBasePacket()
         packet['format'] = format
         packet['prompt'] = prompt
         packet['timeLimit'] = timeout
         packet['iskill'] = False
-        packetSend = ChunckedData(3, **packet)
-        sendingThread = Thread(target=packetSend.send,
-                               args=(self.socket, ))
-        sendingThread.setDaemon(True)
-        sendingThread.start()
-        return self._startListening(timeout)
+        return self._request(3, packet, timeout)
 
 
 class KingOfWerewolves(Wolf, SkilledPerson):
@@ -491,11 +485,12 @@ class KingOfWerewolves(Wolf, SkilledPerson):
     Attributes and methods are inherited from class SkilledPerson.
     """
 
-    def __init__(self, id: int, connection: socket.socket):
+    def __init__(self, id: int, connection: PlayerConnection):
         super(KingOfWerewolves, self).__init__(id, connection)
         self.type = -3
 
-    def skill(self, timeout: float = defaultTimeout):
+    def skill(self, timeout: Optional[float] = None):
+        timeout = default_timeout() if timeout is None else timeout
         prompt = """Please select a person to kill.
 you have %f seconds to decide.""" % (timeout, )
         return SkilledPerson.skill(self, prompt, timeout)
@@ -508,11 +503,12 @@ class WhiteWerewolf(Wolf, SkilledPerson):
     Attributes and methods are inherited from class SkilledPerson.
     """
 
-    def __init__(self, id: int, connection: socket.socket):
+    def __init__(self, id: int, connection: PlayerConnection):
         super(WhiteWerewolf, self).__init__(id, connection)
         self.type = -2
 
-    def skill(self, timeout: float = defaultTimeout):
+    def skill(self, timeout: Optional[float] = None):
+        timeout = default_timeout() if timeout is None else timeout
         prompt = """请选择在自爆时要杀死的人\n你有%d秒的时间进行决定""" % (int(timeout), )
         return SkilledPerson.skill(self, prompt, timeout)
 
@@ -524,11 +520,12 @@ class Predictor(SkilledPerson):
     Attributes and methods are inherited from class SkilledPerson.
     """
 
-    def __init__(self, id: int, connection: socket.socket):
+    def __init__(self, id: int, connection: PlayerConnection):
         super(Predictor, self).__init__(id, connection)
         self.type = 1
 
-    def skill(self, timeout: float = defaultTimeout):
+    def skill(self, timeout: Optional[float] = None):
+        timeout = default_timeout() if timeout is None else timeout
         prompt = "请选择你要查验的人\n你有%d秒的时间进行决定" % (int(timeout), )
         return SkilledPerson.skill(self, prompt, timeout)
 
@@ -540,11 +537,12 @@ class Witch(SkilledPerson):
     Attributes and methods are inherited from class SkilledPerson.
     """
 
-    def __init__(self, id: int, connection: socket.socket):
+    def __init__(self, id: int, connection: PlayerConnection):
         super(Witch, self).__init__(id, connection)
         self.type = 2
 
-    def skill(self, killed: int = 0, timeout: float = defaultTimeout):
+    def skill(self, killed: int = 0, timeout: Optional[float] = None):
+        timeout = default_timeout() if timeout is None else timeout
         packet = self._getBasePacket()
         if self.used % 2 == 1:
             killed = 0
@@ -572,11 +570,12 @@ class Hunter(SkilledPerson):
     Attributes and methods are inherited from class SkilledPerson.
     """
 
-    def __init__(self, id: int, connection: socket.socket):
+    def __init__(self, id: int, connection: PlayerConnection):
         super(Hunter, self).__init__(id, connection)
         self.type = 3
 
-    def skill(self, timeout: float = defaultTimeout):
+    def skill(self, timeout: Optional[float] = None):
+        timeout = default_timeout() if timeout is None else timeout
         prompt = "请选择你要杀死的玩家，你有%d秒时间进行决定\n" % (int(timeout), )
         return SkilledPerson.skill(self, prompt, timeout)
 
@@ -588,11 +587,12 @@ class Guard(SkilledPerson):
     Attributes and methods are inherited from class SkilledPerson.
     """
 
-    def __init__(self, id: int, connection: socket.socket):
+    def __init__(self, id: int, connection: PlayerConnection):
         super(Guard, self).__init__(id, connection)
         self.type = 4
 
-    def skill(self, timeout: float = defaultTimeout):
+    def skill(self, timeout: Optional[float] = None):
+        timeout = default_timeout() if timeout is None else timeout
         prompt = "请选择你要守卫的玩家，你有%d秒时间进行决定\n" % (int(timeout), )
         return SkilledPerson.skill(self, prompt, timeout)
 
@@ -604,7 +604,7 @@ class Idiot(SkilledPerson):
     Attributes and methods are inherited from class SkilledPerson.
     """
 
-    def __init__(self, id: int, connection: socket.socket):
+    def __init__(self, id: int, connection: PlayerConnection):
         super(Idiot, self).__init__(id, connection)
         self.type = 5
 
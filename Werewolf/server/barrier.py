@@ -0,0 +1,211 @@
+from threading import Condition, Thread
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from ..WP import ChunckedData
+from .engine import PendingPacket
+from .tally import Tally
+
+Quorum = Callable[[Dict[Hashable, Optional[ChunckedData]], int], bool]
+
+
+def everyone(results: Dict[Hashable, Optional[ChunckedData]], waiting: int) -> bool:
+    """
+    The phase is complete when every respondent has replied, is disconnected or is out of time.
+    """
+    return waiting == 0
+
+
+def atLeast(count: int) -> Quorum:
+    """
+    The phase is complete when `count` replies are received.
+    """
+    def quorum(results: Dict[Hashable, Optional[ChunckedData]], waiting: int) -> bool:
+        return sum(_ is not None for _ in results.values()) >= count
+    return quorum
+
+
+def fraction(value: float) -> Quorum:
+    """
+    The phase is complete when the replies received are at least `value` of the respondents.
+    """
+    def quorum(results: Dict[Hashable, Optional[ChunckedData]], waiting: int) -> bool:
+        return sum(_ is not None for _ in results.values()) >= value * (len(results) + waiting)
+    return quorum
+
+
+def decisive(choice: Callable[[ChunckedData], Any]) -> Quorum:
+    """
+    The phase is complete when the votes still expected cannot change the result, each respondent has a single vote.
+
+    Parameters:
+
+        choice: the seat chosen by a reply, `None` or 0 for an abstention
+    """
+    def quorum(results: Dict[Hashable, Optional[ChunckedData]], waiting: int) -> bool:
+        votes: Dict[Any, int] = {}
+        for packet in results.values():
+            seat = choice(packet) if packet is not None else None
+            if seat:
+                votes[seat] = votes.get(seat, 0) + 1
+        counts = sorted(votes.values(), reverse=True) + [0, 0]
+        return counts[0] - counts[1] > waiting
+    return quorum
+
+
+def voteChoice(packet: ChunckedData) -> Optional[int]:
+    """
+    The seat chosen by the reply to a kill or a vote.
+    """
+    if packet.type == -3:
+        return packet.content.get('target') if packet.content.get('action') else None
+    if packet.type == -7:
+        return packet.content.get('candidate') if packet.content.get('vote') else None
+    return None
+
+
+class PhaseBarrier(object):
+    """
+    Wait for the replies of a phase, e.g. a vote, until the quorum is reached.
+
+    The phase is complete when every respondent has replied, is disconnected or is out of time, or earlier if the quorum says so. The requests still pending are then cancelled, so the phase is not gated on the slowest player.
+
+    Initialization:
+
+        quorum: the rule completing the phase early, called with the replies received, `None` for a failed request, and the number of respondents still waited for. `everyone` by default
+
+    Methods:
+
+        PhaseBarrier.add(): wait for the reply of a respondent
+        PhaseBarrier.start(): run a request in a thread and wait for the reply it returns, e.g. `Wolf.kill()`
+        PhaseBarrier.wait(): block until the phase is complete
+        PhaseBarrier.getResult(): the reply of a respondent
+    """
+
+    def __init__(self, quorum: Quorum = everyone):
+        self.quorum: Quorum = quorum
+        self.keys: List[Hashable] = []
+        self.results: Dict[Hashable, Optional[ChunckedData]] = {}
+        self.pending: Dict[Hashable, PendingPacket] = {}
+        self.cancellers: Dict[Hashable, Callable[[], None]] = {}
+        self.waiting: int = 0
+        self.completed: bool = False
+        self.armed: bool = False    # The quorum is checked once all the respondents are added, in `wait()`
+        self.condition: Condition = Condition()
+
+    def __len__(self) -> int:
+        return len(self.results) + self.waiting
+
+    def add(self, key: Hashable, pending: Optional[PendingPacket]):
+        """
+        Wait for a reply. A `None` request, e.g. a player with nothing to do, counts as a failed request.
+        """
+        with self.condition:
+            self.keys.append(key)
+            self.waiting += 1
+        self._attach(key, pending)
+
+    def _attach(self, key: Hashable, pending: Optional[PendingPacket]):
+        if pending is None:
+            self._onDone(key, None)
+            return
+        with self.condition:
+            self.pending[key] = pending
+        pending.future.add_done_callback(
+            lambda future: self._onDone(key, pending.getResult()))
+
+    def start(self, key: Hashable, func: Callable[..., Optional[PendingPacket]], *args: Any, cancel: Optional[Callable[[], None]] = None, **kwargs: Any) -> Thread:
+        """
+        Run the request in a daemon thread and wait for the reply it returns.
+
+        Parameters:
+
+            cancel: called to interrupt the request when the phase is complete, e.g. `PlayerConnection.cancelPending`
+        """
+        with self.condition:
+            self.keys.append(key)
+            self.waiting += 1
+            if cancel is not None:
+                self.cancellers[key] = cancel
+
+        def run():
+            pending: Optional[PendingPacket] = None
+            try:
+                pending = func(*args, **kwargs)
+            finally:
+                self._attach(key, pending)
+
+        thread = Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def _onDone(self, key: Hashable, result: Optional[ChunckedData]):
+        with self.condition:
+            if key in self.results or self.completed:
+                return
+            self.results[key] = result
+            self.pending.pop(key, None)
+            self.waiting -= 1
+            if self.armed and self._isComplete():
+                self.completed = True
+                self.condition.notify_all()
+
+    def _isComplete(self) -> bool:
+        return self.waiting == 0 or self.quorum(self.results, self.waiting)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the phase is complete, the requests still pending are cancelled.
+
+        Returns:
+
+            bool, `False` if the timeout expires before the phase is complete
+        """
+        with self.condition:
+            self.armed = True
+            self.completed = self.completed or self._isComplete()
+            self.condition.wait_for(lambda: self.completed, timeout)
+            done = self._isComplete()
+            self.completed = True
+            pending = list(self.pending.values())
+            cancellers = [self.cancellers[_] for _ in self.cancellers if _ not in self.results]
+        for _ in pending:
+            _.future.cancel()
+        for cancel in cancellers:
+            cancel()
+        return done
+
+    def getResult(self, key: Hashable) -> Optional[ChunckedData]:
+        """
+        The reply of the respondent, `None` if the request failed or the phase was completed without it.
+        """
+        return self.results.get(key)
+
+    def replies(self) -> List[ChunckedData]:
+        """
+        The replies received, in the order of the respondents added.
+        """
+        return [self.results[_] for _ in self.keys if self.results.get(_) is not None]
+
+    def ballots(self) -> List[List[Any]]:
+        """
+        The respondents who replied to a kill or a vote and the seats they chose, `None` for an abstention, in the order of the respondents added.
+        """
+        return [[key, voteChoice(self.results[key])] for key in self.keys if self.results.get(key) is not None]
+
+    def tally(self, seats: int, valid: Any, police: Hashable = None) -> Tally:
+        """
+        Count the votes received, the vote of the respondent `police` weighs 1.5.
+        """
+        ret = Tally(seats, valid)
+        for key in self.keys:
+            packet = self.results.get(key)
+            if packet is None:
+                continue
+            seat = voteChoice(packet)
+            if seat is None:
+                continue
+            if police is not None and key == police:
+                ret.addPolice(seat)
+            else:
+                ret.add(seat)
+        return ret
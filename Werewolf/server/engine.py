@@ -0,0 +1,536 @@
+import asyncio
+import threading
+from collections import deque
+from itertools import count
+from time import perf_counter
+from concurrent.futures import CancelledError, Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Coroutine, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from ..WP.api import ChunckedData, FrameBuffer, PacketDecodeError, PacketFrameError, ReceiveTimeoutError, RECV_BUFSIZE, encodeShared, groupByCodec
+
+
+class PendingPacket(object):
+    """
+    The packet to be received from a player, returned by the request methods of `Person`.
+
+    The interface is compatible with `ReceiveThread`, but no thread is started: the packet is read by the event loop of the engine.
+
+    Methods:
+
+        PendingPacket.join(): block until the packet is received or the timeout expires
+        PendingPacket.is_alive(): whether the packet is still being waited for
+        PendingPacket.getResult(): get the packet received
+
+    Notice:
+
+        **getResult() returns `None` if the timeout expires, the connection is lost or the packet cannot be decoded, the reason is kept in `exception`.**
+    """
+
+    def __init__(self, future: Future, timeout: float = 0, requestId: Optional[int] = None):
+        self.future: Future = future
+        self.timeout: float = timeout
+        self.requestId: Optional[int] = requestId
+        self.exception: Optional[BaseException] = None
+
+    def start(self):
+        """
+        Kept for compatibility with `ReceiveThread`, the packet is already being waited for.
+        """
+        pass
+
+    def join(self, timeout: Optional[float] = None):
+        try:
+            self.future.exception(timeout)
+        except (CancelledError, FutureTimeoutError):
+            pass
+
+    def is_alive(self) -> bool:
+        return not self.future.done()
+
+    def getResult(self) -> Optional[ChunckedData]:
+        if not self.future.done():
+            return None
+        try:
+            return self.future.result()
+        except CancelledError as e:
+            self.exception = e
+        except (asyncio.TimeoutError, FutureTimeoutError):
+            self.exception = ReceiveTimeoutError(self.timeout)
+        except (ConnectionError, OSError, EOFError, PacketDecodeError, PacketFrameError) as e:
+            # A packet that cannot be decoded breaks the stream, the connection is treated as lost
+            self.exception = e
+        return None
+
+
+class Inbox(object):
+    """
+    The packets received from a client and not read yet, by type. Used in the event loop only.
+
+    A read waits for a packet of the expected types, so a late reply of a type is never taken by a request expecting another type. The packets of a type are kept in the order received, at most `maxlen` of them.
+
+    The replies carry the `requestId` of their request. A reply is kept only while its request is outstanding, see `open()`: the replies to the requests retired, timed out or already answered are dropped.
+
+    Attributes:
+
+        requests: dict, the outstanding requests, the request ID and the types of the reply
+        dropped: int, the number of stale replies dropped
+
+    Methods:
+
+        Inbox.put(): add a packet received, passed to the oldest read waiting for it
+        Inbox.fail(): the connection is lost, the reads fail with the error after the packets received
+        Inbox.open(): start a request, the earlier requests expecting the same types are retired
+        Inbox.wait(): register a read of the first packet of the types, returns the future of the packet
+        Inbox.take(): the coroutine waiting for a read registered, a packet read too late is kept for the next read
+        Inbox.get(): the coroutine reading the first packet of the types
+    """
+
+    def __init__(self, maxlen: int = 64):
+        self.maxlen: int = maxlen
+        self.packets: Dict[int, Deque[Tuple[int, ChunckedData]]] = {}
+        self.waiters: List[Tuple[Optional[Tuple[int, ...]], Optional[int], asyncio.Future]] = []
+        self.requests: Dict[int, Tuple[int, ...]] = {}
+        self.dropped: int = 0
+        self.error: Optional[BaseException] = None
+        self.count: int = 0     # The number of packets received, the order of the packets across the types
+
+    @staticmethod
+    def _matches(packet: ChunckedData, types: Optional[Tuple[int, ...]], requestId: Optional[int]) -> bool:
+        # A reply is read only by its request, the other packets by type
+        if types is not None and packet.type not in types:
+            return False
+        replyTo = packet.content.get('requestId')
+        return replyTo is None or replyTo == requestId
+
+    def put(self, packet: ChunckedData):
+        replyTo = packet.content.get('requestId')
+        if replyTo is not None and packet.type not in self.requests.get(replyTo, ()):
+            self.dropped += 1
+            return
+        for waiter in self.waiters:
+            types, requestId, future = waiter
+            if not future.done() and self._matches(packet, types, requestId):
+                self.waiters.remove(waiter)
+                future.set_result(packet)
+                return
+        self.count += 1
+        self.packets.setdefault(packet.type, deque(maxlen=self.maxlen)).append(
+            (self.count, packet))
+
+    def fail(self, error: BaseException):
+        self.error = error
+        for types, requestId, future in self.waiters:
+            if not future.done():
+                future.set_exception(error)
+        self.waiters.clear()
+
+    def open(self, requestId: int, types: Iterable[int]):
+        """
+        Start a request waiting for a reply of the types.
+
+        A player answers a single request of a kind at a time: the earlier requests expecting the same types are retired, their replies queued are dropped and their reads still waiting are cancelled, so a read left over from a request that timed out does not take the next packet.
+        """
+        types = tuple(types)
+        for other, otherTypes in list(self.requests.items()):
+            if any(_ in otherTypes for _ in types):
+                del self.requests[other]
+        for packetType in types:
+            self.dropped += len(self.packets.pop(packetType, ()))
+        for waiter in list(self.waiters):
+            waiterTypes, waiterId, future = waiter
+            if waiterTypes is None or any(_ in waiterTypes for _ in types):
+                self.waiters.remove(waiter)
+                future.cancel()
+        self.requests[requestId] = types
+
+    def _pop(self, types: Optional[Tuple[int, ...]], requestId: Optional[int]) -> Optional[ChunckedData]:
+        first: Optional[Deque[Tuple[int, ChunckedData]]] = None
+        for packetType, queue in self.packets.items():
+            if queue and self._matches(queue[0][1], types, requestId) and \
+                    (first is None or queue[0][0] < first[0][0]):
+                first = queue
+        return first.popleft()[1] if first is not None else None
+
+    def wait(self, types: Optional[Iterable[int]] = None, requestId: Optional[int] = None) -> asyncio.Future:
+        """
+        Register a read of the first packet of the types, of any type if `None`, and of the reply to the request `requestId`. The read is registered at once, so it is ordered with `open()`.
+        """
+        types = tuple(types) if types is not None else None
+        future = asyncio.get_running_loop().create_future()
+        packet = self._pop(types, requestId)
+        if packet is not None:
+            future.set_result(packet)
+        elif self.error is not None:
+            future.set_exception(self.error)
+        else:
+            self.waiters.append((types, requestId, future))
+        return future
+
+    async def take(self, future: asyncio.Future, timeout: float = 0, requestId: Optional[int] = None) -> ChunckedData:
+        """
+        Wait for a read registered by `wait()`, 0 for no time limit. The request is closed when its reply is read or the read fails.
+        """
+        try:
+            if timeout:
+                packet = await asyncio.wait_for(future, timeout)
+            else:
+                packet = await future
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # The time is up when the packet is just passed to the read, it is kept for the next read
+                packet = future.result()
+                self.packets.setdefault(packet.type, deque(maxlen=self.maxlen)).appendleft((0, packet))
+            else:
+                self.requests.pop(requestId, None)
+            raise
+        finally:
+            for waiter in self.waiters:
+                if waiter[2] is future:
+                    self.waiters.remove(waiter)
+                    break
+        if packet.content.get('requestId') is not None:
+            self.requests.pop(packet.content['requestId'], None)
+        return packet
+
+    async def get(self, types: Optional[Iterable[int]] = None, timeout: float = 0) -> ChunckedData:
+        """
+        Read the first packet of the types, of any type if `None`.
+        """
+        return await self.take(self.wait(types), timeout)
+
+    def __len__(self) -> int:
+        return sum(len(_) for _ in self.packets.values())
+
+
+class PlayerConnection(object):
+    """
+    The connection to a client, driven by the event loop of an `Engine`.
+
+    The interface used by `Person` is compatible with `socket.socket`: `ChunckedData.send()` writes to the connection through `sendall()`, and the connection has `getsockname()`, `getpeername()` and `close()`.
+
+    After the handshake, a single reader task decodes all packets from the client. The packets with a handler in `handlers` (e.g. the self-explosion) are passed to the handler in the event loop, the others are put in the inbox by type and returned by `read()`.
+
+    Methods:
+
+        PlayerConnection.sendall(): write the data to the client, does not block
+        PlayerConnection.receive(): read a packet of the expected types from the client with the given timeout
+        PlayerConnection.newRequest(): get the ID of a new request, the stale replies to the earlier requests are dropped
+        PlayerConnection.read(): the coroutine reading a packet, used in the event loop
+        PlayerConnection.setHandler(): handle a packet type in the event loop as soon as it is received
+        PlayerConnection.cancelPending(): stop waiting for the packets requested, e.g. when the phase is interrupted
+    """
+
+    def __init__(self, engine: 'Engine', reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.engine: Engine = engine
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self.buffer: FrameBuffer = FrameBuffer()
+        self.inbox: Inbox = Inbox()
+        self.handlers: Dict[int, Callable[[ChunckedData], None]] = {}
+        self.readerTask: Optional[asyncio.Task] = None
+        self.pending: Set[Future] = set()
+        self.requestIds: Iterator[int] = count(1)
+        self.sockname: Tuple[Any, ...] = writer.get_extra_info('sockname')
+        self.peername: Tuple[Any, ...] = writer.get_extra_info('peername')
+
+    def getsockname(self) -> Tuple[Any, ...]:
+        return self.sockname
+
+    def getpeername(self) -> Tuple[Any, ...]:
+        return self.peername
+
+    def _write(self, data: bytes):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    def sendall(self, data: bytes):
+        """
+        Schedule the data to be written, the order of the calls is preserved.
+        """
+        self.engine.loop.call_soon_threadsafe(self._write, data)
+
+    async def _readFrame(self) -> ChunckedData:
+        frame = self.buffer.pop()
+        while frame is None:
+            data = await self.reader.read(RECV_BUFSIZE)
+            if not data:
+                raise ConnectionResetError(
+                    "The connection is closed by the peer.")
+            self.buffer.feed(data)
+            frame = self.buffer.pop()
+        return ChunckedData.fromFrame(frame)
+
+    async def _readLoop(self):
+        try:
+            while True:
+                packet = await self._readFrame()
+                handler = self.handlers.get(packet.type)
+                if handler is not None:
+                    handler(packet)
+                else:
+                    self.inbox.put(packet)
+        except Exception as e:
+            # The error is kept in the inbox, and raised by every read after the packets received
+            self.inbox.fail(e)
+
+    def startReading(self):
+        """
+        Start the reader task, called in the event loop after the handshake.
+        """
+        if self.readerTask is None:
+            self.readerTask = self.engine.loop.create_task(self._readLoop())
+
+    def setHandler(self, packetType: int, handler: Callable[[ChunckedData], None]):
+        """
+        Pass the packets of the type to the handler instead of the inbox, the handler is called in the event loop.
+        """
+        self.handlers[packetType] = handler
+
+    async def read(self, types: Optional[Iterable[int]] = None) -> ChunckedData:
+        """
+        Read a complete packet of the types from the client, of any type if `None`.
+        """
+        return await self.inbox.get(types)
+
+    def _startReceive(self, future: Future, timeout: float, types: Optional[Tuple[int, ...]], requestId: Optional[int]):
+        if future.cancelled():
+            return
+        task = self.engine.loop.create_task(
+            self.inbox.take(self.inbox.wait(types, requestId), timeout, requestId))
+
+        def onCancel(done: Future):
+            if done.cancelled():
+                self.engine.loop.call_soon_threadsafe(task.cancel)
+
+        def onDone(task: asyncio.Task):
+            if task.cancelled():
+                future.cancel()
+            elif not future.set_running_or_notify_cancel():
+                return
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        future.add_done_callback(onCancel)
+        task.add_done_callback(onDone)
+
+    def receive(self, timeout: float = 0, types: Optional[Iterable[int]] = None, requestId: Optional[int] = None) -> PendingPacket:
+        """
+        Read a packet from the client.
+
+        The read is registered in the order of the calls to `sendall()` and `newRequest()`.
+
+        Parameters:
+
+            timeout: float, time to wait for the client, 0 for no limit
+            types: the types of the packets expected, e.g. `(-7, )` for a vote, any type if `None`
+            requestId: int, the request the reply is expected to, see `newRequest()`
+
+        Returns:
+
+            PendingPacket, the packet to be received
+        """
+        future: Future = Future()
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        self.engine.loop.call_soon_threadsafe(
+            self._startReceive, future, timeout, tuple(types) if types is not None else None, requestId)
+        return PendingPacket(future, timeout, requestId)
+
+    def newRequest(self, types: Iterable[int]) -> int:
+        """
+        Get the ID of a new request expecting a reply of the types, the ID is sent in the `requestId` field of the request. The request is opened in the order of the calls to `sendall()`, see `Inbox.open()`.
+        """
+        requestId = next(self.requestIds)
+        self.engine.loop.call_soon_threadsafe(self.inbox.open, requestId, tuple(types))
+        return requestId
+
+    def cancelPending(self):
+        """
+        Cancel the packets still being waited for, so that a response to an interrupted request is not taken by a stale reader.
+        """
+        for future in list(self.pending):
+            future.cancel()
+
+    def _close(self):
+        if self.readerTask is not None:
+            self.readerTask.cancel()
+        self.writer.close()
+
+    def close(self):
+        self.engine.loop.call_soon_threadsafe(self._close)
+
+
+class LatencyStats(object):
+    """
+    The latencies of the recent broadcasts, from the call of `Engine.broadcast()` to the data handed to the transports of all the recipients.
+
+    Attributes:
+
+        count: int, the number of broadcasts
+        encodes: int, the number of packets encoded, one for each codec used by the recipients
+        samples: deque, the recent latencies in seconds
+    """
+
+    def __init__(self, size: int = 10000):
+        self.count: int = 0
+        self.encodes: int = 0
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, latency: float):
+        self.count += 1
+        self.samples.append(latency)
+
+    def percentiles(self, ps: Sequence[float] = (50, 90, 99)) -> List[float]:
+        """
+        Get the percentiles of the recent latencies in seconds, nearest-rank method.
+        """
+        ordered = sorted(self.samples)
+        if not ordered:
+            return [0.0 for p in ps]
+        return [ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in ps]
+
+    def __str__(self):
+        p50, p90, p99 = self.percentiles()
+        return "%d broadcasts, %d encodes, p50 %.3fms, p90 %.3fms, p99 %.3fms" % (
+            self.count, self.encodes, p50 * 1000, p90 * 1000, p99 * 1000)
+
+
+class Engine(object):
+    """
+    The asyncio engine performing the network I/O of the server.
+
+    The event loop runs in a background thread, so the game logic running in other threads is not changed: the requests are sent without blocking and the responses are waited for through `PendingPacket` objects. An engine can be shared by many games.
+
+    Methods:
+
+        Engine.serve(): listen on the given address
+        Engine.startServing(), Engine.stopServing(): start or stop accepting clients
+        Engine.call(): run a coroutine in the event loop
+        Engine.broadcast(): send a packet to many connections, the packet is encoded once for each codec
+        Engine.close(): stop the event loop
+    """
+
+    def __init__(self):
+        self.loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        self.servers: List[asyncio.AbstractServer] = []
+        self.broadcastStats: LatencyStats = LatencyStats()
+        self.thread: threading.Thread = threading.Thread(
+            target=self._run, name="Werewolf engine", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def call(self, coroutine: Coroutine) -> Future:
+        """
+        Run the coroutine in the event loop, can be called from any thread.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def _fanout(self, groups: List[Tuple[bytes, List[PlayerConnection]]], start: float):
+        for data, connections in groups:
+            for connection in connections:
+                connection._write(data)
+        self.broadcastStats.add(perf_counter() - start)
+
+    def broadcast(self, packet: ChunckedData, connections: Iterable[PlayerConnection]):
+        """
+        Send the packet to the connections without blocking.
+
+        The packet is encoded once for each codec used by the connections, the frames do not use the deflate streams of the connections, so the same bytes are written to all of them in a single callback of the event loop.
+        """
+        start = perf_counter()
+        groups = [
+            (encodeShared(packet, codec), group)
+            for codec, group in groupByCodec(connections).items()
+        ]
+        self.broadcastStats.encodes += len(groups)
+        self.loop.call_soon_threadsafe(self._fanout, groups, start)
+
+    def serve(
+        self,
+        host: Union[None, str, List[str]],
+        port: int,
+        onConnect: Callable[[PlayerConnection, ChunckedData], None],
+        handshakeTimeout: float = 120,
+        startServing: bool = True
+    ) -> asyncio.AbstractServer:
+        """
+        Listen for clients on the given address.
+
+        Parameters:
+
+            host: the address(es) to listen on, `None` for all interfaces
+            port: int, the port to listen on
+            onConnect: called in the event loop with the connection and its first packet
+            handshakeTimeout: float, time to wait for the first packet
+            startServing: bool, if `False`, the port is bound but the clients are not accepted until `startServing()` is called
+
+        Returns:
+
+            the asyncio server, the ports actually bound are in `server.sockets`
+        """
+        async def handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            connection = PlayerConnection(self, reader, writer)
+            try:
+                packet = await asyncio.wait_for(connection._readFrame(), handshakeTimeout)
+            except (asyncio.TimeoutError, ConnectionError, OSError, PacketDecodeError, PacketFrameError):
+                writer.close()
+                return
+            onConnect(connection, packet)
+            connection.startReading()
+
+        async def start() -> asyncio.AbstractServer:
+            return await asyncio.start_server(handler, host, port, start_serving=startServing)
+
+        server = self.call(start()).result()
+        self.servers.append(server)
+        return server
+
+    def startServing(self, server: asyncio.AbstractServer):
+        """
+        Start accepting clients on a server created with `startServing=False`.
+        """
+        self.call(server.start_serving()).result()
+
+    def stopServing(self, server: asyncio.AbstractServer):
+        """
+        Stop accepting new clients on the server, the connections accepted are not affected.
+        """
+        self.loop.call_soon_threadsafe(server.close)
+        if server in self.servers:
+            self.servers.remove(server)
+
+    def close(self):
+        for server in self.servers:
+            self.loop.call_soon_threadsafe(server.close)
+        self.servers.clear()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        # Finish the readers of the connections still open
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        async def finish():
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.loop.run_until_complete(finish())
+        self.loop.close()
+
+
+_defaultEngine: Optional[Engine] = None
+_defaultEngineLock: threading.Lock = threading.Lock()
+
+
+def getEngine() -> Engine:
+    """
+    Get the engine shared by the games in the process, the engine is created on the first call.
+    """
+    global _defaultEngine
+    with _defaultEngineLock:
+        if _defaultEngine is None:
+            _defaultEngine = Engine()
+        return _defaultEngine
@@ -0,0 +1,135 @@
+import json
+import os
+import struct
+import threading
+import zlib
+from time import monotonic, time
+from typing import Any, BinaryIO, Dict, Iterator
+
+# The length of the payload and its CRC-32, in network byte order
+_header: struct.Struct = struct.Struct('!II')
+
+
+class Journal(object):
+    """
+    An append-only file of the events of the games, shared by the games of a process.
+
+    Each record is a header of 8 bytes, the length of the payload and its CRC-32, followed by the payload: the event dumped to compact JSON and encoded in UTF-8. The records are never rewritten, so the file can be read while the games are running, see `readJournal()`.
+
+    The game only appends the record to a buffer in memory. A single thread of the journal writes the buffer and syncs the file `syncInterval` seconds after the first record buffered, or as soon as the buffer exceeds `bufferSize`, so the game never waits for the disk and the thread sleeps while nothing is recorded. A crash loses at most the records of the last interval, the torn record at the end of the file is skipped by `readJournal()`.
+
+    Initialization:
+
+        path: str, the file, created if it does not exist, the records are appended to it
+        bufferSize: int, the size of the buffer in bytes written at once
+        syncInterval: float, the time in seconds a record may wait in the buffer
+
+    Attributes:
+
+        records: int, the number of records appended since the journal is opened
+
+    Methods:
+
+        Journal.record(): append an event
+        Journal.flush(): write the records buffered and sync the file, blocks until the data is on the disk
+        Journal.close(): flush the journal and close the file
+    """
+
+    def __init__(self, path: str, bufferSize: int = 65536, syncInterval: float = 1.0):
+        self.path: str = path
+        self.file: BinaryIO = open(path, 'ab')
+        self.bufferSize: int = bufferSize
+        self.syncInterval: float = syncInterval
+        self.buffer: bytearray = bytearray()
+        self.records: int = 0
+        self.closed: bool = False
+        self.condition: threading.Condition = threading.Condition()
+        # Keeps the records in order when `flush()` is called while the thread is writing
+        self.writeLock: threading.Lock = threading.Lock()
+        self.thread: threading.Thread = threading.Thread(
+            target=self._run, name="Werewolf journal", daemon=True)
+        self.thread.start()
+
+    def record(self, event: str, **fields: Any):
+        """
+        Append an event, the fields must be serializable to JSON. The time of the event is added as `time` if not given.
+
+        Raises `ValueError` if the journal is closed.
+        """
+        fields['event'] = event
+        fields.setdefault('time', time())
+        payload = json.dumps(fields, ensure_ascii=False,
+                             separators=(',', ':')).encode('utf-8')
+        with self.condition:
+            if self.closed:
+                raise ValueError("The journal is closed")
+            wasEmpty = not self.buffer
+            self.buffer += _header.pack(len(payload), zlib.crc32(payload))
+            self.buffer += payload
+            self.records += 1
+            if wasEmpty or len(self.buffer) >= self.bufferSize:
+                self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed and not self.buffer:
+                    self.condition.wait()
+                deadline = monotonic() + self.syncInterval
+                while not self.closed and len(self.buffer) < self.bufferSize:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if self.closed:
+                    # The records left are written by `close()`
+                    return
+            try:
+                self.flush()
+            except OSError as e:
+                print("Journal write failed: %r" % (e, ))
+
+    def flush(self):
+        with self.writeLock:
+            with self.condition:
+                data = bytes(self.buffer)
+                self.buffer.clear()
+            if not data or self.file.closed:
+                return
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+
+    def __enter__(self) -> 'Journal':
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+
+def readJournal(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read the events of a journal in the order they are recorded.
+
+    The reading stops at the first record torn or corrupted, e.g. the last record of a process killed while writing.
+    """
+    with open(path, 'rb') as file:
+        while True:
+            header = file.read(_header.size)
+            if len(header) < _header.size:
+                return
+            length, checksum = _header.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                return
+            yield json.loads(payload.decode('utf-8'))
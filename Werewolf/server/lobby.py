@@ -0,0 +1,125 @@
+from threading import Lock, Thread
+from typing import Dict, Optional
+
+from ..WP import ChunckedData
+from .engine import Engine, PlayerConnection, getEngine
+from .journal import Journal
+from .logic import Game
+
+
+class Lobby:
+    """
+    # Lobby - hosts many games in a process
+
+    All clients connect to a single listening port, and are routed to a room by the `room` field of the `Establish` packet. Each room is a `Game` sharing the engine of the lobby, so the rooms do not need ports of their own.
+
+    # Attributes
+
+    - engine : `Engine`,           the asyncio engine performing the network I/O
+    - server : `asyncio.Server`,   the server accepting the clients
+    - port   : `int`,              the port the lobby is listening on
+    - rooms  : `dict`,             the room ID and the game in the room
+    - threads: `dict`,             the room ID and the thread running the game
+    - journal: `Journal`,          the journal shared by the rooms, `None` if the events are not recorded
+
+    # Methods
+
+    - `createRoom()`: Create a new room
+    - `launchRoom()`: Run the game in a room in a new thread
+    - `removeRoom()`: Remove a room, the players connected later are refused
+    - `close()`: Stop accepting new clients
+    """
+
+    def __init__(self, ipv4: str = '', ipv6: str = '', port: int = 21567, engine: Optional[Engine] = None, journal: Optional[Journal] = None):
+        """
+        Initialize a new lobby
+
+        # Parameter
+
+        - ipv4, ipv6: `str`, the IP addresses of the server, listens on all interfaces if both are empty
+        - port: `int`, the port shared by all rooms
+        - engine: `Engine`, the engine performing the network I/O, the engine shared in the process is used by default
+        - journal: `Journal`, the events of the games in the rooms are recorded in it
+        """
+        self.engine: Engine = engine if engine is not None else getEngine()
+        self.journal: Optional[Journal] = journal
+        self.rooms: Dict[int, Game] = {}
+        self.threads: Dict[int, Thread] = {}
+        self.lock: Lock = Lock()
+        self.server = self.engine.serve(
+            [_ for _ in (ipv4, ipv6) if _] or None,
+            port,
+            self._onConnect
+        )
+        self.port: int = self.server.sockets[0].getsockname()[1]
+
+    def _onConnect(self, connection: PlayerConnection, data: ChunckedData):
+        """
+        Called by the engine when a client is connected, the client is refused if the room is not an `int` or does not exist.
+        """
+        room = data.content.get('room', 0)
+        if type(room) is not int:
+            connection.close()
+            return
+        with self.lock:
+            game = self.rooms.get(room)
+        if game is None:
+            connection.close()
+            return
+        game._onConnect(connection, data)
+
+    def createRoom(self, roomID: int, playerCount: int, identityList: Dict[str, int]) -> Game:
+        """
+        Create a new room
+
+        # Parameter
+
+        - roomID: `int`, the ID of the room, sent by the client in the `Establish` packet
+        - playerCount: `int`, the number of players in the room
+        - identityList: `dict`, the identity configuration, see `Game.setIdentityList()`
+
+        # Return
+
+        The `Game` object in the room
+        """
+        game = Game(playerCount, port=None, engine=self.engine, journal=self.journal)
+        game.setIdentityList(**identityList)
+        with self.lock:
+            assert roomID not in self.rooms, "The room already exists"
+            self.rooms[roomID] = game
+        return game
+
+    def _runRoom(self, roomID: int):
+        game = self.rooms[roomID]
+        try:
+            game.startListening()
+            game.activate()
+            game.launch()
+        finally:
+            self.removeRoom(roomID)
+            # The players are disconnected even if the game is broken
+            for player in game.allPlayer.values():
+                player.socket.close()
+
+    def launchRoom(self, roomID: int) -> Thread:
+        """
+        Wait for the players and run the game in a new thread, the room is removed after the game is finished.
+        """
+        thread = Thread(
+            target=self._runRoom,
+            args=(roomID, ),
+            name="Room %d" % (roomID, ),
+            daemon=True
+        )
+        with self.lock:
+            self.threads[roomID] = thread
+        thread.start()
+        return thread
+
+    def removeRoom(self, roomID: int):
+        with self.lock:
+            self.rooms.pop(roomID, None)
+            self.threads.pop(roomID, None)
+
+    def close(self):
+        self.engine.stopServing(self.server)
@@ -1,13 +1,17 @@
 from random import randint, shuffle
-import socket
-from socket import AF_INET, SOCK_STREAM, AF_INET6
-from threading import Thread
+from threading import Event, Lock, Thread
 from typing import Any, Dict, Tuple
 from time import sleep
+from uuid import uuid4
 
 from .abstraction import *
-from ..WP import ChunckedData, _recv, KillableThread
+from ..WP import CancelToken, CancellationError, ChunckedData, negotiateCodec, setConnectionCodec
+from .engine import Engine, PendingPacket, PlayerConnection, getEngine
 from .util import *
+from .rules import GUARD, PREDICTOR, WITCH, GameState, canShoot, canVote, chooseWolfVictim, resolveExile, resolveNight, speakingOrder
+from .barrier import PhaseBarrier, Quorum, everyone, voteChoice
+from .registry import PlayerRegistry
+from .journal import Journal
 
 
 class Game:
@@ -20,13 +24,17 @@ class Game:
 
     - playerCount : `int`,                the number of the players
     - allPlayer   : `dict`,               the number and the identity of all player.
-    - activePlayer: `dict`,               the number and the identity of remaining player.
+    - activePlayer: `PlayerRegistry`,     the number and the identity of remaining player, indexed by seat, identity and police
     - Key         : `int`,                the identification number of each player (or you can say seat number)
     - Value       : `Any`,                the identity of each player, should be a class in `abstraction.py`
-    - ports       : `list`,               the ports available for communication with the player
+    - engine      : `Engine`,             the asyncio engine performing the network I/O
+    - server      : `asyncio.Server`,     the server accepting the clients
     - running     : `bool`,               the status of the game, can set to `True` when the `identityList` is empty and the length of `activePlayer` equals with `playerCount`
     - identityList: `list`,               used when allocating the user identity
-    - listener    : `IncomingConnection`, the thread for receiving handshakes
+    - playersReady: `Event`,              set when all the identities are allocated
+    - quorums     : `dict`,               the rules completing the phases before every player has replied, by phase: `'election'`, `'vote'` and `'kill'`, see `barrier.py`
+    - journal     : `Journal`,            the journal recording the events of the game, see `record()`
+    - gameId      : `str`,                the identifier of the game in the journal
 
     # Methods
 
@@ -36,20 +44,32 @@ class Game:
     - `deactivate()`: Set the `running` attribute to `False` to prevent further modification
     - `setIdentityList()`: Generate an identity configuration according to the given parameter
     - `addPlayer()`: add a player to the game after receiving a packet
+    - `record()`: Record an event of the game in the journal
     - `checkStatus()`: Check whether the stopping criterion is triggered
       - Stopping criterion: either werewolves, villagers, skilled villagers are all eliminated
     - ``
     """
 
-    def __init__(self, playerCount: int, ipv4: str = '', ipv6: str = '', port: int = 21567):
+    # The phases are complete when every player has replied, is disconnected or is out of time.
+    # `decisive(voteChoice)` stops the wolves as soon as the remaining votes cannot change the victim, the late reply of a wolf cut off carries the ID of a cancelled request and is dropped.
+    defaultQuorums: Dict[str, Quorum] = {
+        'election': everyone,
+        'vote': everyone,
+        'kill': everyone
+    }
+
+    def __init__(self, playerCount: int, ipv4: str = '', ipv6: str = '', port: Optional[int] = 21567, engine: Optional[Engine] = None, debug: bool = False, journal: Optional[Journal] = None):
         """
         Initializa a new game
 
         # Parameter
 
-        - ip: `str`, the IP address of the server
-        - port: `int`, the port of the server, used for listening to the incoming connection
+        - ipv4, ipv6: `str`, the IP addresses of the server, listens on all interfaces if both are empty
+        - port: `int`, the port of the server, used for listening to the incoming connection. If `None`, the game does not listen and the players are routed to the game by a `Lobby`
         - playerCount: `int`, the number of players in a game
+        - engine: `Engine`, the engine performing the network I/O, the engine shared in the process is used by default
+        - debug: `bool`, check the counters of the players alive against a full scan in `checkStatus()`
+        - journal: `Journal`, the events of the game are recorded in it, nothing is recorded if `None`
 
         # Return
 
@@ -59,28 +79,25 @@ class Game:
         # Attribute initialization
         self.playerCount: int = playerCount
         self.allPlayer: Dict[int, Any] = {}
-        self.activePlayer: Dict[int, Any] = {}
+        self.activePlayer: PlayerRegistry = PlayerRegistry(debug=debug)
         # Network parameters
-        self.port = port
         self.ipv4 = ipv4
         self.ipv6 = ipv6
-        self.socketv4 = socket.socket(AF_INET, socket.SOCK_STREAM)
-        self.socketv4.bind((ipv4, port))
-        self.socketv4.listen(10)
-        self.socketv6 = socket.socket(AF_INET6, socket.SOCK_STREAM)
-        self.socketv6.bind((ipv6, port))
-        self.socketv6.listen(10)
+        self.engine: Engine = engine if engine is not None else getEngine()
+        self.server: Optional[Any] = None
+        self.port: Optional[int] = port
+        if port is not None:
+            self.server = self.engine.serve(
+                [_ for _ in (ipv4, ipv6) if _] or None,
+                port,
+                self._onConnect,
+                startServing=False
+            )
+            self.port = self.server.sockets[0].getsockname()[1]
         # Game initialization parameters
         self.running: bool = False
         self.identityList: List[Any] = []
-        self.listener4: IncomingConnection = IncomingConnection(
-            self.socketv4, self)
-        self.listener6: IncomingConnection = IncomingConnection(
-            self.socketv6, self)
-        # Further initialization
-        if True:  # Used for indention
-            self.listener4.setName("IPV4 incoming connection receiver")
-            self.listener6.setName("IPV6 incoming connection receiver")
+        self.playersReady: Event = Event()
 
         # Game parameters
         self.day: int = 0
@@ -92,6 +109,15 @@ class Game:
         self.hunterStatus: bool = True
         self.kingofwolfStatus: bool = True
         self.explode: Optional[int] = None
+        # The self-explosion received during the day
+        self.explodeLock: Lock = Lock()
+        self.explodeRequest: Optional[int] = None
+        self.dayRunning: bool = False
+        self.dayFinished: Event = Event()
+        self.quorums: Dict[str, Quorum] = dict(self.defaultQuorums)
+        # Journal
+        self.journal: Optional[Journal] = journal
+        self.gameId: str = uuid4().hex
         # Verbose
 
     def startListening(self):
@@ -111,17 +137,22 @@ class Game:
         assert (
             self.identityList
         ), "The identity list must be initialized"  # The identity list should not be empty
-        assert self.listener4.is_alive() == False, "There is already an active listener"
-        assert self.listener6.is_alive() == False, "There is already an active listener"
-        self.listener4.setDaemon(True)
-        self.listener6.setDaemon(True)
-        self.listener4.start()
-        self.listener6.start()
-        while self.identityList:
-            pass
+        if self.server is not None:
+            assert not self.server.is_serving(), "There is already an active listener"
+            self.engine.startServing(self.server)
+        self.playersReady.wait()
         sleep(1)
-        self.listener4.kill()
-        self.listener6.kill()
+        if self.server is not None:
+            self.engine.stopServing(self.server)
+
+    def _onConnect(self, connection: PlayerConnection, data: ChunckedData):
+        """
+        Called by the engine when a client is connected, the client is refused if the game is already full.
+        """
+        if self.running or not self.identityList or data.type != 1:
+            connection.close()
+            return
+        self.addPlayer(connection, data)
 
     def activate(self):
         """
@@ -137,19 +168,39 @@ class Game:
         assert self.day == 0 and self.night == 0
         self.running = True  # 激活游戏，不允许新的玩家进入
         # Check the number of wolves.
-        wolves = []
-        for player in sorted(self.activePlayer.keys()):
-            if isinstance(self.activePlayer[player], Wolf):
-                wolves.append(player)
+        wolves = self.activePlayer.wolves()
         for wolf in wolves:
             for wolf2 in wolves:
                 if wolf == wolf2:
                     continue
                 self.activePlayer[wolf].setPeer(self.activePlayer[wolf2])
+        self.record('start', players=self.playerCount)
 
     def deactivate(self):
         self.running = False  # 游戏结束
 
+    def record(self, event: str, **fields: Any):
+        """
+        Record an event of the game in the journal, with the identifier of the game and the current day and night.
+
+        The events recorded:
+
+        - `seat`: a player joins, `seat` and `identity` code
+        - `start`: the game is activated, the number of `players`
+        - `kill`: the victim chosen by the wolves `target`, 0 if none, and the `ballots` of the wolves
+        - `check`: the predictor at `seat` checks `target`, `good` is whether the target is not a wolf
+        - `saved`, `guarded`, `poisoned`, `killed`: the result of the night for the player at `seat`, see `rules.resolveNight()`
+        - `vote`: the `ballots` of a vote, `[voter, seat]` with `None` for an abstention, the `phase` is `election` or `exile`
+        - `police`: the badge is given to the player at `seat`
+        - `exile`: the player at `seat` is exiled, `idiot` if the player escapes as an idiot
+        - `shot`: the player at `seat` takes `target` with it
+        - `explode`: the wolf at `seat` explodes
+        - `result`: the game is finished, `status` see `checkStatus()`
+        """
+        if self.journal is not None:
+            self.journal.record(event, game=self.gameId,
+                                day=self.day, night=self.night, **fields)
+
     def checkStatus(self) -> int:
         """
         Check whether the game should be stopped
@@ -166,28 +217,49 @@ class Game:
         - `0`: The game continues
         - `1`: The game stops and the villagers win - the wolves are eliminated
         """
-        numVillager, numSkilled, numWolf = 0, 0, 0
-        for player in sorted(self.activePlayer.keys()):
-            if isinstance(self.activePlayer[player], Villager):
-                numVillager += 1
-            elif isinstance(self.activePlayer[player], Wolf):
-                numWolf += 1
-            else:
-                numSkilled += 1
-        if numSkilled > 0 and numVillager > 0 and numWolf > 0:
-            self.status = 0
-            return 0
-        elif numWolf == 0:
-            self.status = 1
-            return 1
-        else:
-            self.status = -1
-            return -1
+        self.status = self.activePlayer.status()
+        return self.status
+
+    def getState(self) -> GameState:
+        """
+        Get the state of the game in the format of the rules core, the rules in `rules.py` are evaluated on it.
+        """
+        state = GameState({
+            id: getIdentityCode(player) for id, player in self.allPlayer.items()
+        })
+        state.alive = set(self.activePlayer.keys())
+        state.police = self.activePlayer.police
+        state.day, state.night = self.day, self.night
+        for player in self.allPlayer.values():
+            if isinstance(player, Witch):
+                state.witchUsed = player.used
+            elif isinstance(player, Idiot):
+                state.idiotUsed = bool(player.used)
+        state.guardedLastNight = self.guardedLastNight
+        state.hunterStatus = self.hunterStatus
+        state.kingStatus = self.kingofwolfStatus
+        return state
+
+    def applyState(self, state: GameState):
+        """
+        Apply the state returned by the rules core, the players alive are managed by the game.
+        """
+        self.day, self.night = state.day, state.night
+        for player in self.allPlayer.values():
+            if isinstance(player, Witch):
+                player.used = state.witchUsed
+            elif isinstance(player, Idiot):
+                player.used = int(state.idiotUsed)
+        self.guardedLastNight = state.guardedLastNight
+        self.hunterStatus = state.hunterStatus
+        self.kingofwolfStatus = state.kingStatus
 
     def broadcast(self, srcPlayer: Any, content: str):
         """
         Send a packet to all the players except the `srcPlayer` (if not `None`)
 
+        The packet is encoded once and written to all the players by the engine, so the addresses in the packet are left empty.
+
         # Parameters
 
         - srcPlayer: the player to skip
@@ -197,11 +269,16 @@ class Game:
 
         None
         """
-        for id in sorted(self.activePlayer.keys()):
-            player = self.activePlayer[id]
-            if player is srcPlayer:
-                continue
-            player.inform(content)
+        packet = ChunckedData.trusted(
+            4, srcAddr='', srcPort=0, destAddr='', destPort=0, content=content)
+        self.engine.broadcast(
+            packet,
+            [
+                self.activePlayer[id].socket
+                for id in self.activePlayer.seats()
+                if self.activePlayer[id] is not srcPlayer
+            ]
+        )
 
     def announceResult(self, status: bool):
         for id in sorted(self.allPlayer.keys()):
@@ -245,7 +322,7 @@ class Game:
                 i + 1
         shuffle(self.identityList)
 
-    def addPlayer(self, connection: socket.socket, data: ChunckedData):
+    def addPlayer(self, connection: PlayerConnection, data: ChunckedData):
         """
         The server add a player to game after receiving a choose seat request.
 
@@ -262,28 +339,36 @@ class Game:
         # `identityList` must be initialized
         assert len(self.identityList) != 0
         # Read the content of the packet
+        codecs = data.content.get('codecs', [])
+        if not isinstance(codecs, list) or not all(isinstance(_, str) for _ in codecs):
+            # A malformed handshake is refused before an identity or a seat is taken
+            connection.close()
+            return
+        codec = negotiateCodec(codecs)
         # Verify the seat is available
         # Randomly allocate seat when the seat chosen is already taken
         id = randint(1, self.playerCount)
-        while id in sorted(self.activePlayer.keys()):
+        while id in self.activePlayer:
             id = randint(1, self.playerCount)
         newplayer = self.identityList.pop()(id=id, connection=connection)
+        connection.setHandler(9, lambda packet: self._onExplode(id, packet))
         self.activePlayer[id] = newplayer
         self.allPlayer[id] = newplayer
         # Send response
         identityCode: int = getIdentityCode(self.activePlayer[id])
         # REVIEW: Print message here.
         print("The player %d get the %d identity" % (id, identityCode))
+        self.record('seat', seat=id, identity=identityCode)
         packet: Dict[str, Any] = getBasePacket(
             newplayer.server, newplayer.client)
         packet["seat"] = id
         packet["identity"] = identityCode
-        sendingThread: Thread = Thread(
-            target=ChunckedData(-1, **
-                                packet).send, args=(self.activePlayer[id].socket,)
-        )
-        sendingThread.setDaemon(True)
-        sendingThread.start()
+        packet["codec"] = codec.name
+        # The response is encoded with the default codec, the negotiated codec is used after that
+        ChunckedData(-1, **packet).send(newplayer.socket)
+        setConnectionCodec(newplayer.socket, codec)
+        if not self.identityList:
+            self.playersReady.set()
 
     def electPolice(self):
         """
@@ -308,28 +393,26 @@ class Game:
         sleep(0.05)
 
         # Ask for election
-        electionCandidate: List[Tuple[int, ReceiveThread]]
-        electionCandidate = [
-            (player, self.activePlayer[player].joinElection())
-            for player
-            in sorted(self.activePlayer.keys())
-        ]
-        for player, recthread in electionCandidate:
-            recthread.join()
+        election = PhaseBarrier(self.quorums['election'])
+        for player in self.activePlayer.seats():
+            election.add(player, self.activePlayer[player].joinElection())
+        election.wait()
         candidate: List[int] = []
-        for player, recthread in electionCandidate:
-            if recthread.getResult() is not None and \
-                    recthread.getResult().content['action'] and \
-                    recthread.getResult().content['target']:
+        for player in election.keys:
+            if election.getResult(player) is not None and \
+                    election.getResult(player).content['action'] and \
+                    election.getResult(player).content['target']:
                 candidate.append(player)
-        current: ReceiveThread
+        del election
+        current: PendingPacket
 
         if not candidate or len(candidate) == len(self.activePlayer):
             self.broadcast(None, "本局游戏没有警长")
             return
         elif len(candidate) == 1:
             self.broadcast(None, "警长是%d号玩家" % (candidate[0], ))
-            self.activePlayer[candidate[0]].police = True
+            self.activePlayer.setPolice(candidate[0])
+            self.record('police', seat=candidate[0])
             return
 
         # Candidate talk in sequence
@@ -356,32 +439,18 @@ class Game:
                     )
 
             # Ask for vote
-            voteThread: List[ReceiveThread] = []
-            thread2: Optional[ReceiveThread] = None
-            for player in sorted(self.activePlayer.keys()):
+            voteThread = PhaseBarrier(self.quorums['vote'])
+            for player in self.activePlayer.seats():
                 if player in candidate:
                     continue  # Candidate cannot vote
-                thread2 = self.activePlayer[player].voteForPolice()
-                if thread2:
-                    voteThread.append(thread2)
-            for thread in voteThread:
-                thread.join()
-            del thread2
+                voteThread.add(player, self.activePlayer[player].voteForPolice(choices=candidate))
+            voteThread.wait()
+            self.record('vote', phase='election', ballots=voteThread.ballots())
 
             # Get the result and count the vote
-            vote: List[int] = []
-            packetContent: Dict[str, Any] = {}
-            for thread in voteThread:
-                if thread.getResult() is not None:
-                    packetContent = thread.getResult().content
-                else:
-                    continue
-                # REVIEW for debugging
-                # print(packetContent)
-                if packetContent['vote'] and packetContent['candidate'] in candidate:
-                    vote.append(packetContent['candidate'])
+            vote = voteThread.tally(self.playerCount, candidate)
 
-            voteResult: Dict[int, float] = mergeVotingResult(vote)
+            voteResult: Dict[int, float] = vote.result()
             self.broadcast(
                 None,
                 "投票结果：%s" % (
@@ -397,17 +466,17 @@ class Game:
                     ),
                 )
             )
-            result: List[int] = getVotingResult(voteResult)
+            result: List[int] = vote.leaders()
             sleep(0.05)
 
             del voteThread
             del vote
-            del packetContent
             del voteResult
 
             if (len(result) == 1):
                 self.broadcast(None, "警长是%d号玩家" % (result[0], ))
-                self.activePlayer[result[0]].police = True
+                self.activePlayer.setPolice(result[0])
+                self.record('police', seat=result[0])
                 return None
             elif i == 0:
                 self.broadcast(
@@ -442,14 +511,14 @@ class Game:
                 default_timeout()
             )
             if retMsg[0] and retMsg[0].getResult() and \
-                    retMsg[0].content['vote'] and \
-                    retMsg[0].content['candidate'] in sorted(self.activePlayer.keys()):
-                self.activePlayer[retMsg[0].content['candidate']].police = True
-            if retMsg[1]:
-                self.broadcast(None, retMsg[1].content['content'])
+                    retMsg[0].getResult().content['vote'] and \
+                    retMsg[0].getResult().content['candidate'] in self.activePlayer:
+                self.activePlayer.setPolice(retMsg[0].getResult().content['candidate'])
+                self.record('police', seat=retMsg[0].getResult().content['candidate'])
+            if retMsg[1] and retMsg[1].getResult():
+                self.broadcast(None, retMsg[1].getResult().content['content'])
             if isinstance(victim, Hunter) or isinstance(victim, KingOfWerewolves):
-                if (self.hunterStatus and isinstance(victim, Hunter)) \
-                        or (self.kingofwolfStatus and isinstance(victim, KingOfWerewolves)):
+                if canShoot(self.getState(), id):
                     gunThread = victim.skill()
                     gunThread.join()
                     if gunThread.getResult() is not None:
@@ -457,9 +526,10 @@ class Game:
                         packetContent = gunThread.getResult().content
                     else:
                         break
-                    if packetContent['action'] and packetContent['target'] in sorted(self.activePlayer.keys()):
+                    if packetContent['action'] and packetContent['target'] in self.activePlayer:
                         self.broadcast(None, "玩家%d被玩家%d杀死"
                                        % (packetContent['target'], id))
+                        self.record('shot', seat=id, target=packetContent['target'])
                         self.activePlayer[
                             packetContent['target']
                         ].informDeath()
@@ -475,7 +545,8 @@ class Game:
                 else:
                     victim.inform("你由于女巫的毒药死亡而不能开枪")
         for victim in self.victim:
-            self.activePlayer.pop(victim)
+            # The exiled player is already removed in the daytime
+            self.activePlayer.pop(victim, None)
         self.victim.clear()
 
     def dayTime(self) -> int:
@@ -508,7 +579,7 @@ class Game:
         self.broadcast(
             None,
             "天亮了\n目前在场的玩家：%s号玩家" % (
-                "号玩家、".join([str(_) for _ in sorted(self.activePlayer.keys())])
+                "号玩家、".join([str(_) for _ in self.activePlayer.seats()])
             )
         )
 
@@ -534,18 +605,11 @@ class Game:
         talkSequence: List[int] = []
         isClockwise: bool = True
         packetContent: Dict[str, Any] = {}
-        policeID: int = 0
-
-        for player in sorted(self.activePlayer.keys()):
-            """
-            Find the police
-            """
-            if self.activePlayer[player].police:
-                policeID = player
+        policeID: int = self.activePlayer.police
 
         startpoint = self.victim[0] \
             if len(self.victim) == 1 \
-            else (policeID if policeID else min(self.activePlayer.keys()))
+            else (policeID if policeID else self.activePlayer.seats()[0])
 
         # Police choose the direction
         if policeID:
@@ -560,8 +624,6 @@ class Game:
         exile: List[int] = []
 
         # active player talk in sequence
-        policeVoteThread: Optional[ReceiveThread] = None
-        policeVote: Optional[int] = None
         for i in range(2):
             """
             Vote for the exile
@@ -574,41 +636,26 @@ class Game:
                     player = self.activePlayer[id]
                     current = player.speak()
                     current.join()
-                    self.broadcast(
-                        player, "%d号玩家发言：\t" % (id,) + current.getResult().content['content'])
+                    if current.getResult() is not None:
+                        self.broadcast(
+                            player, "%d号玩家发言：\t" % (id,) + current.getResult().content['content'])
 
             # Ask for vote
-            voteThread: List[ReceiveThread] = []
-            for id in sorted(self.activePlayer.keys()):
-                if isinstance(self.activePlayer[id], Idiot) and self.activePlayer[id].used:
+            voteThread = PhaseBarrier(self.quorums['vote'])
+            state = self.getState()
+            for id in self.activePlayer.seats():
+                if not canVote(state, id):
                     """
                     An idiot cannot vote
                     """
                     continue
-                if id != policeID:
-                    voteThread.append(self.activePlayer[id].vote())
-                else:
-                    policeVoteThread = self.activePlayer[id].vote()
+                voteThread.add(id, self.activePlayer[id].vote(choices=self.activePlayer.seats()))
+            voteThread.wait()
+            self.record('vote', phase='exile', ballots=voteThread.ballots())
 
-            for thread in voteThread:
-                thread.join()
-            if policeVoteThread is not None:
-                policeVoteThread.join()
-            if policeVoteThread is not None and policeVoteThread.getResult() is not None:
-                packetContent = policeVoteThread.getResult().content
-                if packetContent['vote'] and packetContent['candidate'] in sorted(self.activePlayer.keys()):
-                    policeVote = packetContent['candidate']
-
-            # Get the result and count the vote
-            vote: List[int] = []
-            packetContent: Dict[str, Any] = {}
-            for thread in voteThread:
-                if thread.getResult() is None:
-                    continue
-                packetContent = thread.getResult().content
-                if packetContent['vote'] and packetContent['candidate'] in sorted(self.activePlayer.keys()):
-                    vote.append(packetContent['candidate'])
-            voteResult: Dict[int, float] = mergeVotingResult(vote, policeVote)
+            # Get the result and count the vote, the vote of the police weighs 1.5
+            vote = voteThread.tally(self.playerCount, self.activePlayer, policeID)
+            voteResult: Dict[int, float] = vote.result()
             self.broadcast(
                 None,
                 "投票结果：%s" % (
@@ -624,7 +671,7 @@ class Game:
                     ),
                 )
             )
-            result: List[int] = getVotingResult(voteResult)
+            result: List[int] = vote.leaders()
 
             # REVIEW for debugging
             # print(vote)
@@ -632,7 +679,6 @@ class Game:
 
             del voteThread
             del vote
-            del packetContent
             del voteResult
 
             exile.clear()
@@ -640,14 +686,17 @@ class Game:
                 """
                 Check the identity of the exiled. Idiot can escape from dying.
                 """
-                if not isinstance(self.activePlayer[result[0]], Idiot) or self.activePlayer[result[0]].used:
+                state, exiled = resolveExile(self.getState(), result)
+                if exiled:
                     self.broadcast(
-                        None, "被放逐的玩家是%d号玩家" % (result[0],)
+                        None, "被放逐的玩家是%d号玩家" % (exiled,)
                     )
-                    exile.append(result[0])
+                    self.record('exile', seat=exiled)
+                    exile.append(exiled)
                 else:
-                    self.activePlayer[result[0]].used = 1
+                    self.applyState(state)
                     self.broadcast(None, "%d号玩家是白痴" % (result[0],))
+                    self.record('idiot', seat=result[0])
                 break
             elif i == 0:
                 self.broadcast(
@@ -666,7 +715,7 @@ class Game:
             self.victim.clear()
             self.victim.extend(exile)
             for id in self.victim:
-                if id in sorted(self.activePlayer.keys()):
+                if id in self.activePlayer:
                     self.activePlayer.pop(id)
         status = self.checkStatus()
         if status:
@@ -687,28 +736,15 @@ class Game:
 
         - return: seq: list[int]
         """
-        seq, keys = [], list(sorted(self.activePlayer.keys()))
-        tempStart, tempEnd = [], []
-        cur = tempStart
-        if clockwise:
-            keys.reverse()
-        for id in keys:
-            cur.append(id)
-            if id == startpoint:
-                cur = tempEnd
-
-        tempStart.reverse()
-        tempEnd.reverse()
-        seq = tempStart + tempEnd
-        seq.reverse()
-
-        return seq
+        return speakingOrder(self.activePlayer.seats(), startpoint, clockwise)
 
     def nightTime(self):
         """
         Implements the game logic at night. Workflow:
 
         - Wolves wake up to kill a person. The server should inform a player his peers.
+          - The predictor and the guard are asked at the same time, the witch is asked when the victim is known
+          - The night is resolved when all the answers are received or the time is up
         - The witch wakes up to kill a person or save a person
           - After the witch has saved a person, it would no longer knows the victim at night
           - The witch can only use a bottle of potion at night.
@@ -723,73 +759,52 @@ class Game:
         self.broadcast(
             None,
             "天黑请闭眼\n目前在场的玩家：%s号玩家" % (
-                "号玩家、".join([str(_) for _ in sorted(self.activePlayer.keys())])
+                "号玩家、".join([str(_) for _ in self.activePlayer.seats()])
             )
         )
 
         # Parameters:
         victimByWolf: int = 0
-        victimByWitch: int = 0
+        witchTarget: Optional[int] = None
         predictorTarget: int = 0
         guardTarget: int = 0
 
         # ANCHOR: Wolves wake up
         # Vote for a player to kill
 
-        wolves = []
-        for player in sorted(self.activePlayer.keys()):
-            if isinstance(self.activePlayer[player], Wolf):
-                wolves.append(player)
+        wolves = self.activePlayer.wolves()
 
         for wolf in wolves:
             self.activePlayer[wolf].inform(
                 "目前在场的狼人：" + "号玩家、".join([str(_) for _ in wolves]) + "号玩家"
             )
 
-        wolfThread: List[KillableThread] = []
         sleep(0.5)
 
-        for player in sorted(self.activePlayer.keys()):
-            if isinstance(self.activePlayer[player], (Wolf, KingOfWerewolves, WhiteWerewolf)):
-                ret: Optional[KillableThread] = KillableThread(
-                    self.activePlayer[player].kill, **{}
-                )
-                ret.setDaemon(True)
-                ret.start()
-                if ret is not None:
-                    wolfThread.append(ret)
-        if wolfThread:  # Only used for indention
-            temp: List[ReceiveThread] = []
-
-            for thread in wolfThread:
-                thread.join()
-                if thread.getResult():
-                    temp.append(thread.getResult())
-
-            for thread in temp:
-                thread.join()
-
-            vote: List[int] = []
-            packetContent: Dict[str, Any] = {}
-
-            for thread in temp:
-                if thread.getResult() is None:
-                    continue
-                packetContent = thread.getResult().content
-                if packetContent['action'] and packetContent['target'] in sorted(self.activePlayer.keys()):
-                    vote.append(packetContent['target'])
-
-            result: Any = mergeVotingResult(vote)
-            result = getVotingResult(result)
+        # ANCHOR: Predictor and guard wake up
+        # They do not depend on the wolves, so they are asked at the same time as the wolves, only the witch waits for the victim.
+
+        predictor: Optional[Predictor] = self.activePlayer.find(PREDICTOR)
+        predictorThread: Optional[PendingPacket] = predictor.skill() if predictor is not None else None
+        guard: Optional[Guard] = self.activePlayer.find(GUARD)
+        guardThread: Optional[PendingPacket] = guard.skill() if guard is not None else None
+
+        # The wolves talk until they vote, the phase stops early when the remaining votes cannot change the victim
+        wolfThread = PhaseBarrier(self.quorums['kill'])
+        for player in wolves:
+            wolfThread.start(
+                player, self.activePlayer[player].kill,
+                choices=self.activePlayer.seats(),
+                cancel=self.activePlayer[player].socket.cancelPending
+            )
+        if wolves:  # Only used for indention
+            wolfThread.wait()
 
+            # The time may be up while the wolf is talking
             # If there are more than 1 victim, randomly choose one
-            shuffle(result)
-            victimByWolf = result[0] if result else 0
-
-            del vote
-            del packetContent
-            del result
-            del temp
+            victimByWolf = chooseWolfVictim(
+                self.getState(), [voteChoice(_) for _ in wolfThread.replies()])
+            self.record('kill', target=victimByWolf, ballots=wolfThread.ballots())
         del wolfThread
 
         if self.explode is not None:
@@ -797,54 +812,45 @@ class Game:
             self.activePlayer.pop(self.explode)
             self.explode = None
 
-        # ANCHOR: Predictor wake up
-        # The predictor ask for a player's identity
+        # ANCHOR: Witch wake up
+        # Witch can save or kill a person, asked as soon as the victim is known
 
-        predictorThread: Optional[ReceiveThread] = None
-        predictor: Optional[Predictor] = None
+        witchThread: Optional[PendingPacket] = None
+        witch: Optional[Witch] = self.activePlayer.find(WITCH)
 
-        for player in sorted(self.activePlayer.keys()):
-            if isinstance(self.activePlayer[player], Predictor):
-                predictor = self.activePlayer[player]
-                predictorThread = self.activePlayer[player].skill()
-            if predictorThread:
-                predictorThread.join()
+        if witch is not None:
+            witchThread = witch.skill(
+                killed=victimByWolf
+            )
+
+        # ANCHOR: Predictor answers
+        # The predictor ask for a player's identity
 
+        if predictorThread:
+            predictorThread.join()
         if predictor is not None and predictorThread is not None and predictorThread.getResult() is not None:
             packetContent: Dict[str, Any] = predictorThread.getResult().content
-            if packetContent['action'] and packetContent['target'] in sorted(self.activePlayer.keys()):
+            if packetContent['action'] and packetContent['target'] in self.activePlayer:
                 predictorTarget = packetContent['target']
 
-            # Notice: the server need to send a response here, and the packet type is -3
-            # The 'action' field is the identity of the target.
-
-            packetContent.update(**predictor._getBasePacket())
-            packetContent['action'] = getIdentityCode(
-                self.activePlayer[predictorTarget]) >= 0
-            packetContent['target'] = -1024
-            sendingThread: Thread = Thread(
-                target=ChunckedData(-3, **packetContent).send,
-                args=(predictor.socket, ),
-                daemon=True
-            )
-            sendingThread.start()
+                # Notice: the server need to send a response here, and the packet type is -3
+                # The 'action' field is the identity of the target.
+
+                packetContent.update(**predictor._getBasePacket())
+                packetContent['action'] = getIdentityCode(
+                    self.activePlayer[predictorTarget]) >= 0
+                packetContent['target'] = -1024
+                ChunckedData(-3, **packetContent).send(predictor.socket)
+                self.record('check', seat=predictor.id, target=predictorTarget, good=packetContent['action'])
+            else:
+                predictor.inform("你的选择无效")
             del packetContent
         del predictorThread
 
-        # ANCHOR: Witch wake up
-        # Witch can save or kill a person
-
-        witchThread: Optional[ReceiveThread] = None
-        witch: Optional[Witch] = None
+        # ANCHOR: Witch answers
 
-        for player in sorted(self.activePlayer.keys()):
-            if isinstance(self.activePlayer[player], Witch):
-                witch = self.activePlayer[player]
-                witchThread = witch.skill(
-                    killed=victimByWolf
-                )
-                if witchThread:
-                    witchThread.join()
+        if witchThread:
+            witchThread.join()
         if witch is not None and witchThread is not None and witchThread.getResult() is not None:
             """
             Got the response
@@ -852,101 +858,56 @@ class Game:
             packetContent: Dict[int, Any] = witchThread.getResult().content
             if packetContent['action']:
                 """
-                If the witch takes the action
+                If the witch takes the action, the target is checked by the rules
                 """
-                if packetContent['target'] == 0 or \
-                        not isinstance(self.activePlayer[packetContent['target']], Witch) or \
-                        self.night == 0:
-                    """
-                    The witch cannot save herself after the first night.
-                    """
-                    if packetContent['target'] == 0 and witch.used % 2 == 0:
-                        victimByWolf *= -1  # wait for guard
-                        witch.used += 1
-                    elif packetContent['target'] in sorted(self.activePlayer.keys()) and witch.used < 2:
-                        victimByWitch = packetContent['target']
-                        witch.used += 2
+                witchTarget = packetContent['target']
             del packetContent
         del witchThread
 
-        # ANCHOR: Guard wake up
+        # ANCHOR: Guard answers
         # Guard protects a player, prevent him from dying from wolves.
 
-        guardThread: Optional[ReceiveThread] = None
-        guard: Optional[Guard] = None
-
-        for player in sorted(self.activePlayer.keys()):
-            if isinstance(self.activePlayer[player], Guard):
-                guard = self.activePlayer[player]
-                guardThread = self.activePlayer[player].skill()
-            if guardThread:
-                guardThread.join()
-        if guard is not None and guardThread is not None and guardThread.getResult is not None:
+        if guardThread:
+            guardThread.join()
+        if guard is not None and guardThread is not None and guardThread.getResult() is not None:
             packetContent: dict = guardThread.getResult().content
             if packetContent['action']:
-                if packetContent['target'] in sorted(self.activePlayer.keys()):
-                    guardTarget = packetContent['target']
-                    # Cannot save the same player in 2 days.
-                    if (guardTarget != self.guardedLastNight):
-                        victimByWolf *= -1 if guardTarget ** 2 == victimByWolf ** 2 else 1
-                        # the situation when guard and save the same person
+                guardTarget = packetContent['target']
 
             del packetContent
         del guardThread
 
-        # ANCHOR: Hunter wake up
-        # The server checks the usablity of the skill
-
-        if victimByWitch in sorted(self.activePlayer.keys()):
-            self.hunterStatus = not isinstance(
-                self.activePlayer[victimByWitch], Hunter
-            )
-            self.kingofwolfStatus = not isinstance(
-                self.activePlayer[victimByWitch], KingOfWerewolves
-            )
+        # ANCHOR: Resolve the night
+        # The witch, the guard and the skills of the hunter and the king of werewolves are resolved by the rules
 
-        # ANCHOR: Return the value
+        night = resolveNight(self.getState(), victimByWolf, witchTarget, guardTarget)
+        self.applyState(night.state)
+        for event, seat in night.events:
+            self.record(event, seat=seat)
         self.victim.clear()
-        if victimByWitch in sorted(self.activePlayer.keys()):
-            self.victim.append(victimByWitch)
-        if victimByWolf in sorted(self.activePlayer.keys()):
-            self.victim.append(victimByWolf)
-        shuffle(self.victim)
-
-        if self.guardedLastNight != guardTarget:
-            self.guardedLastNight = guardTarget
-        else:
-            self.guardedLastNight = 0
-
-        self.night += 1
+        self.victim.extend(night.victims)
 
     def broken(self, id: int):
         """
         Process the self-explosion
         """
         assert isinstance(self.activePlayer[id], Wolf)
+        self.record('explode', seat=id)
         if isinstance(self.activePlayer[id], KingOfWerewolves):
             self.kingofwolfStatus = False
-        sendingThreads: List[Thread] = []
         for i in self.activePlayer:
             """
             Inform all players, including the player sends the message
             """
             packetContent = self.activePlayer[i]._getBasePacket()
             packetContent["id"] = id
-            sendingThreads.append(Thread(
-                target=ChunckedData(9, **packetContent).send,
-                args=(self.activePlayer[i].socket, ),
-                daemon=True
-            ))
-        for thread in sendingThreads:
-            thread.start()
+            ChunckedData(9, **packetContent).send(self.activePlayer[i].socket)
 
         if isinstance(self.activePlayer[id], WhiteWerewolf):
             """
             Kill someone
             """
-            recvThread: ReceiveThread = self.activePlayer[id].skill()
+            recvThread: PendingPacket = self.activePlayer[id].skill()
             recvThread.join()
             if recvThread.getResult() is not None:
                 packetRecv = recvThread.getResult()
@@ -955,75 +916,83 @@ class Game:
                         None,
                         "白狼王%d号玩家带走%d号玩家" % (id, packetRecv['target'])
                     )
+                    self.record('shot', seat=id, target=packetRecv['target'])
                     self.victim.clear()
                     self.victim.append(packetRecv['target'])
                     self.victimSkill(True)
 
         self.explode = id  # 等待下一晚nightTime()函数执行完毕后死亡
 
+    def _onExplode(self, id: int, data: ChunckedData):
+        """
+        Called by the engine when a player sends the self-explosion packet.
+
+        The request is accepted only if the player is an alive wolf and the day is not finished, otherwise the player is informed.
+        """
+        with self.explodeLock:
+            accepted = self.dayRunning and self.explodeRequest is None and \
+                isinstance(self.activePlayer.get(id), Wolf)
+            if accepted:
+                self.explodeRequest = id
+        if accepted:
+            self.dayFinished.set()
+        elif id in self.activePlayer:
+            self.activePlayer[id].inform("你现在不能自爆")
+
+    def _runDay(self):
+        try:
+            self.dayTime()
+        except CancellationError:
+            pass
+        finally:
+            with self.explodeLock:
+                self.dayRunning = False
+            self.dayFinished.set()
+
+    def runDay(self):
+        """
+        Run the day, and interrupt it when a wolf explodes.
+
+        The thread waits on an event set at the end of the day or by the self-explosion, so no CPU is used while the players are talking. The day is interrupted by cancelling the token of the players: the pending requests are cancelled and the next request raises `CancellationError` in the day thread, which is then joined.
+        """
+        with self.explodeLock:
+            self.explodeRequest = None
+            self.dayRunning = True
+        self.dayFinished.clear()
+        token = CancelToken()
+        for player in self.allPlayer.values():
+            player.token = token
+        try:
+            dayTimeThread = Thread(target=self._runDay, daemon=True)
+            dayTimeThread.start()
+            self.dayFinished.wait()
+            with self.explodeLock:
+                self.dayRunning = False
+                explode = self.explodeRequest
+            if explode is None:
+                return
+            token.cancel()
+            dayTimeThread.join()
+        finally:
+            for player in self.allPlayer.values():
+                player.token = None
+        self.explode = explode
+        self.broken(explode)
+
     def launch(self):
         """
         Launch the game
+
+        The self-explosion is received through the connection of the player, see `addPlayer()`, so no port is opened during the game.
         """
         assert self.running, "The game must be activated!"
         while not self.status:
             self.nightTime()
             if self.day == 0:
                 self.electPolice()
+            self.runDay()
 
-            explodeListenerv4 = socket.socket(AF_INET, SOCK_STREAM)
-            explodeListenerv6 = socket.socket(AF_INET6, SOCK_STREAM)
-            explodeListenerv4.bind((self.ipv4, self.port + 1))
-            explodeListenerv6.bind((self.ipv6, self.port + 1))
-            explodeListenerv4.listen(5)
-            explodeListenerv6.listen(5)
-            dayTimeThread = KillableThread(self.dayTime)
-            explodeThreadv4 = KillableThread(explodeListenerv4.accept)
-            explodeThreadv6 = KillableThread(explodeListenerv6.accept)
-            dayTimeThread.setDaemon(True)
-            explodeThreadv4.setDaemon(True)
-            explodeThreadv6.setDaemon(True)
-            explodeThreadv4.start()
-            explodeThreadv6.start()
-            dayTimeThread.start()
-
-            while dayTimeThread.is_alive():
-                """
-                Listen for message
-                """
-                if explodeThreadv4.is_alive() and explodeThreadv6.is_alive():
-                    continue
-                c: socket.socket
-                addr: Tuple[Any]
-                if explodeThreadv4.is_alive() == False and explodeThreadv4.getResult():
-                    c, addr = explodeThreadv4.getResult()
-                    explodeThreadv6.kill()
-                else:
-                    c, addr = explodeThreadv6.getResult()
-                    explodeThreadv4.kill()
-
-                listenThread: ReceiveThread = ReceiveThread(c, 60)
-                listenThread.setDaemon(True)
-                listenThread.start()
-                listenThread.join()
-                curPacket = listenThread.getResult()
-                if curPacket is None:
-                    continue
-                assert curPacket.type == 9
-                self.explode = curPacket['id']
-                dayTimeThread.kill()
-                self.broken(curPacket['id'])
-                c.close()
-                break
-
-            if explodeThreadv4.is_alive():
-                explodeThreadv4.kill()
-            if explodeThreadv6.is_alive():
-                explodeThreadv6.kill()
-
-            explodeListenerv4.close()
-            explodeListenerv6.close()
-
+        self.record('result', status=self.status)
         self.announceResult(self.status == 1)
         self.broadcast(
             None,
@@ -1032,29 +1001,3 @@ class Game:
         for player in self.allPlayer:
             self.allPlayer[player].socket.close()
 
-
-class IncomingConnection(KillableThread):
-    """
-    Create a thread that receives a handshake package.
-
-    `Establish` packets and `EstablishResp` packets are no longer used. The server sends the port information in this packet.
-    """
-
-    def __init__(self, connection: socket.socket, dest: Game):
-        super(IncomingConnection, self).__init__(connection.accept)
-        self.socket = connection
-        self.game: Game = dest
-        self.pending: bool = False
-
-    def run(self):
-        while self.game.playerCount != len(self.game.activePlayer):
-            # REVIEW for debugging
-            # print("Listening for additional player...")
-            self.pending = True
-            c, addr = self.socket.accept()
-            self.pending = False
-            # REVIEW for debugging
-            # print(c.getpeername())
-            # print(c.getsockname())
-            # print("Client connected")
-            self.game.addPlayer(c, _recv(c))
@@ -0,0 +1,191 @@
+from bisect import insort
+from typing import Any, Dict, List, Optional, Tuple
+
+from .rules import statusOf
+
+
+class RegistryMismatchError(Exception):
+    """
+    The counters or the indexes of a `PlayerRegistry` do not match the players, found by `PlayerRegistry.verify()`.
+    """
+
+    def __init__(self, name: str, value: Any, found: Any):
+        super().__init__()
+        self.name: str = name
+        self.value: Any = value
+        self.found: Any = found
+
+    def __str__(self):
+        return "%s %s, %s found." % (self.name, self.value, self.found)
+
+
+def _faction(code: int) -> int:
+    # The index in `PlayerRegistry.factions`: 0 for the villagers, 1 for the skilled villagers, 2 for the wolves
+    return 0 if code == 0 else (2 if code < 0 else 1)
+
+
+class PlayerRegistry(dict):
+    """
+    The players alive by seat, a `dict` keeping its indexes up to date when a player joins or dies.
+
+    The seats are kept sorted, so the order of the seats is never computed again, and the players are indexed by their identity code, see `Person.type`.
+
+    Attributes:
+
+        police: int, the seat of the police alive, 0 if there is no police
+        factions: list, the number of villagers, skilled villagers and wolves alive
+        debug: bool, whether `status()` checks the counters against a full scan of the players, see `verify()`
+
+    The sequences returned are tuples rebuilt when a player joins or dies, so they can be iterated while the players are removed.
+    """
+
+    def __init__(self, players: Optional[Dict[int, Any]] = None, debug: bool = False):
+        super().__init__()
+        self._seats: Tuple[int, ...] = ()
+        self._roles: Dict[int, Tuple[int, ...]] = {}
+        self.police: int = 0
+        self.factions: List[int] = [0, 0, 0]
+        self.debug: bool = debug
+        if players:
+            self.update(players)
+
+    def __setitem__(self, seat: int, player: Any):
+        if seat in self:
+            del self[seat]
+        super().__setitem__(seat, player)
+        seats = list(self._seats)
+        insort(seats, seat)
+        self._seats = tuple(seats)
+        seats = list(self._roles.get(player.type, ()))
+        insort(seats, seat)
+        self._roles[player.type] = tuple(seats)
+        self.factions[_faction(player.type)] += 1
+        if player.police:
+            self.police = seat
+
+    def __delitem__(self, seat: int):
+        player = self[seat]
+        super().__delitem__(seat)
+        self._seats = tuple(_ for _ in self._seats if _ != seat)
+        self._roles[player.type] = tuple(
+            _ for _ in self._roles[player.type] if _ != seat)
+        self.factions[_faction(player.type)] -= 1
+        if self.police == seat:
+            self.police = 0
+
+    def pop(self, seat: int, *default: Any) -> Any:
+        if seat not in self:
+            if default:
+                return default[0]
+            raise KeyError(seat)
+        player = self[seat]
+        del self[seat]
+        return player
+
+    def popitem(self) -> Tuple[int, Any]:
+        """
+        Remove the player at the last seat, raises `KeyError` if the registry is empty.
+        """
+        if not self._seats:
+            raise KeyError("popitem(): the registry is empty")
+        seat = self._seats[-1]
+        return seat, self.pop(seat)
+
+    def setdefault(self, seat: int, default: Any = None) -> Any:
+        if seat not in self:
+            self[seat] = default
+        return self[seat]
+
+    def update(self, *args: Any, **kwargs: Any):
+        for seat, player in dict(*args, **kwargs).items():
+            self[seat] = player
+
+    def clear(self):
+        super().clear()
+        self._seats = ()
+        self._roles.clear()
+        self.police = 0
+        self.factions = [0, 0, 0]
+
+    def seats(self, *codes: int) -> Tuple[int, ...]:
+        """
+        The seats of the players alive with the identity codes, sorted. All the seats if no code is given.
+        """
+        if not codes:
+            return self._seats
+        if len(codes) == 1:
+            return self._roles.get(codes[0], ())
+        return tuple(sorted(seat for code in codes for seat in self._roles.get(code, ())))
+
+    def find(self, code: int) -> Optional[Any]:
+        """
+        The first player alive with the identity code, `None` if there is none.
+        """
+        seats = self._roles.get(code)
+        return self[seats[0]] if seats else None
+
+    def count(self, *codes: int) -> int:
+        """
+        The number of players alive with the identity codes.
+        """
+        return sum(len(self._roles.get(code, ())) for code in codes)
+
+    def setPolice(self, seat: int):
+        """
+        Pass the badge to the player at the seat, 0 to remove the police.
+        """
+        if self.police in self:
+            self[self.police].setPolice(False)
+        self.police = seat if seat in self else 0
+        if self.police:
+            self[self.police].setPolice(True)
+
+    def wolves(self) -> Tuple[int, ...]:
+        """
+        The seats of the wolves alive, including the white werewolf and the king of werewolves.
+        """
+        codes = [code for code in self._roles if code < 0]
+        return self.seats(*codes) if codes else ()
+
+    def counts(self) -> Tuple[int, int, int]:
+        """
+        The number of villagers, skilled villagers and wolves alive.
+        """
+        return self.factions[0], self.factions[1], self.factions[2]
+
+    def status(self) -> int:
+        """
+        Check whether the game should be stopped, see `rules.checkStatus()`. The counters are checked first in the debug mode.
+        """
+        if self.debug:
+            self.verify()
+        return statusOf(self.factions[0], self.factions[1], self.factions[2])
+
+    def verify(self):
+        """
+        Check the counters and the indexes against a full scan of the players, raises `RegistryMismatchError` on a mismatch.
+        """
+        factions = [0, 0, 0]
+        roles: Dict[int, List[int]] = {}
+        police = 0
+        for seat in sorted(dict.keys(self)):
+            player = dict.__getitem__(self, seat)
+            factions[_faction(player.type)] += 1
+            roles.setdefault(player.type, []).append(seat)
+            if player.police:
+                police = seat
+        if factions != self.factions:
+            raise RegistryMismatchError("Faction counters", self.factions, factions)
+        if self._seats != tuple(sorted(dict.keys(self))):
+            raise RegistryMismatchError("Seat index", self._seats, sorted(dict.keys(self)))
+        if any(self._roles.get(code, ()) != tuple(seats) for code, seats in roles.items()) or \
+                sum(map(len, self._roles.values())) != len(self):
+            raise RegistryMismatchError("Role index", self._roles, roles)
+        if police and police != self.police:
+            raise RegistryMismatchError("Police", self.police, police)
+
+    def __repr__(self):
+        return "PlayerRegistry(%s)" % (dict.__repr__(self), )
+
+    def copy(self) -> Dict[int, Any]:
+        return dict(self)
@@ -0,0 +1,316 @@
+"""
+The rules of the game without the network: a `GameState` and the functions resolving the actions of the players.
+
+The functions do not modify the state passed in, the new state is returned, so the rules can be evaluated by `Game` on the server and by the simulator alike.
+"""
+
+import random
+from itertools import groupby
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .tally import Tally
+
+# The identity codes, the same as `Person.type` and the `identity` field of the `EstablishResp` packet
+VILLAGER = 0
+WOLF = -1
+WHITE_WEREWOLF = -2
+KING_OF_WEREWOLVES = -3
+PREDICTOR = 1
+WITCH = 2
+HUNTER = 3
+GUARD = 4
+IDIOT = 5
+
+identityCodes: Dict[str, int] = {
+    'Villager': VILLAGER,
+    'Wolf': WOLF,
+    'WhiteWerewolf': WHITE_WEREWOLF,
+    'KingOfWerewolves': KING_OF_WEREWOLVES,
+    'KingofWerewolf': KING_OF_WEREWOLVES,
+    'Predictor': PREDICTOR,
+    'Witch': WITCH,
+    'Hunter': HUNTER,
+    'Guard': GUARD,
+    'Idiot': IDIOT
+}
+
+
+class GameState(object):
+    """
+    The state of a game.
+
+    Attributes:
+
+        identities: dict, the seat and the identity code of every player, including the dead
+        alive: set, the seats of the players alive
+        police: int, the seat of the police, 0 if there is no police
+        day, night: int, the number of days and nights passed
+        witchUsed: int, 1 if the antidote is used, 2 if the poison is used, 3 if both
+        guardedLastNight: int, the seat guarded last night, 0 if none
+        hunterStatus, kingStatus: bool, whether the hunter or the king of werewolves can shoot when dead
+        idiotUsed: bool, whether the idiot has escaped the exile, the idiot cannot vote after that
+    """
+
+    __slots__ = ('identities', 'alive', 'police', 'day', 'night', 'witchUsed',
+                 'guardedLastNight', 'hunterStatus', 'kingStatus', 'idiotUsed')
+
+    def __init__(self, identities: Dict[int, int]):
+        self.identities: Dict[int, int] = identities
+        self.alive: Set[int] = set(identities)
+        self.police: int = 0
+        self.day: int = 0
+        self.night: int = 0
+        self.witchUsed: int = 0
+        self.guardedLastNight: int = 0
+        self.hunterStatus: bool = True
+        self.kingStatus: bool = True
+        self.idiotUsed: bool = False
+
+    @classmethod
+    def deal(cls, identityList: Dict[str, int], rng: Any = random) -> 'GameState':
+        """
+        Deal the identities in the format of `Game.setIdentityList()` to the seats at random.
+        """
+        codes = [identityCodes[name]
+                 for name, count in identityList.items() for i in range(count)]
+        rng.shuffle(codes)
+        return cls({seat: code for seat, code in enumerate(codes, 1)})
+
+    def copy(self) -> 'GameState':
+        ret = GameState.__new__(GameState)
+        for name in GameState.__slots__:
+            setattr(ret, name, getattr(self, name))
+        ret.alive = set(self.alive)
+        return ret
+
+    def seats(self, *codes: int) -> List[int]:
+        """
+        The seats alive with the identity codes, sorted.
+        """
+        return sorted(_ for _ in self.alive if self.identities[_] in codes)
+
+    def isWolf(self, seat: int) -> bool:
+        return self.identities[seat] < 0
+
+
+class NightResult(NamedTuple):
+    state: GameState
+    victims: List[int]      # The players died at night, in a random order
+    events: List[Tuple[str, int]]   # ('saved' | 'guarded' | 'poisoned' | 'killed', seat)
+
+
+def checkStatus(state: GameState) -> int:
+    """
+    Check whether the game should be stopped
+
+    Returns:
+
+    - `-1`: The game stops and the werewolves win - either villagers or skilled villagers are eliminated
+    - `0`: The game continues
+    - `1`: The game stops and the villagers win - the wolves are eliminated
+    """
+    numVillager, numSkilled, numWolf = 0, 0, 0
+    for seat in state.alive:
+        code = state.identities[seat]
+        if code == VILLAGER:
+            numVillager += 1
+        elif code < 0:
+            numWolf += 1
+        else:
+            numSkilled += 1
+    return statusOf(numVillager, numSkilled, numWolf)
+
+
+def statusOf(numVillager: int, numSkilled: int, numWolf: int) -> int:
+    """
+    The status of the game by the number of villagers, skilled villagers and wolves alive, see `checkStatus()`.
+    """
+    if numSkilled > 0 and numVillager > 0 and numWolf > 0:
+        return 0
+    elif numWolf == 0:
+        return 1
+    else:
+        return -1
+
+
+def mergeVotingResult(vote: List[int], policevote: Optional[int] = None) -> Dict[int, float]:
+    """
+    Count the vote result and the return the candidates with most votes
+
+    ### Parameter
+
+    - vote: `List[int]`, the vote result
+
+    ### Return
+
+    `List[int]`, the candidates with most votes
+    """
+    voteList: dict = {i: float(len(list(j))) for i, j in groupby(sorted(vote))}
+    # the police case
+    if policevote is not None:
+        if policevote in voteList.keys():
+            voteList[policevote] += 1.5
+        else:
+            voteList[policevote] = 1.5
+
+    return voteList
+
+
+def getVotingResult(merged: Dict[int, float]) -> List[int]:
+    ret: List[int] = []
+    maxV: float = 0
+    for i in merged:
+        if merged[i] > maxV:
+            maxV = merged[i]
+            ret.clear()
+        if merged[i] >= maxV:
+            ret.append(i)
+
+    return ret
+
+
+def validVotes(state: GameState, votes: Iterable[Optional[int]]) -> List[int]:
+    """
+    The votes for the players alive, the abstentions and the other votes are dropped.
+    """
+    return [_ for _ in votes if _ in state.alive]
+
+
+def chooseWolfVictim(state: GameState, votes: Iterable[Optional[int]], rng: Any = random) -> int:
+    """
+    The player killed by the wolves, the ties are broken at random. Returns 0 if no valid vote.
+    """
+    tally = Tally(len(state.identities), state.alive)
+    for seat in votes:
+        tally.add(seat)
+    result = tally.leaders()
+    rng.shuffle(result)
+    return result[0] if result else 0
+
+
+def isGood(state: GameState, seat: int) -> bool:
+    """
+    The result of the check of the predictor.
+    """
+    return state.identities[seat] >= 0
+
+
+def resolveNight(state: GameState, victimByWolf: int, witchTarget: Optional[int] = None, guardTarget: int = 0, rng: Any = random) -> NightResult:
+    """
+    Resolve the actions at night.
+
+    Parameters:
+
+        victimByWolf: int, the player chosen by the wolves, see `chooseWolfVictim()`
+        witchTarget: int, `None` if the witch does not act, 0 to save the victim, a seat to poison
+        guardTarget: int, the seat guarded, 0 if none
+
+    Rules:
+
+    - The antidote and the poison are used once each. The witch cannot poison herself after the first night.
+    - The guard cannot guard a player in two consecutive nights. A player both saved and guarded dies.
+    - The hunter and the king of werewolves poisoned cannot shoot.
+    """
+    state = state.copy()
+    events: List[Tuple[str, int]] = []
+    victimByWitch = 0
+    witch = state.seats(WITCH)
+    if witch and witchTarget is not None:
+        if witchTarget == 0 or witchTarget != witch[0] or state.night == 0:
+            if witchTarget == 0 and state.witchUsed % 2 == 0:
+                victimByWolf *= -1  # wait for guard
+                state.witchUsed += 1
+                if victimByWolf:
+                    events.append(('saved', -victimByWolf))
+            elif witchTarget in state.alive and state.witchUsed < 2:
+                victimByWitch = witchTarget
+                state.witchUsed += 2
+                events.append(('poisoned', victimByWitch))
+    if guardTarget in state.alive and state.seats(GUARD):
+        # Cannot save the same player in 2 days.
+        if guardTarget != state.guardedLastNight:
+            victimByWolf *= -1 if guardTarget ** 2 == victimByWolf ** 2 else 1
+            # the situation when guard and save the same person
+            events.append(('guarded', guardTarget))
+    else:
+        guardTarget = 0
+
+    if victimByWitch in state.alive:
+        state.hunterStatus = state.identities[victimByWitch] != HUNTER
+        state.kingStatus = state.identities[victimByWitch] != KING_OF_WEREWOLVES
+
+    victims: List[int] = []
+    if victimByWitch in state.alive:
+        victims.append(victimByWitch)
+    if victimByWolf in state.alive:
+        victims.append(victimByWolf)
+        events.append(('killed', victimByWolf))
+    rng.shuffle(victims)
+
+    if state.guardedLastNight != guardTarget:
+        state.guardedLastNight = guardTarget
+    else:
+        state.guardedLastNight = 0
+    state.night += 1
+    return NightResult(state, victims, events)
+
+
+def resolveExile(state: GameState, result: List[int]) -> Tuple[GameState, int]:
+    """
+    Exile the player with the most votes.
+
+    Returns:
+
+        the new state and the seat exiled, 0 if nobody is exiled: the votes are tied, or the idiot escapes for the first time
+    """
+    if len(result) != 1:
+        return state, 0
+    state = state.copy()
+    if state.identities[result[0]] == IDIOT and not state.idiotUsed:
+        state.idiotUsed = True
+        return state, 0
+    state.alive.discard(result[0])
+    return state, result[0]
+
+
+def canShoot(state: GameState, seat: int) -> bool:
+    """
+    Whether a dead player can shoot: the hunter or the king of werewolves not poisoned.
+    """
+    code = state.identities[seat]
+    return (code == HUNTER and state.hunterStatus) or \
+        (code == KING_OF_WEREWOLVES and state.kingStatus)
+
+
+def canVote(state: GameState, seat: int) -> bool:
+    """
+    The idiot escaped from the exile cannot vote.
+    """
+    return not (state.identities[seat] == IDIOT and state.idiotUsed)
+
+
+def speakingOrder(alive: Iterable[int], startpoint: int, clockwise: bool) -> List[int]:
+    """
+    The order of the speeches.
+
+    - startpoint: the person id to start with
+    - clockwise: True means clockwise, False means anti-clockwise
+
+    - return: seq: list[int]
+    """
+    seq, keys = [], list(sorted(alive))
+    tempStart, tempEnd = [], []
+    cur = tempStart
+    if clockwise:
+        keys.reverse()
+    for id in keys:
+        cur.append(id)
+        if id == startpoint:
+            cur = tempEnd
+
+    tempStart.reverse()
+    tempEnd.reverse()
+    seq = tempStart + tempEnd
+    seq.reverse()
+
+    return seq
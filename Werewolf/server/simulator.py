@@ -0,0 +1,316 @@
+import argparse
+import random
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .rules import GUARD, KING_OF_WEREWOLVES, PREDICTOR, WHITE_WEREWOLF, WITCH, GameState, canShoot, canVote, checkStatus, chooseWolfVictim, isGood, resolveExile, resolveNight
+from .tally import POLICE_WEIGHT, Tally
+
+
+class Policy(object):
+    """
+    The decisions of the players in a simulated game, every method is called with the state and the seat of the player deciding.
+
+    The policies see the whole state, a fair policy only uses what the player knows: the identity of the player, the other wolves for a wolf, the checks of a predictor.
+
+    A method returning `None` skips the action, the base class passes every request.
+    """
+
+    def kill(self, state: GameState, seat: int) -> Optional[int]:
+        return None
+
+    def check(self, state: GameState, seat: int) -> Optional[int]:
+        return None
+
+    def onCheck(self, state: GameState, seat: int, target: int, good: bool):
+        """
+        Called with the result of the check of the predictor.
+        """
+        pass
+
+    def witch(self, state: GameState, seat: int, killed: int) -> Optional[int]:
+        """
+        Returns 0 to save the player killed, a seat to poison, `None` to do nothing.
+        """
+        return None
+
+    def guard(self, state: GameState, seat: int) -> Optional[int]:
+        return None
+
+    def shoot(self, state: GameState, seat: int) -> Optional[int]:
+        """
+        The target of the hunter or the king of werewolves, or of the white werewolf when it explodes.
+        """
+        return None
+
+    def election(self, state: GameState, seat: int) -> bool:
+        return False
+
+    def vote(self, state: GameState, seat: int, candidates: List[int]) -> Optional[int]:
+        return None
+
+    def inherit(self, state: GameState, seat: int) -> Optional[int]:
+        return None
+
+    def explode(self, state: GameState, seat: int) -> bool:
+        return False
+
+
+class RandomPolicy(Policy):
+    """
+    Random choices, the wolves do not target each other.
+
+    Initialization:
+
+        rng: `random.Random`, the random generator
+        skillRate: float, the probability to use a skill or to vote
+        explodeRate: float, the probability for a wolf to explode each day
+    """
+
+    def __init__(self, rng: Optional[random.Random] = None, skillRate: float = 0.8, explodeRate: float = 0.0):
+        self.rng: random.Random = rng if rng is not None else random.Random()
+        self.skillRate: float = skillRate
+        self.explodeRate: float = explodeRate
+
+    def _choose(self, candidates: List[int]) -> Optional[int]:
+        if not candidates or self.rng.random() >= self.skillRate:
+            return None
+        return self.rng.choice(candidates)
+
+    def _others(self, state: GameState, seat: int) -> List[int]:
+        if state.identities[seat] < 0:
+            return sorted(_ for _ in state.alive if state.identities[_] >= 0)
+        return sorted(state.alive - {seat})
+
+    def kill(self, state: GameState, seat: int) -> Optional[int]:
+        return self._choose(self._others(state, seat))
+
+    def check(self, state: GameState, seat: int) -> Optional[int]:
+        return self._choose(self._others(state, seat))
+
+    def witch(self, state: GameState, seat: int, killed: int) -> Optional[int]:
+        if killed and self.rng.random() < self.skillRate:
+            return 0
+        return self._choose(self._others(state, seat)) if self.rng.random() < 0.3 else None
+
+    def guard(self, state: GameState, seat: int) -> Optional[int]:
+        return self._choose(sorted(state.alive))
+
+    def shoot(self, state: GameState, seat: int) -> Optional[int]:
+        return self._choose(self._others(state, seat))
+
+    def election(self, state: GameState, seat: int) -> bool:
+        return self.rng.random() < self.skillRate / 2
+
+    def vote(self, state: GameState, seat: int, candidates: List[int]) -> Optional[int]:
+        if state.identities[seat] < 0:
+            candidates = [_ for _ in candidates if state.identities[_] >= 0]
+        return self._choose([_ for _ in candidates if _ != seat])
+
+    def inherit(self, state: GameState, seat: int) -> Optional[int]:
+        return self._choose(self._others(state, seat))
+
+    def explode(self, state: GameState, seat: int) -> bool:
+        return self.rng.random() < self.explodeRate
+
+
+class SimulationResult(NamedTuple):
+    status: int     # 1 if the villagers win, -1 if the wolves win
+    days: int
+    identities: Dict[int, int]
+    deaths: List[Tuple[int, str, int]]  # (seat, cause, day), cause in 'night', 'exile', 'shot', 'explode'
+
+
+class Simulator(object):
+    """
+    Play a game with the rules core and the policies, with no network and no waiting.
+
+    The phases follow `Game.launch()`: the night, the police election on the first day, then the day with the last words, the speeches and the exile.
+    """
+
+    def __init__(self, identityList: Dict[str, int], policy: Policy, rng: Optional[random.Random] = None):
+        self.rng: random.Random = rng if rng is not None else random.Random()
+        self.policy: Policy = policy
+        self.state: GameState = GameState.deal(identityList, self.rng)
+        self.deaths: List[Tuple[int, str, int]] = []
+        self.victims: List[int] = []
+        self.explode: Optional[int] = None
+
+    def _die(self, seat: int, cause: str):
+        self.deaths.append((seat, cause, self.state.day))
+
+    def night(self) -> List[int]:
+        state, policy = self.state, self.policy
+        wolves = [_ for _ in sorted(state.alive) if state.identities[_] < 0]
+        victimByWolf = chooseWolfVictim(
+            state, [policy.kill(state, _) for _ in wolves], self.rng)
+        if self.explode is not None:
+            state.alive.discard(self.explode)
+            self.explode = None
+        for seat in state.seats(PREDICTOR):
+            target = policy.check(state, seat)
+            if target in state.alive:
+                policy.onCheck(state, seat, target, isGood(state, target))
+        witchTarget: Optional[int] = None
+        for seat in state.seats(WITCH):
+            witchTarget = policy.witch(
+                state, seat, 0 if state.witchUsed % 2 else victimByWolf)
+        guardTarget = 0
+        for seat in state.seats(GUARD):
+            guardTarget = policy.guard(state, seat) or 0
+        result = resolveNight(state, victimByWolf,
+                              witchTarget, guardTarget, self.rng)
+        self.state = result.state
+        return result.victims
+
+    def _vote(self, voters: List[int], candidates: List[int], police: int = 0) -> List[int]:
+        state, policy = self.state, self.policy
+        tally = Tally(len(state.identities), candidates)
+        for seat in voters:
+            target = policy.vote(state, seat, candidates)
+            tally.add(target, POLICE_WEIGHT if seat == police else 1.0)
+        return tally.leaders()
+
+    def electPolice(self):
+        state = self.state
+        candidates = [_ for _ in sorted(state.alive)
+                      if self.policy.election(state, _)]
+        if not candidates or len(candidates) == len(state.alive):
+            return
+        for i in range(2):
+            if len(candidates) == 1:
+                state.police = candidates[0]
+                return
+            candidates = self._vote(
+                [_ for _ in sorted(state.alive) if _ not in candidates], candidates)
+        if len(candidates) == 1:
+            state.police = candidates[0]
+
+    def victimSkill(self, victims: List[int]) -> int:
+        """
+        The police passes the badge and the hunter or the king of werewolves shoots, returns the status if the game stops.
+        """
+        state, policy = self.state, self.policy
+        for seat in victims:
+            if state.police == seat:
+                heir = policy.inherit(state, seat)
+                state.police = heir if heir in state.alive else 0
+            if canShoot(state, seat):
+                target = policy.shoot(state, seat)
+                if target is None:
+                    break
+                if target in state.alive:
+                    state.alive.discard(target)
+                    self._die(target, 'shot')
+                    if state.police == target:
+                        state.police = 0
+                    status = checkStatus(state)
+                    if status != 0:
+                        return status
+        for seat in victims:
+            state.alive.discard(seat)
+        return 0
+
+    def day(self) -> int:
+        state, policy = self.state, self.policy
+        state.day += 1
+        status = self.victimSkill(self.victims)
+        if status:
+            return status
+        status = checkStatus(state)
+        if status:
+            return status
+        for seat in sorted(state.alive):
+            if state.identities[seat] < 0 and policy.explode(state, seat):
+                self.explode = seat
+                self._die(seat, 'explode')
+                if state.identities[seat] == KING_OF_WEREWOLVES:
+                    state.kingStatus = False
+                if state.identities[seat] == WHITE_WEREWOLF:
+                    target = policy.shoot(state, seat)
+                    if target in state.alive:
+                        self._die(target, 'shot')
+                        self.victimSkill([target])
+                return 0
+        exiled = 0
+        candidates = sorted(state.alive)
+        for i in range(2):
+            voters = [_ for _ in sorted(state.alive) if canVote(state, _)]
+            result = self._vote(voters, candidates, state.police)
+            if len(result) == 1:
+                self.state, exiled = resolveExile(state, result)
+                state = self.state
+                break
+        if exiled:
+            self._die(exiled, 'exile')
+            status = checkStatus(state)
+            if status:
+                return status
+            self.victimSkill([exiled])
+        return checkStatus(state)
+
+    def run(self) -> SimulationResult:
+        status = 0
+        while not status:
+            self.victims = self.night()
+            for seat in self.victims:
+                self._die(seat, 'night')
+            if self.state.day == 0:
+                self.electPolice()
+            status = self.day()
+        return SimulationResult(status, self.state.day, self.state.identities, self.deaths)
+
+
+def simulate(identityList: Dict[str, int], policy: Optional[Policy] = None, rng: Optional[random.Random] = None) -> SimulationResult:
+    """
+    Play a single game, the policy is a `RandomPolicy` sharing the random generator by default.
+    """
+    rng = rng if rng is not None else random.Random()
+    return Simulator(identityList, policy if policy is not None else RandomPolicy(rng), rng).run()
+
+
+def simulateBatch(
+    count: int,
+    identityList: Dict[str, int],
+    policy: Callable[[random.Random], Policy] = RandomPolicy,
+    seed: Any = None
+) -> Counter:
+    """
+    Play many games in the current thread.
+
+    Parameters:
+
+        count: int, the number of games
+        identityList: dict, the identity configuration, see `Game.setIdentityList()`
+        policy: the factory of the policy, called with the random generator of the batch
+        seed: the seed of the random generator, for a reproducible batch
+
+    Returns:
+
+        a `Counter` of the status of the games: 1 if the villagers win, -1 if the wolves win
+    """
+    rng = random.Random(seed)
+    player = policy(rng)
+    return Counter(Simulator(identityList, player, rng).run().status for i in range(count))
+
+
+def main(argv: Optional[List[str]] = None):
+    from .. import misc
+    parser = argparse.ArgumentParser(
+        description="Simulate werewolf games without the network")
+    parser.add_argument('--preset', default='Villager2Wolf2WitchPredictor',
+                        help="the name of a preset in Werewolf.misc")
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    result = simulateBatch(args.games, getattr(misc, args.preset), seed=args.seed)
+    seconds = time.perf_counter() - start
+    print("%d games, villagers win %.2f%%, wolves win %.2f%%, %.0f games per hour" % (
+        args.games, result[1] * 100 / args.games, result[-1] * 100 / args.games,
+        args.games * 3600 / seconds))
+
+
+if __name__ == '__main__':
+    main()
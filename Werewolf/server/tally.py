@@ -0,0 +1,148 @@
+"""
+Vote counting with fixed-size arrays indexed by seat.
+
+`Tally` counts a single round, `tallyBatch()` counts many rounds at once for the simulations. NumPy is used for the batches when it is installed.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+POLICE_WEIGHT = 1.5     # The vote of the police counts as 1.5 votes
+
+
+class Tally(object):
+    """
+    The votes of a round, the index of the counts is the seat, seat 0 is unused.
+
+    Initialization:
+
+        seats: int, the number of seats
+        valid: the seats that can be voted for, all the seats by default
+    """
+
+    __slots__ = ('counts', 'valid')
+
+    def __init__(self, seats: int, valid: Optional[Iterable[int]] = None):
+        self.counts: List[float] = [0.0] * (seats + 1)
+        if valid is None:
+            self.valid: bytearray = bytearray(b'\x01') * (seats + 1)
+            self.valid[0] = 0
+        else:
+            self.valid = bytearray(seats + 1)
+            for seat in valid:
+                if 0 < seat <= seats:
+                    self.valid[seat] = 1
+
+    def isValid(self, seat: Any) -> bool:
+        """
+        Whether the seat can be voted for, `False` for the abstentions and the values other than a seat.
+        """
+        return type(seat) is int and 0 < seat < len(self.valid) and self.valid[seat] == 1
+
+    def add(self, seat: Any, weight: float = 1.0) -> bool:
+        """
+        Count a vote, the invalid votes are dropped. Returns whether the vote is counted.
+        """
+        try:
+            if seat > 0 and self.valid[seat]:
+                self.counts[seat] += weight
+                return True
+        except (TypeError, IndexError):
+            pass
+        return False
+
+    def addPolice(self, seat: Any) -> bool:
+        return self.add(seat, POLICE_WEIGHT)
+
+    def result(self) -> Dict[int, float]:
+        """
+        The seats with at least one vote and their votes, in the format of `mergeVotingResult()`.
+        """
+        return {seat: count for seat, count in enumerate(self.counts) if count}
+
+    def leaders(self) -> List[int]:
+        """
+        The seats with the most votes, sorted. Empty if there is no vote.
+        """
+        top = max(self.counts)
+        if not top:
+            return []
+        return [seat for seat, count in enumerate(self.counts) if count == top]
+
+    def clear(self):
+        self.counts[:] = [0.0] * len(self.counts)
+
+
+def tallyBatch(votes: Sequence[Sequence[int]], seats: int, police: Optional[Sequence[int]] = None, valid: Optional[Sequence[Sequence[bool]]] = None) -> Any:
+    """
+    Count many rounds at once.
+
+    Parameters:
+
+        votes: the votes of each round, one row per round, 0 for an abstention. The rows have the same length with NumPy
+        seats: int, the number of seats
+        police: the vote of the police in each round, 0 if none
+        valid: the seats that can be voted for in each round, a row of `seats + 1` booleans per round, all the seats by default
+
+    Returns:
+
+        the counts, one row of `seats + 1` per round: a `numpy.ndarray` if NumPy is installed, a list of lists otherwise
+    """
+    if numpy is not None:
+        return _tallyBatchNumpy(votes, seats, police, valid)
+    ret: List[List[float]] = []
+    for i, row in enumerate(votes):
+        counts = [0.0] * (seats + 1)
+        mask = valid[i] if valid is not None else None
+        for seat in row:
+            if 0 < seat <= seats and (mask is None or mask[seat]):
+                counts[seat] += 1
+        if police is not None:
+            seat = police[i]
+            if 0 < seat <= seats and (mask is None or mask[seat]):
+                counts[seat] += POLICE_WEIGHT
+        ret.append(counts)
+    return ret
+
+
+def _tallyBatchNumpy(votes: Any, seats: int, police: Any, valid: Any) -> Any:
+    votes = numpy.asarray(votes, dtype=numpy.intp)
+    rounds = votes.shape[0]
+    rows = numpy.arange(rounds)
+    votes = numpy.where((votes > 0) & (votes <= seats), votes, 0)
+    if valid is not None:
+        valid = numpy.asarray(valid, dtype=bool)
+        votes = numpy.where(valid[rows[:, None], votes], votes, 0)
+    # The counts of all the rounds in a single pass, round i is at offset i * (seats + 1)
+    offsets = votes + (rows * (seats + 1))[:, None]
+    counts = numpy.bincount(offsets.ravel(), minlength=rounds * (seats + 1)).reshape(rounds, seats + 1).astype(float)
+    counts[:, 0] = 0
+    if police is not None:
+        police = numpy.asarray(police, dtype=numpy.intp)
+        police = numpy.where((police > 0) & (police <= seats), police, 0)
+        if valid is not None:
+            police = numpy.where(valid[rows, police], police, 0)
+        counts[rows, police] += numpy.where(police > 0, POLICE_WEIGHT, 0)
+    return counts
+
+
+def leadersBatch(counts: Any) -> List[List[int]]:
+    """
+    The seats with the most votes in each round of `tallyBatch()`, sorted, empty if there is no vote.
+    """
+    if numpy is not None and isinstance(counts, numpy.ndarray):
+        top = counts.max(axis=1)
+        rows, seats = numpy.nonzero((counts == top[:, None]) & (top[:, None] > 0))
+        ret: List[List[int]] = [[] for i in range(counts.shape[0])]
+        for row, seat in zip(rows.tolist(), seats.tolist()):
+            ret[row].append(seat)
+        return ret
+    ret = []
+    for row in counts:
+        top = max(row)
+        ret.append([seat for seat, count in enumerate(row) if count == top] if top else [])
+    return ret
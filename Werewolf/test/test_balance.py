@@ -0,0 +1,55 @@
+from ..misc.balance import PresetStats, analyze, getPresets, simulateChunk, wilson
+from ..misc.preset6 import Villager2Wolf2WitchPredictor
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+
+def test_presets():
+    presets = getPresets()
+    assert presets['Villager2Wolf2WitchPredictor'] == Villager2Wolf2WitchPredictor
+    assert len(presets) == 8
+
+
+def test_statistics():
+    low, high = wilson(50, 100)
+    assert low < 0.5 < high and 0.39 < low and high < 0.61
+    assert wilson(0, 0) == (0.0, 1.0)
+    name, stats = simulateChunk(
+        'Villager2Wolf2WitchPredictor', Villager2Wolf2WitchPredictor, 500, "0")
+    assert stats.games == 500 and sum(stats.days.values()) == 500
+    assert stats.seats[0] == 1000 and stats.seats[-1] == 1000
+    rate, low, high = stats.winRate()
+    assert low <= rate <= high
+    assert set(stats.impact()) <= set(stats.seats)
+    # The chunks merge by adding the counts
+    merged = PresetStats()
+    merged.merge(stats)
+    merged.merge(stats)
+    assert merged.games == 1000 and merged.villagerWins == 2 * stats.villagerWins
+    assert merged.meanDays()[0] == stats.meanDays()[0] and merged.impact() == stats.impact()
+
+def test_analyze():
+    presets = {_: getPresets()[_] for _ in (
+        'Villager2Wolf2WitchPredictor', 'Villager4Wolf3PredictorWitchHunterGuardWhite')}
+    progress = []
+    results = analyze(presets, 3000, chunk=1000, seed=7,
+                      onProgress=lambda name, stats: progress.append((name, stats.games)))
+    assert all(_.games == 3000 for _ in results.values())
+    # The partial results are reported after each chunk
+    assert len(progress) == 6
+    assert sorted(_[1] for _ in progress) == [1000, 1000, 2000, 2000, 3000, 3000]
+    # The results are reproducible with the seed, whatever the executor
+    with ThreadPoolExecutor(2) as executor:
+        again = analyze(presets, 3000, chunk=1000, seed=7, executor=executor)
+    for name in presets:
+        assert again[name].villagerWins == results[name].villagerWins
+        assert again[name].days == results[name].days
+
+
+def test_scaling():
+    presets = {'Villager2Wolf2WitchPredictor': Villager2Wolf2WitchPredictor}
+    for workers in (1, 2):
+        start = time.perf_counter()
+        analyze(presets, 8000, workers=workers, chunk=2000, seed=0)
+        seconds = time.perf_counter() - start
+        print("%d workers: %.0f games per hour" % (workers, 8000 * 3600 / seconds))
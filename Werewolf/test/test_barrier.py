@@ -0,0 +1,86 @@
+from ..server.barrier import PhaseBarrier, atLeast, decisive, fraction, voteChoice
+from ..server.engine import PendingPacket
+from concurrent.futures import Future
+from threading import Event, Timer
+from time import monotonic
+
+
+class FakePacket:
+    def __init__(self, type: int, **content):
+        self.type = type
+        self.content = content
+
+
+def vote(candidate: int) -> FakePacket:
+    return FakePacket(-7, vote=bool(candidate), candidate=candidate)
+
+
+def later(delay: float, future: Future, packet: FakePacket):
+    Timer(delay, future.set_result, (packet, )).start()
+
+
+def test_everyone():
+    barrier = PhaseBarrier()
+    futures = [Future() for i in range(3)]
+    for i, future in enumerate(futures):
+        barrier.add(i + 1, PendingPacket(future))
+    # A player with nothing to do does not complete the phase early
+    barrier.add(4, None)
+    later(0.05, futures[2], vote(1))
+    later(0.1, futures[0], vote(2))
+    later(0.15, futures[1], vote(2))
+    assert barrier.wait(2)
+    assert barrier.getResult(2).content['candidate'] == 2 and barrier.getResult(4) is None
+    assert [_.content['candidate'] for _ in barrier.replies()] == [2, 2, 1]
+    tally = barrier.tally(4, range(1, 5), police=3)
+    assert tally.result() == {1: 1.5, 2: 2.0}
+
+
+def test_quorum():
+    barrier = PhaseBarrier(decisive(voteChoice))
+    futures = [Future() for i in range(4)]
+    for i, future in enumerate(futures):
+        barrier.add(i, PendingPacket(future))
+    start = monotonic()
+    later(0.02, futures[0], FakePacket(-3, action=True, target=5))
+    later(0.04, futures[1], FakePacket(-3, action=False, target=-1))
+    later(0.06, futures[2], FakePacket(-3, action=True, target=5))
+    assert barrier.wait(5)
+    # 2 votes to 0 with a single vote expected, the last player is not waited for
+    assert monotonic() - start < 1
+    assert futures[3].cancelled()
+    assert [voteChoice(_) for _ in barrier.replies()] == [5, None, 5]
+
+    barrier = PhaseBarrier(atLeast(2))
+    futures = [Future() for i in range(3)]
+    for i, future in enumerate(futures):
+        barrier.add(i, PendingPacket(future))
+    futures[0].set_result(vote(1))
+    futures[1].set_result(vote(2))
+    assert barrier.wait(1) and futures[2].cancelled()
+
+    barrier = PhaseBarrier(fraction(0.5))
+    futures = [Future() for i in range(4)]
+    for i, future in enumerate(futures):
+        barrier.add(i, PendingPacket(future))
+    futures[0].set_result(vote(1))
+    assert not barrier.wait(0.05)
+    assert barrier.replies() and all(_.cancelled() for _ in futures[1:])
+
+
+def test_start():
+    barrier = PhaseBarrier(atLeast(1))
+    cancelled = Event()
+    future = Future()
+
+    def waitForever():
+        cancelled.wait(5)
+        return None
+
+    barrier.start(1, lambda: PendingPacket(future))
+    barrier.start(2, waitForever, cancel=cancelled.set)
+    later(0.02, future, vote(3))
+    assert barrier.wait(5)
+    # The request still running is interrupted
+    assert cancelled.wait(1)
+    assert [voteChoice(_) for _ in barrier.replies()] == [3]
@@ -0,0 +1,49 @@
+from ..bots import EXPLODE, ReplayStrategy, RuleBasedStrategy, Strategy, View, playGame, playGames
+from ..misc.preset6 import Villager2Wolf2WitchPredictor
+from ..misc.preset12 import Villager4Wolf3PredictorWitchHunterGuardWhite
+from ..server.abstraction import default_timeout
+
+
+def test_view():
+    view = View(3, -1)
+    view.update("天黑请闭眼\n目前在场的玩家：1号玩家、3号玩家、12号玩家")
+    assert view.others() == [1, 12]
+    view.update("目前在场的狼人：3号玩家、12号玩家")
+    assert view.wolves == {3, 12}
+    view.update("晚上未知玩家死了")
+    assert view.killed == 0
+
+
+def test_replay():
+    strategy = ReplayStrategy([('vote', 2), ('speak', EXPLODE), ('vote', None)])
+    view = View(1, -1)
+    assert strategy.decide('vote', view) == 2
+    assert strategy.decide('speak', view) is EXPLODE
+    assert strategy.decide('vote', view) is None
+    # The fallback passes the requests after the script
+    assert strategy.decide('vote', view) is None
+    assert strategy.decide('speak', view) == Strategy().speak(view)
+
+
+def test_fullGame():
+    previous = default_timeout()
+    report = playGame(Villager2Wolf2WitchPredictor, timeout=1.0, seed=1)
+    # The time limit of the server is restored after the games
+    assert default_timeout() == previous
+    assert report.status != 0
+    assert sorted(report.identities) == list(range(1, 7))
+    for bot in report.bots:
+        assert bot.view.result == (report.status == 1)
+
+
+def test_fullGamesConcurrently():
+    reports = playGames(3, Villager4Wolf3PredictorWitchHunterGuardWhite,
+                        RuleBasedStrategy, timeout=1.0, seed=2)
+    assert all(report.status != 0 for report in reports)
+    for report in reports:
+        # The wolves never vote to kill another wolf
+        wolves = {seat for seat, identity in report.identities.items() if identity < 0}
+        for bot in report.bots:
+            if bot.view.identity < 0:
+                assert not any(kind == 'kill' and value in wolves
+                               for kind, value in bot.decisions)
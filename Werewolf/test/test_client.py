@@ -0,0 +1,159 @@
+from ..WP.api import ChunckedData, InputMismatchError, ReadInput, parseInput
+from ..WP.cancel import CancelToken
+from ..WP.scheduler import getScheduler
+from ..WP.terminal import TerminalInput
+from ..client import Client
+from ..server.abstraction import Wolf
+from ..server.engine import Engine, PlayerConnection
+from pytest import raises
+import io
+import os
+import queue
+import threading
+import time
+
+
+class PromptedClient(Client):
+    """
+    Report the requests prompted to the player, so the test types the answers at the right time.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prompted: 'queue.Queue[int]' = queue.Queue()
+        self.selects: int = 0
+        select = self.selector.select
+
+        def countedSelect(timeout=None):
+            self.selects += 1
+            return select(timeout)
+        self.selector.select = countedSelect
+
+    def handle(self, packet: ChunckedData):
+        super().handle(packet)
+        if self.prompt is not None:
+            self.prompted.put(packet.type)
+
+
+def test_clientLoop():
+    read, write = os.pipe()
+    terminal = TerminalInput(os.fdopen(read, 'r'))
+    engine = Engine()
+    accepted: 'queue.Queue[PlayerConnection]' = queue.Queue()
+    server = engine.serve('127.0.0.1', 0,
+                          lambda connection, packet: accepted.put(connection))
+    client = PromptedClient('127.0.0.1', server.sockets[0].getsockname()[1], terminal=terminal)
+    wolf = Wolf(1, accepted.get(timeout=5.0))
+    ChunckedData(-1, seat=1, identity=-1, **wolf._getBasePacket()).send(wolf.socket)
+    threadCount = threading.active_count()
+    result = []
+    thread = threading.Thread(target=lambda: result.append(client.run()), daemon=True)
+    thread.start()
+
+    pending = wolf.speak(timeout=5.0)
+    assert client.prompted.get(timeout=5.0) == 6
+    os.write(write, "大家好\n".encode())
+    pending.join()
+    assert pending.getResult()['content'] == "大家好"
+    # No thread is started for a prompt, and the loop does not wake up while idle
+    assert threading.active_count() == threadCount + 1
+    time.sleep(0.1)
+    selects = client.selects
+    time.sleep(0.5)
+    assert client.selects == selects
+
+    # The seats that cannot be chosen are refused before anything is sent
+    pending = wolf.vote(timeout=5.0, choices=[1, 2])
+    assert client.prompted.get(timeout=5.0) == 7
+    os.write(write, b"9\n")
+    os.write(write, b"2\n")
+    pending.join()
+    assert pending.getResult()['vote'] is True and pending.getResult()['candidate'] == 2
+    assert wolf.socket.inbox.dropped == 0
+    pending = wolf.vote(timeout=5.0, choices=[1, 2])
+    assert client.prompted.get(timeout=5.0) == 7
+    os.write(write, b"0\n")
+    pending.join()
+    assert pending.getResult()['vote'] is False
+    # The prompt is abandoned at its deadline
+    pending = wolf.speak(timeout=0.2)
+    assert client.prompted.get(timeout=5.0) == 6
+    pending.join()
+    time.sleep(0.1)
+    assert pending.getResult() is None and client.prompt is None
+
+    kill = []
+    killer = threading.Thread(target=lambda: kill.append(wolf.kill(timeout=5.0)))
+    killer.start()
+    assert client.prompted.get(timeout=5.0) == 3
+    # The lines typed at once are read in order, the text is sent to the other wolves
+    os.write(write, "刀3号\n3\n".encode())
+    killer.join(5.0)
+    assert kill[0].getResult()['target'] == 3
+
+    wolf.informResult(False)
+    thread.join(5.0)
+    assert result == [1]
+    os.close(write)
+    terminal.close()
+    engine.close()
+
+
+def test_parseInput():
+    assert parseInput(" 3 ", int, [1, 3]) == 3
+    assert parseInput("-1", "int") == -1
+    assert parseInput("True", "bool") is True and parseInput("否", "bool") is False
+    assert parseInput("1, 2 3、4", "seats", range(1, 5)) == [1, 2, 3, 4]
+    assert parseInput("__import__('os')", str) == "__import__('os')"
+    # Nothing typed is evaluated
+    for text, inputType, choices in [("__import__('os').getpid()", int, None), ("1+1", "int", None),
+                                     ("4", "int", [1, 3]), ("1 1", "seats", None), ("maybe", "bool", None),
+                                     ("3", "float", None)]:
+        with raises(InputMismatchError):
+            parseInput(text, inputType, choices)
+
+
+def test_timedPrompts():
+    read, write = os.pipe()
+    terminal = TerminalInput(os.fdopen(read, 'r'))
+    getScheduler()
+    threadCount = threading.active_count()
+    # The prompts timed out leave no reader behind, the next prompt gets the answer
+    for i in range(200):
+        prompt = ReadInput("", int, 0.001, terminal=terminal)
+        prompt.start()
+        prompt.join()
+        assert prompt.getResult() is None
+    assert threading.active_count() == threadCount
+    prompt = ReadInput("", int, 5.0, terminal=terminal)
+    prompt.start()
+    os.write(write, "x\n4".encode())
+    prompt.join(0.1)
+    assert prompt.is_alive()
+    os.write(write, "2\n".encode())
+    prompt.join()
+    assert prompt.getResult() == 42
+    # A multibyte character split across reads
+    data = "狼人\n".encode()
+    os.write(write, data[:2])
+    assert terminal.readLine(0.05) is None
+    os.write(write, data[2:])
+    assert terminal.readLine(1.0) == "狼人"
+    # The cancellation wakes up the prompt
+    token = CancelToken()
+    prompt = ReadInput("", str, 60.0, token=token, terminal=terminal)
+    prompt.start()
+    start = time.monotonic()
+    threading.Timer(0.05, token.cancel).start()
+    prompt.join()
+    assert prompt.getResult() is None and time.monotonic() - start < 1.0
+    os.close(write)
+    with raises(EOFError):
+        terminal.readLine(1.0)
+    terminal.close()
+    # An input that cannot be selected is forwarded by a single thread
+    terminal = TerminalInput(io.StringIO("1\n2\n"))
+    assert [terminal.readLine(1.0), terminal.readLine(1.0)] == ["1", "2"]
+    with raises(EOFError):
+        terminal.readLine(1.0)
+    terminal.close()
@@ -0,0 +1,229 @@
+from ..WP.api import MAX_FRAME_SIZE, ChunckedData, Frame, FrameBuffer, PacketDecodeError, PacketFrameError, FrameEncoder, _frameHeader, _recv, getFrameEncoder, setConnectionCodec
+from ..WP.codec import FLAG_STREAM, BinaryCodec, PacketFieldMismatchException, CompressionPolicy, GzipCodec, getCodec, listCodecs, negotiateCodec
+from ..misc.preset6 import Villager2Wolf2WitchPredictor
+from ..server.engine import Engine
+from ..server.logic import Game
+from pytest import raises
+import socket
+import struct
+import threading
+import time
+import zlib
+
+base = {
+    'srcAddr': '127.0.0.1',
+    'srcPort': 21567,
+    'destAddr': '192.168.1.100',
+    'destPort': 54321
+}
+
+samples = {
+    'Establish': (1, {}),
+    'EstablishResp': (-1, {'seat': 7, 'identity': -2, 'codec': 'binary'}),
+    'ActionPrompt': (3, {
+        'requestId': 42,
+        'iskill': True,
+        'format': 'int',
+        'prompt': '狼人请刀人。\n你有180秒的时间与同伴交流\n输入任何文本可以与同伴交流，输入数字投票',
+        'timeLimit': 180.0
+    }),
+    'ActionResp': (-3, {'requestId': 42, 'action': True, 'target': -1024}),
+    'FreeConversation': (5, {'content': '我是预言家，昨晚查验了3号玩家，是狼人。' * 20}),
+    'VoteResp': (-7, {'requestId': 43, 'vote': False, 'candidate': 0}),
+    'Death': (8, {}),
+}
+
+
+def makePacket(name: str) -> ChunckedData:
+    packetType, content = samples[name]
+    return ChunckedData(packetType, **base, **content)
+
+
+def test_binaryRoundTrip():
+    codec = BinaryCodec()
+    for name in samples:
+        packet = makePacket(name)
+        data = codec.encode(packet.type, packet.content)
+        assert codec.decode(packet.type, data) == packet.content
+
+
+def test_frameRoundTrip():
+    buffer = FrameBuffer()
+    packets = [makePacket(name) for name in samples]
+    for i, packet in enumerate(packets):
+        buffer.feed(packet.toFrame(getCodec(i % 2)))
+    for i, packet in enumerate(packets):
+        frame = buffer.pop()
+        assert frame.codec == i % 2
+        received = ChunckedData.fromFrame(frame)
+        assert (received.type, received.content) == (packet.type, packet.content)
+
+
+def test_negotiation():
+    assert listCodecs()[0] == 'binary'
+    assert negotiateCodec(['zstd', 'binary', 'gzip']).name == 'binary'
+    assert negotiateCodec([]).name == 'gzip'
+
+    engine = Engine()
+    game = Game(6, '127.0.0.1', port=0, engine=engine)
+    game.setIdentityList(**Villager2Wolf2WitchPredictor)
+    engine.startServing(game.server)
+    client = socket.create_connection(('127.0.0.1', game.port))
+    ChunckedData(1, **base, codecs=['binary', 'gzip']).send(client)
+    buffer = FrameBuffer()
+
+    def receive():
+        frame = buffer.pop()
+        while frame is None:
+            buffer.feed(client.recv(65536))
+            frame = buffer.pop()
+        return frame
+
+    frame = receive()
+    assert frame.codec == GzipCodec.id
+    assert ChunckedData.fromFrame(frame)['codec'] == 'binary'
+    setConnectionCodec(client, 'binary')
+    game.broadcast(None, "天黑请闭眼")
+    frame = receive()
+    assert frame.codec == BinaryCodec.id
+    assert ChunckedData.fromFrame(frame)['content'] == "天黑请闭眼"
+    client.close()
+    engine.close()
+
+
+def test_malformedNegotiation():
+    engine = Engine()
+    game = Game(6, '127.0.0.1', port=0, engine=engine)
+    game.setIdentityList(**Villager2Wolf2WitchPredictor)
+    engine.startServing(game.server)
+    for codecs in (5, [1, 'binary'], 'binary'):
+        client = socket.create_connection(('127.0.0.1', game.port))
+        ChunckedData(1, **base, codecs=codecs).send(client)
+        with client:
+            assert client.recv(1) == b''
+    assert len(game.identityList) == 6
+    assert not game.activePlayer
+    engine.close()
+
+
+def test_compressionPolicy():
+    encoder = FrameEncoder(BinaryCodec(), CompressionPolicy(threshold=128))
+    buffer = FrameBuffer()
+    packets = [makePacket(name) for name in samples] * 20
+    for packet in packets:
+        buffer.feed(encoder.encode(packet))
+    for packet in packets:
+        received = ChunckedData.fromFrame(buffer.pop())
+        assert (received.type, received.content) == (packet.type, packet.content)
+    stats = encoder.compressor.stats
+    # Only the prompt and the chat exceed the threshold
+    assert stats.compressed == 40 and stats.packets == len(packets)
+    assert stats.saved > 0
+    print(stats)
+
+
+def test_compressedTranscript():
+    sendSocket, receiveSocket = socket.socketpair()
+    setConnectionCodec(sendSocket, 'binary', CompressionPolicy(threshold=64))
+    transcript = [
+        ChunckedData(5, **base, content="%d号玩家发言：\t我是好人，%d号玩家昨晚的发言很可疑，建议大家投票放逐%d号玩家。" % (i % 12 + 1, i % 7 + 1, i % 7 + 1))
+        for i in range(500)
+    ]
+    sender = threading.Thread(
+        target=lambda: [packet.send(sendSocket) for packet in transcript])
+    sender.start()
+    assert [_recv(receiveSocket).content for i in range(500)] == \
+        [packet.content for packet in transcript]
+    sender.join()
+    stats = getFrameEncoder(sendSocket).compressor.stats
+    assert stats.compressed == 500
+    assert stats.wireBytes * 4 < stats.rawBytes
+    print(stats)
+    sendSocket.close()
+    receiveSocket.close()
+
+
+def test_decompressionBomb():
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    payload = compressor.compress(bytes(MAX_FRAME_SIZE + 1)) + \
+        compressor.flush(zlib.Z_SYNC_FLUSH)
+    assert len(payload) < MAX_FRAME_SIZE
+    buffer = FrameBuffer()
+    buffer.feed(struct.pack('!IbBB', len(payload), 5,
+                            BinaryCodec.id, FLAG_STREAM) + payload)
+    with raises(PacketFrameError):
+        buffer.pop()
+
+
+def measure(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for i in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1e9 / repeat
+
+
+def test_benchmark():
+    repeat = 2000
+    print()
+    print("%-18s%-8s%10s%14s%14s" %
+          ('packet', 'codec', 'bytes', 'encode ns/op', 'decode ns/op'))
+    for name in ('Establish', 'ActionPrompt', 'ActionResp', 'FreeConversation'):
+        packet = makePacket(name)
+        size = {}
+        for codec in (GzipCodec(), BinaryCodec()):
+            data = codec.encode(packet.type, packet.content)
+            size[codec.name] = len(data)
+            encode = measure(lambda: codec.encode(
+                packet.type, packet.content), repeat)
+            decode = measure(lambda: codec.decode(packet.type, data), repeat)
+            print("%-18s%-8s%10d%14.0f%14.0f" %
+                  (name, codec.name, len(data), encode, decode))
+        if name != 'FreeConversation':
+            assert size['binary'] < size['gzip']
+
+
+def test_corruptedPayload():
+    address = ('127.0.0.1', 21567)
+    packet = ChunckedData(-7, srcAddr=address[0], srcPort=address[1],
+                          destAddr=address[0], destPort=address[1], requestId=1, vote=True, candidate=3)
+    payload = packet.toFrame(getCodec('binary'))[_frameHeader.size:]
+    for frame in (Frame(-7, 1, payload[:5]), Frame(-7, 1, payload[:-1] + b'\x05'),
+                  Frame(-7, 0, payload), Frame(-7, 200, payload)):
+        with raises(PacketDecodeError):
+            ChunckedData.fromFrame(frame)
+    with raises(PacketFieldMismatchException):
+        getCodec('binary').encode(-7, dict(packet.content, candidate="3"))
+    buffer = FrameBuffer()
+    buffer.feed(_frameHeader.pack(4, 4, 1, FLAG_STREAM) + b'\xff\xff\xff\xff')
+    with raises(PacketDecodeError):
+        buffer.pop()
+
+
+def test_corruptedStreamClosesConnection():
+    engine = Engine()
+    accepted = []
+    server = engine.serve('127.0.0.1', 0,
+                          lambda connection, packet: accepted.append(connection))
+    port = server.sockets[0].getsockname()[1]
+    # A corrupted handshake is refused
+    client = socket.create_connection(('127.0.0.1', port))
+    client.sendall(_frameHeader.pack(3, 1, 1, 0) + b'\xff\xff\xff')
+    client.settimeout(5.0)
+    assert client.recv(1) == b''
+    client.close()
+    assert not accepted
+    # A corrupted packet after the handshake is reported as a lost connection
+    client = socket.create_connection(('127.0.0.1', port))
+    address = client.getsockname()
+    ChunckedData(1, srcAddr=address[0], srcPort=address[1],
+                 destAddr='127.0.0.1', destPort=port).send(client)
+    deadline = time.monotonic() + 5
+    while not accepted and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pending = accepted[0].receive(5.0)
+    client.sendall(_frameHeader.pack(3, -7, 1, 0) + b'\xff\xff\xff')
+    pending.join()
+    assert pending.getResult() is None
+    assert isinstance(pending.exception, PacketDecodeError)
+    client.close()
+    engine.close()
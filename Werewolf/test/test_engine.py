@@ -0,0 +1,175 @@
+from ..WP.api import ChunckedData, _recv, setConnectionCodec
+from ..server.abstraction import Villager, Wolf
+from ..server.barrier import PhaseBarrier, decisive, voteChoice
+from ..server.engine import Engine, PlayerConnection
+import queue
+import socket
+import threading
+
+
+def connectPlayers(engine: Engine, count: int, role=Villager):
+    accepted: 'queue.Queue[PlayerConnection]' = queue.Queue()
+    server = engine.serve('127.0.0.1', 0,
+                          lambda connection, packet: accepted.put(connection))
+    port = server.sockets[0].getsockname()[1]
+    clients, players = [], []
+    for i in range(count):
+        client = socket.create_connection(('127.0.0.1', port))
+        address = client.getsockname()
+        ChunckedData(1, srcAddr=address[0], srcPort=address[1],
+                     destAddr='127.0.0.1', destPort=port).send(client)
+        clients.append(client)
+        players.append(role(i + 1, accepted.get(timeout=5.0)))
+    return server, clients, players
+
+
+def test_requestResponse():
+    engine = Engine()
+    server, (client, ), (player, ) = connectPlayers(engine, 1)
+    pending = player.vote(timeout=5.0)
+    prompt = _recv(client)
+    assert prompt.type == 7
+    packet = player._getBasePacket()
+    packet.update(requestId=prompt['requestId'], vote=True, candidate=3)
+    ChunckedData(-7, **packet).send(client)
+    pending.join()
+    assert pending.getResult().type == -7
+    assert pending.getResult()['candidate'] == 3
+    client.close()
+    engine.close()
+
+
+def reply(client, player, prompt: ChunckedData, packetType: int, **content):
+    packet = player._getBasePacket()
+    packet.update(requestId=prompt['requestId'], **content)
+    ChunckedData(packetType, **packet).send(client)
+
+
+def test_receiveTimeout():
+    engine = Engine()
+    server, (client, ), (player, ) = connectPlayers(engine, 1)
+    pending = player.speak(timeout=0.2)
+    pending.join()
+    assert not pending.is_alive()
+    assert pending.getResult() is None
+    assert _recv(client).type == 6
+    client.close()
+    engine.close()
+
+
+def test_typedInbox():
+    engine = Engine()
+    server, (client, ), (player, ) = connectPlayers(engine, 1)
+    # A late reply to a speech is not taken as the vote
+    pending = player.speak(timeout=0.2)
+    pending.join()
+    speech = _recv(client)
+    vote = player.vote(timeout=5.0)
+    reply(client, player, speech, -6, content="late")
+    reply(client, player, _recv(client), -7, vote=True, candidate=2)
+    vote.join()
+    assert vote.getResult().type == -7 and vote.getResult()['candidate'] == 2
+    # The reply to the request timed out is dropped
+    assert player.socket.inbox.dropped == 1 and len(player.socket.inbox) == 0
+    client.close()
+    engine.close()
+
+
+def test_staleReplyDropped():
+    engine = Engine()
+    server, (client, ), (player, ) = connectPlayers(engine, 1)
+    stale = player.speak(timeout=0.2)
+    stale.join()
+    assert stale.getResult() is None
+    first = _recv(client)
+    # The late reply arrives after the next request of the same kind is sent
+    current = player.speak(timeout=5.0)
+    second = _recv(client)
+    assert second['requestId'] != first['requestId']
+    reply(client, player, first, -6, content="late")
+    reply(client, player, second, -6, content="on time")
+    current.join()
+    assert current.getResult()['content'] == "on time"
+    assert player.socket.inbox.dropped == 1
+    client.close()
+    engine.close()
+
+
+def test_staleReadRetired():
+    engine = Engine()
+    server, (client, ), (player, ) = connectPlayers(engine, 1)
+    # The read of the first request is still waiting when the second request is sent
+    stale = player.speak(timeout=5.0)
+    assert _recv(client).type == 6
+    current = player.speak(timeout=5.0)
+    prompt = _recv(client)
+    stale.join()
+    assert stale.getResult() is None
+    reply(client, player, prompt, -6, content="answer")
+    current.join()
+    assert current.getResult()['content'] == "answer"
+    client.close()
+    engine.close()
+
+
+def test_cutOffKillDropped():
+    engine = Engine()
+    server, (client, ), (wolf, ) = connectPlayers(engine, 1, Wolf)
+    # The wolf is cut off by the quorum of the first night
+    barrier = PhaseBarrier(decisive(voteChoice))
+    thread = barrier.start(1, wolf.kill, 5.0, cancel=wolf.socket.cancelPending)
+    first = _recv(client)
+    assert not barrier.wait(0.1)
+    thread.join()
+    # Its late vote is not read by the kill of the next night
+    barrier = PhaseBarrier()
+    barrier.start(1, wolf.kill, 5.0, cancel=wolf.socket.cancelPending)
+    second = _recv(client)
+    reply(client, wolf, first, -3, action=True, target=2)
+    reply(client, wolf, second, -3, action=True, target=3)
+    assert barrier.wait(5.0)
+    assert barrier.getResult(1)['target'] == 3
+    assert wolf.socket.inbox.dropped == 1
+    client.close()
+    engine.close()
+
+
+def test_broadcastWithoutThreads():
+    engine = Engine()
+    server, clients, players = connectPlayers(engine, 12)
+    threadCount = threading.active_count()
+    for i in range(20):
+        for player in players:
+            player.inform("公告%d" % (i, ))
+    assert threading.active_count() == threadCount
+    for client in clients:
+        assert [_recv(client)['content'] for i in range(20)] == \
+            ["公告%d" % (i, ) for i in range(20)]
+        client.close()
+    engine.close()
+
+
+def test_broadcastSingleEncode():
+    engine = Engine()
+    server, clients, players = connectPlayers(engine, 12)
+    for player in players[::2]:
+        setConnectionCodec(player.socket, 'binary')
+    rounds = 200
+    for i in range(rounds):
+        packet = ChunckedData.trusted(4, srcAddr='', srcPort=0, destAddr='', destPort=0,
+                                      content="第%d条公告：" % (i, ) + "天黑请闭眼" * 40)
+        engine.broadcast(packet, [player.socket for player in players])
+        # The private packets use the deflate stream of the connection between the broadcasts
+        players[0].inform("第%d条私信：" % (i, ) + "天黑请闭眼" * 40)
+    assert engine.broadcastStats.encodes == rounds * 2
+    for j, client in enumerate(clients):
+        expected = ["第%d条公告：" % (i, ) for i in range(rounds)]
+        if j == 0:
+            expected = [_ for i in range(rounds)
+                        for _ in ("第%d条公告：" % (i, ), "第%d条私信：" % (i, ))]
+        received = [_recv(client)['content'] for i in expected]
+        assert all(r.startswith(e) for r, e in zip(received, expected))
+        client.close()
+    print()
+    print(engine.broadcastStats)
+    engine.close()
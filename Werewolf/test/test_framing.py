@@ -0,0 +1,72 @@
+from ..WP.api import ChunckedData, FrameBuffer, ReceiveThread, _recv
+import random
+import socket
+import threading
+import time
+
+PACKETS = 5000
+
+
+def makePacket(i: int) -> ChunckedData:
+    return ChunckedData(
+        5,
+        srcAddr='127.0.0.1',
+        srcPort=90,
+        destAddr='127.0.0.1',
+        destPort=120,
+        content="%d:" % (i, ) + "狼" * random.randint(0, 256)
+    )
+
+
+def test_frameBufferFuzz():
+    random.seed(1)
+    packets = [makePacket(i) for i in range(500)]
+    stream = b''.join(packet.toFrame() for packet in packets)
+    buffer = FrameBuffer()
+    received = []
+    pos = 0
+    while pos < len(stream):
+        step = random.randint(1, 64)
+        buffer.feed(stream[pos:pos + step])
+        pos += step
+        frame = buffer.pop()
+        while frame is not None:
+            received.append(ChunckedData.fromFrame(frame))
+            assert received[-1].type == packets[len(received) - 1].type
+            frame = buffer.pop()
+    assert len(buffer) == 0
+    assert [_.content for _ in received] == [_.content for _ in packets]
+
+
+def test_pipelinedTransfer():
+    sendSocket, receiveSocket = socket.socketpair()
+    packets = [makePacket(i) for i in range(PACKETS)]
+
+    def sendAll():
+        for packet in packets:
+            packet.send(sendSocket)
+
+    sender = threading.Thread(target=sendAll, daemon=True)
+    start = time.perf_counter()
+    sender.start()
+    received = [_recv(receiveSocket) for i in range(PACKETS)]
+    elapsed = time.perf_counter() - start
+    sender.join()
+    print("%d packets in %.3fs, %.0f packets/s" %
+          (PACKETS, elapsed, PACKETS / elapsed))
+    assert [_.content for _ in received] == [_.content for _ in packets]
+    sendSocket.close()
+    receiveSocket.close()
+
+
+def test_receiveThreadKeepsRemainder():
+    sendSocket, receiveSocket = socket.socketpair()
+    packets = [makePacket(i) for i in range(3)]
+    sendSocket.sendall(b''.join(packet.toFrame() for packet in packets))
+    for packet in packets:
+        thread = ReceiveThread(receiveSocket, 5)
+        thread.start()
+        thread.join()
+        assert thread.getResult().content == packet.content
+    sendSocket.close()
+    receiveSocket.close()
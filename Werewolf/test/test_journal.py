@@ -0,0 +1,64 @@
+from ..bots import RuleBasedStrategy, playGames
+from ..misc.preset12 import Villager4Wolf3PredictorWitchHunterGuardWhite
+from ..server.journal import Journal, readJournal
+from pytest import raises
+import os
+import time
+
+
+def test_journal(tmp_path):
+    path = str(tmp_path / "games.journal")
+    journal = Journal(path, bufferSize=1 << 20, syncInterval=60.0)
+    for i in range(1000):
+        journal.record('vote', game="g", ballots=[[i, i % 7 or None]])
+    # The records wait in the buffer, the game never writes the file
+    assert os.path.getsize(path) == 0
+    journal.flush()
+    size = os.path.getsize(path)
+    events = list(readJournal(path))
+    assert len(events) == journal.records == 1000
+    assert events[999]['ballots'] == [[999, 5]] and events[7]['ballots'] == [[7, None]]
+    # The buffer is written by the thread of the journal once full
+    journal.bufferSize = 1024
+    for i in range(100):
+        journal.record('seat', seat=i, identity=0)
+    deadline = time.monotonic() + 5.0
+    while os.path.getsize(path) == size and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert os.path.getsize(path) > size
+    journal.close()
+    with raises(ValueError):
+        journal.record('result', status=1)
+    # A reopened journal appends, the torn record at the end is skipped
+    with Journal(path) as journal:
+        journal.record('result', status=1, note="狼人获胜")
+    with open(path, 'ab') as file:
+        file.write(b'\x00\x00\x00\x40\x12\x34')
+    events = list(readJournal(path))
+    assert len(events) == 1101
+    assert events[-1]['event'] == 'result' and events[-1]['note'] == "狼人获胜"
+
+
+def test_gamesJournaled(tmp_path):
+    path = str(tmp_path / "games.journal")
+    with Journal(path, syncInterval=0.05) as journal:
+        reports = playGames(2, Villager4Wolf3PredictorWitchHunterGuardWhite,
+                            RuleBasedStrategy, timeout=1.0, seed=2, journal=journal)
+    events = list(readJournal(path))
+    games = {}
+    for event in events:
+        games.setdefault(event['game'], []).append(event)
+    assert len(games) == 2
+    for report in reports:
+        game = next(_ for _ in games.values()
+                    if {e['seat']: e['identity'] for e in _ if e['event'] == 'seat'} == report.identities)
+        assert game[-1]['event'] == 'result' and game[-1]['status'] == report.status
+        # The wolves are asked once every night
+        nights = [e['night'] for e in game if e['event'] == 'kill']
+        assert nights and len(set(nights)) == len(nights)
+        wolves = {seat for seat, identity in report.identities.items() if identity < 0}
+        for event in game:
+            if event['event'] == 'kill':
+                assert all(voter in wolves for voter, seat in event['ballots'])
+            elif event['event'] == 'vote':
+                assert event['phase'] in ('election', 'exile')
@@ -0,0 +1,142 @@
+from ..WP.api import ChunckedData, FrameBuffer, _recv
+from ..misc.preset6 import Villager2Wolf2WitchPredictor
+from ..server.abstraction import Wolf
+from ..server.engine import Engine
+from ..server.lobby import Lobby
+from typing import Any, Dict, List, Optional
+import random
+import selectors
+import socket
+import time
+
+
+def join(port: int, room: Any) -> socket.socket:
+    client = socket.create_connection(('127.0.0.1', port))
+    address = client.getsockname()
+    ChunckedData(1, srcAddr=address[0], srcPort=address[1],
+                 destAddr='127.0.0.1', destPort=port, room=room).send(client)
+    return client
+
+
+def waitFull(game, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while game.identityList and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not game.identityList
+
+
+def test_routing():
+    engine = Engine()
+    lobby = Lobby('127.0.0.1', port=0, engine=engine)
+    games = {i: lobby.createRoom(i, 6, Villager2Wolf2WitchPredictor)
+             for i in (1, 2)}
+    clients = {i: [join(lobby.port, i) for j in range(6)] for i in (1, 2)}
+    for i in (1, 2):
+        waitFull(games[i])
+        seats = sorted(_recv(client)['seat'] for client in clients[i])
+        assert seats == sorted(games[i].activePlayer.keys())
+        assert {player.client for player in games[i].activePlayer.values()} == \
+            {client.getsockname() for client in clients[i]}
+    for room in (3, "1", [1]):
+        refused = join(lobby.port, room)
+        with refused:
+            assert refused.recv(1) == b''
+    for client in clients[1] + clients[2]:
+        client.close()
+    lobby.close()
+    engine.close()
+
+
+def autoRespond(clients, exploder: Optional[socket.socket] = None, useSkills: bool = True) -> Dict[socket.socket, List[ChunckedData]]:
+    """
+    Play the games with random choices until the server closes the connections.
+
+    If `useSkills` is `False`, the players do not use the skills or run for the police, so nobody dies at night. The exploder answers every speech request with the self-explosion until the explosion is announced.
+
+    Returns:
+
+        the packets received by each client
+    """
+    selector = selectors.DefaultSelector()
+    received: Dict[socket.socket, List[ChunckedData]] = {}
+    for client in clients:
+        selector.register(client, selectors.EVENT_READ, FrameBuffer())
+        received[client] = []
+    remaining = len(clients)
+    while remaining:
+        events = selector.select(30)
+        assert events, "The games are stuck"
+        for key, event in events:
+            client: socket.socket = key.fileobj
+            buffer: FrameBuffer = key.data
+            data = client.recv(65536)
+            if not data:
+                selector.unregister(client)
+                remaining -= 1
+                continue
+            buffer.feed(data)
+            frame = buffer.pop()
+            while frame is not None:
+                packet = ChunckedData.fromFrame(frame)
+                received[client].append(packet)
+                reply = {_: packet.content[_]
+                         for _ in ('srcAddr', 'destAddr', 'srcPort', 'destPort')}
+                if packet.type == 3:
+                    ChunckedData(-3, requestId=packet['requestId'], action=useSkills,
+                                 target=random.randint(1, 6), **reply).send(client)
+                elif packet.type == 6:
+                    if client is exploder and not any(_.type == 9 for _ in received[client]):
+                        ChunckedData(9, id=received[client][0]['seat'],
+                                     **reply).send(client)
+                    else:
+                        ChunckedData(-6, requestId=packet['requestId'],
+                                     content="pass", **reply).send(client)
+                elif packet.type == 7:
+                    ChunckedData(-7, requestId=packet['requestId'], vote=True,
+                                 candidate=random.randint(1, 6), **reply).send(client)
+                frame = buffer.pop()
+    selector.close()
+    return received
+
+
+def test_explodeInRoom():
+    engine = Engine()
+    lobby = Lobby('127.0.0.1', port=0, engine=engine)
+    game = lobby.createRoom(1, 6, Villager2Wolf2WitchPredictor)
+    thread = lobby.launchRoom(1)
+    clients = [join(lobby.port, 1) for i in range(6)]
+    waitFull(game)
+    players = {player.client: player for player in game.activePlayer.values()}
+    wolf = next(client for client in clients
+                if isinstance(players[client.getsockname()], Wolf))
+    received = autoRespond(clients, wolf, useSkills=False)
+    thread.join(10)
+    assert not thread.is_alive()
+    assert game.status != 0
+    seat = received[wolf][0]['seat']
+    for client in clients:
+        assert [_['id'] for _ in received[client] if _.type == 9] == [seat]
+    lobby.close()
+    engine.close()
+
+
+def test_roomsPerCore():
+    rooms = 20
+    engine = Engine()
+    lobby = Lobby('127.0.0.1', port=0, engine=engine)
+    games = [lobby.createRoom(i, 6, Villager2Wolf2WitchPredictor)
+             for i in range(rooms)]
+    threads = [lobby.launchRoom(i) for i in range(rooms)]
+    clients = [join(lobby.port, i) for i in range(rooms) for j in range(6)]
+    wall, cpu = time.perf_counter(), time.process_time()
+    received = autoRespond(clients)
+    for thread in threads:
+        thread.join(10)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    assert all(game.status != 0 for game in games)
+    packets = sum(len(_) for _ in received.values())
+    print("%d games, %d packets in %.3fs wall, %.3fs CPU, %.3fms CPU per packet: %.0f rooms per core" % (
+        rooms, packets, wall, cpu, cpu * 1000 / packets, rooms * wall / cpu
+    ))
+    lobby.close()
+    engine.close()
@@ -0,0 +1,104 @@
+from ..WP.api import ChunckedData, _recv
+from ..misc.preset6 import Villager2Wolf2WitchPredictor
+from ..server.abstraction import Wolf
+from ..server.engine import Engine
+from ..server.logic import Game
+from .test_engine import connectPlayers
+from .test_lobby import join
+import os
+import threading
+import time
+
+
+def cpuWhile(func) -> float:
+    cpu = time.process_time()
+    func()
+    return time.process_time() - cpu
+
+
+def test_idleWhileWaitingForPlayers():
+    engine = Engine()
+    game = Game(6, ipv4='127.0.0.1', port=0, engine=engine)
+    game.setIdentityList(**Villager2Wolf2WitchPredictor)
+    thread = threading.Thread(target=game.startListening, daemon=True)
+    thread.start()
+    assert cpuWhile(lambda: time.sleep(1.0)) < 0.1
+    clients = [join(game.port, 0) for i in range(6)]
+    thread.join(5.0)
+    assert not thread.is_alive()
+    for client in clients:
+        assert _recv(client).type == -1
+        client.close()
+    engine.close()
+
+
+def test_idleWhileWolvesTalk():
+    engine = Engine()
+    server, clients, players = connectPlayers(engine, 2)
+    wolves = [Wolf(i + 1, player.socket) for i, player in enumerate(players)]
+    wolves[0].setPeer(wolves[1])
+    result = []
+    cpu = cpuWhile(lambda: result.append(wolves[0].kill(timeout=1.0)))
+    assert cpu < 0.1
+    assert result[0].getResult() is None
+    assert _recv(clients[0]).type == 3
+    # The messages are forwarded to the peers until the wolf votes
+    thread = threading.Thread(
+        target=lambda: result.append(wolves[0].kill(timeout=5.0)))
+    thread.start()
+    prompt = _recv(clients[0])
+    assert prompt.type == 3
+    packet = wolves[0]._getBasePacket()
+    ChunckedData(5, content="刀3号", **packet).send(clients[0])
+    assert _recv(clients[1])['content'].endswith("刀3号")
+    ChunckedData(-3, requestId=prompt['requestId'],
+                 action=True, target=3, **packet).send(clients[0])
+    thread.join(5.0)
+    assert result[1].getResult()['target'] == 3
+    for client in clients:
+        client.close()
+    engine.close()
+
+
+def openFiles() -> int:
+    return len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else 0
+
+
+def test_cancelledDaysDoNotLeak():
+    engine = Engine()
+    server, (client, ), (player, ) = connectPlayers(engine, 1)
+    wolf = Wolf(1, player.socket)
+    game = Game(1, port=None, engine=engine)
+    game.allPlayer[1] = wolf
+    game.activePlayer[1] = wolf
+    player.socket.setHandler(9, lambda packet: game._onExplode(1, packet))
+    exploded = []
+    game.broken = exploded.append
+
+    def speakForever():
+        while True:
+            wolf.speak(timeout=60.0).join()
+    game.dayTime = speakForever
+    days = 1000
+
+    def explodeOnPrompt():
+        # The wolf explodes while the day is waiting for its speech
+        for i in range(days):
+            assert _recv(client).type == 6
+            ChunckedData(9, id=1, **wolf._getBasePacket()).send(client)
+
+    thread = threading.Thread(target=explodeOnPrompt, daemon=True)
+    thread.start()
+    game.runDay()
+    threadCount, fileCount = threading.active_count(), openFiles()
+    for i in range(days - 1):
+        game.runDay()
+    thread.join(5.0)
+    assert not thread.is_alive()
+    assert exploded == [1] * days
+    # The day threads are joined, the requests cancelled and no socket is opened
+    assert threading.active_count() == threadCount - 1
+    assert openFiles() == fileCount
+    assert wolf.token is None and not wolf.socket.pending
+    client.close()
+    engine.close()
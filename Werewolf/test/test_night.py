@@ -0,0 +1,72 @@
+from ..bots import SILENT, RuleBasedStrategy, View, playGame
+from ..server.barrier import decisive, voteChoice
+from ..server.logic import Game
+from ..misc.preset12 import Villager4Wolf3PredictorWitchHunterGuardWhite
+from time import monotonic
+from typing import Any, Dict, List, Tuple
+
+
+class SilentNight(RuleBasedStrategy):
+    """
+    The wolves, the predictor, the witch and the guard never answer in the first night.
+    """
+
+    prompts: List[Tuple[str, int, float]] = []
+    firstDay: Dict[str, float] = {}
+
+    def decide(self, kind: str, view: View, prompt: str = "") -> Any:
+        if kind == 'election':
+            SilentNight.firstDay.setdefault('start', monotonic())
+        if not SilentNight.firstDay and (kind == 'kill' or (kind == 'skill' and view.identity in (1, 2, 4))):
+            SilentNight.prompts.append((kind, view.identity, monotonic()))
+            return SILENT
+        return super().decide(kind, view, prompt)
+
+
+def test_concurrentNight():
+    timeout = 1.0
+    report = playGame(Villager4Wolf3PredictorWitchHunterGuardWhite,
+                      SilentNight, timeout=timeout, seed=3)
+    assert report.status != 0
+    kill = min(at for kind, identity, at in SilentNight.prompts if kind == 'kill')
+    asked = {identity: at for kind, identity, at in SilentNight.prompts if kind == 'skill'}
+    assert set(asked) == {1, 2, 4}
+    # The predictor and the guard are asked with the wolves, the witch once the wolves have finished
+    assert abs(asked[1] - kill) < timeout / 2 and abs(asked[4] - kill) < timeout / 2
+    assert asked[2] - kill >= timeout * 0.9
+    # The night takes the time of the wolves and the witch, not of every role in turn
+    assert SilentNight.firstDay['start'] - kill < timeout * 2.8
+
+
+class OneWolfAway(RuleBasedStrategy):
+    """
+    In the first night, the wolf with the smallest seat never votes, the others agree on the victim.
+    """
+
+    kills: List[float] = []
+    firstDay: Dict[str, float] = {}
+
+    def decide(self, kind: str, view: View, prompt: str = "") -> Any:
+        if kind == 'election':
+            OneWolfAway.firstDay.setdefault('start', monotonic())
+        if kind == 'kill' and not OneWolfAway.firstDay:
+            OneWolfAway.kills.append(monotonic())
+            if view.seat == min(view.wolves):
+                return SILENT
+            return min(_ for _ in view.others() if _ not in view.wolves)
+        return super().decide(kind, view, prompt)
+
+
+def test_killQuorum():
+    timeout = 2.0
+    quorums = Game.defaultQuorums
+    Game.defaultQuorums = dict(quorums, kill=decisive(voteChoice))
+    try:
+        report = playGame(Villager4Wolf3PredictorWitchHunterGuardWhite,
+                          OneWolfAway, timeout=timeout, seed=4)
+    finally:
+        Game.defaultQuorums = quorums
+    assert report.status != 0
+    assert len(OneWolfAway.kills) == 4
+    # The votes of three wolves decide the victim, the fourth wolf is not waited for
+    assert OneWolfAway.firstDay['start'] - min(OneWolfAway.kills) < timeout / 2
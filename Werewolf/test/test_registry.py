@@ -0,0 +1,83 @@
+from ..server.registry import PlayerRegistry, RegistryMismatchError
+from ..server.rules import GUARD, PREDICTOR, VILLAGER, WHITE_WEREWOLF, WITCH, WOLF, statusOf
+
+
+class FakePlayer:
+    def __init__(self, type: int):
+        self.type = type
+        self.police = False
+
+    def setPolice(self, val: bool = True):
+        self.police = val
+
+
+def newRegistry() -> PlayerRegistry:
+    registry = PlayerRegistry()
+    for seat, code in [(5, WOLF), (2, VILLAGER), (7, WITCH), (1, WHITE_WEREWOLF), (3, PREDICTOR), (6, VILLAGER)]:
+        registry[seat] = FakePlayer(code)
+    return registry
+
+
+def test_indexes():
+    registry = newRegistry()
+    assert registry.seats() == (1, 2, 3, 5, 6, 7)
+    assert registry.wolves() == (1, 5)
+    assert registry.seats(VILLAGER) == (2, 6)
+    assert registry.find(WITCH) is registry[7] and registry.find(GUARD) is None
+    assert registry.counts() == (2, 2, 2)
+    # The sequences are kept up to date on death
+    seats = registry.seats()
+    registry.pop(5)
+    del registry[2]
+    assert registry.pop(2, None) is None
+    assert registry.seats() == (1, 3, 6, 7) and seats == (1, 2, 3, 5, 6, 7)
+    assert registry.wolves() == (1, ) and registry.counts() == (1, 2, 1)
+    registry.pop(1)
+    assert registry.wolves() == () and statusOf(*registry.counts()) == 1
+    # `popitem()` removes the last seat and keeps the indexes up to date
+    seat, player = registry.popitem()
+    assert seat == 7 and player.type == WITCH
+    assert registry.seats() == (3, 6) and registry.find(WITCH) is None
+    registry.clear()
+    try:
+        registry.popitem()
+    except KeyError:
+        pass
+    else:
+        assert False, "An empty registry is popped"
+
+
+def test_police():
+    registry = newRegistry()
+    assert registry.police == 0
+    registry.setPolice(3)
+    assert registry.police == 3 and registry[3].police
+    registry.setPolice(6)
+    assert registry.police == 6 and registry[6].police and not registry[3].police
+    registry.pop(6)
+    assert registry.police == 0
+    # An invalid seat removes the police
+    registry.setPolice(3)
+    registry.setPolice(42)
+    assert registry.police == 0 and not registry[3].police
+
+
+def test_factions():
+    registry = newRegistry()
+    registry.debug = True
+    assert registry.factions == [2, 2, 2] and registry.status() == 0
+    registry.pop(2)
+    registry.pop(6)
+    assert registry.counts() == (0, 2, 2) and registry.status() == -1
+    registry[2] = FakePlayer(VILLAGER)
+    registry.pop(1)
+    registry.pop(5)
+    assert registry.counts() == (1, 2, 0) and registry.status() == 1
+    # The debug mode finds the counters out of date
+    dict.__setitem__(registry, 8, FakePlayer(WOLF))
+    try:
+        registry.status()
+    except RegistryMismatchError as e:
+        assert "Faction" in str(e)
+    else:
+        assert False, "The counters are not checked"
@@ -0,0 +1,72 @@
+from ..misc.preset6 import Villager2Wolf2WitchPredictor
+from ..misc.preset12 import Villager4Wolf3PredictorWitchHunterGuardWhite
+from ..server.rules import GUARD, HUNTER, IDIOT, PREDICTOR, VILLAGER, WITCH, WOLF, GameState, checkStatus, resolveExile, resolveNight, speakingOrder
+from ..server.simulator import RandomPolicy, simulate, simulateBatch
+import random
+import time
+
+
+def newState() -> GameState:
+    return GameState({1: WOLF, 2: WOLF, 3: WITCH, 4: GUARD, 5: HUNTER, 6: VILLAGER, 7: IDIOT})
+
+
+def test_night():
+    state = newState()
+    result = resolveNight(state, 6)
+    assert result.victims == [6] and result.state.night == 1
+    # The state passed in is not modified
+    assert state.night == 0
+    assert resolveNight(state, 6, witchTarget=0).victims == []
+    assert resolveNight(state, 6, guardTarget=6).victims == []
+    # A player both saved and guarded dies
+    assert resolveNight(state, 6, witchTarget=0, guardTarget=6).victims == [6]
+    poisoned = resolveNight(state, 6, witchTarget=5)
+    assert sorted(poisoned.victims) == [5, 6]
+    assert not poisoned.state.hunterStatus and poisoned.state.witchUsed == 2
+    # Each potion is used once, the witch cannot poison herself after the first night
+    assert resolveNight(poisoned.state, 6, witchTarget=7).victims == [6]
+    assert resolveNight(resolveNight(state, 0).state, 6, witchTarget=3).victims == [6]
+    # The same player cannot be guarded in two consecutive nights
+    guarded = resolveNight(state, 0, guardTarget=6).state
+    assert guarded.guardedLastNight == 6
+    assert resolveNight(guarded, 6, guardTarget=6).victims == [6]
+
+
+def test_exileAndStatus():
+    state = newState()
+    state, exiled = resolveExile(state, [7])
+    assert exiled == 0 and state.idiotUsed
+    state, exiled = resolveExile(state, [7])
+    assert exiled == 7 and 7 not in state.alive
+    assert resolveExile(state, [1, 2])[1] == 0
+    assert checkStatus(state) == 0
+    state.alive -= {1, 2}
+    assert checkStatus(state) == 1
+    state = newState()
+    state.alive.discard(6)
+    assert checkStatus(state) == -1
+
+
+def test_speakingOrder():
+    # The players next to the start point speak first, the start point speaks last
+    assert speakingOrder([1, 2, 3, 5, 6], 3, True) == [2, 1, 6, 5, 3]
+    assert speakingOrder([1, 2, 3, 5, 6], 3, False) == [5, 6, 1, 2, 3]
+
+
+def test_simulation():
+    result = simulate(Villager4Wolf3PredictorWitchHunterGuardWhite,
+                      RandomPolicy(random.Random(1), explodeRate=0.1), random.Random(1))
+    assert result.status in (1, -1)
+    assert len({seat for seat, cause, day in result.deaths}) == len(result.deaths)
+    # A batch with the same seed is reproducible
+    assert simulateBatch(200, Villager2Wolf2WitchPredictor, seed=3) == \
+        simulateBatch(200, Villager2Wolf2WitchPredictor, seed=3)
+
+
+def test_benchmark():
+    games = 20000
+    start = time.perf_counter()
+    result = simulateBatch(games, Villager4Wolf3PredictorWitchHunterGuardWhite, seed=0)
+    seconds = time.perf_counter() - start
+    assert sum(result.values()) == games
+    print("%d games in %.3fs, %.0f games per hour" % (games, seconds, games * 3600 / seconds))
@@ -0,0 +1,96 @@
+from ..WP.api import ChunckedData, ReceiveThread, ReceiveTimeoutError, TimeLock
+from ..WP.cancel import CancelToken, CancellationError
+from ..WP.scheduler import Scheduler
+from concurrent.futures import Future
+from pytest import raises
+import random
+import socket
+import threading
+import time
+
+
+def test_order():
+    scheduler = Scheduler()
+    fired = []
+    done = threading.Event()
+    start = time.monotonic()
+    delays = [random.uniform(0.1, 0.3) for i in range(1000)]
+    for delay in delays:
+        scheduler.callAt(start + delay, fired.append, delay)
+    scheduler.callLater(0.4, done.set)
+    assert done.wait(5)
+    assert fired == sorted(delays)
+    scheduler.close()
+
+
+def test_cancel():
+    scheduler = Scheduler()
+    fired = []
+    timers = [scheduler.callLater(0.1, fired.append, i) for i in range(1000)]
+    for timer in timers[::2]:
+        timer.cancel()
+    assert len(scheduler) == 500
+    assert scheduler.timeout(0.2, True).result(5)
+    assert fired == list(range(1, 1000, 2))
+    # A future cancelled does not keep its timer
+    scheduler.timeout(10).cancel()
+    assert len(scheduler) == 0
+    scheduler.close()
+
+
+def test_noThreadPerDeadline():
+    threads = threading.active_count()
+    locks = [TimeLock(0.2) for i in range(5000)]
+    for lock in locks:
+        lock.setDaemon(True)
+        lock.start()
+    assert threading.active_count() <= threads + 1
+    assert not locks[-1].getStatus()
+    assert locks[-1].wait(5)
+    assert all(lock.wait(1) for lock in locks)
+
+
+def test_receiveTimeout():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    sendSocket = socket.create_connection(server.getsockname())
+    receiveSocket, addr = server.accept()
+    threads = threading.active_count()
+    thread = ReceiveThread(receiveSocket, 0.2)
+    thread.start()
+    assert threading.active_count() == threads + 1
+    thread.join()
+    with raises(ReceiveTimeoutError):
+        thread.getResult()
+    # The socket is not read by a stale thread after the timeout
+    packet = ChunckedData(4, srcAddr='', srcPort=0, destAddr='', destPort=0, content="ok")
+    packet.send(sendSocket)
+    thread = ReceiveThread(receiveSocket, 5)
+    thread.start()
+    thread.join()
+    assert thread.getResult()['content'] == "ok"
+    for sock in (sendSocket, receiveSocket, server):
+        sock.close()
+
+
+def test_cancelToken():
+    token = CancelToken()
+    called = []
+    handle = token.onCancel(lambda: called.append(1))
+    token.removeCallback(token.onCancel(lambda: called.append(2)))
+    future: Future = Future()
+    token.link(future)
+    done: Future = Future()
+    token.link(done)
+    done.set_result(None)
+    # The callbacks of the futures done are removed
+    assert len(token) == 2 and handle
+    token.check()
+    token.cancel()
+    token.cancel()
+    assert called == [1] and future.cancelled() and token.isCancelled() and len(token) == 0
+    with raises(CancellationError):
+        token.check()
+    # A callback registered after the cancellation is called at once
+    assert token.onCancel(lambda: called.append(3)) == 0 and called == [1, 3]
@@ -0,0 +1,70 @@
+from ..WP.api import ChunckedData, Frame, PacketDecodeError
+from ..WP.codec import BinaryCodec, GzipCodec, getCodec
+from ..WP.schema import PacketFieldMismatchException, PacketTypeMismatchException, compileSchema, getValidator
+from ..WP.utils import _checkParam
+from pytest import raises
+import time
+
+base = {
+    'srcAddr': '127.0.0.1',
+    'srcPort': 21567,
+    'destAddr': '192.168.1.100',
+    'destPort': 54321
+}
+
+
+def test_compiledFields():
+    validators = compileSchema(_checkParam)
+    assert '' not in validators
+    for packetType in validators:
+        assert [_[0] for _ in validators[packetType].fields] == \
+            list(_checkParam['']) + list(_checkParam[packetType])
+    assert getCodec('binary').fields(-7) == getValidator(-7).fields
+
+
+def test_validation():
+    with raises(PacketTypeMismatchException):
+        ChunckedData(-7, **base, vote=True)
+    with raises(PacketFieldMismatchException):
+        ChunckedData(-7, **base, requestId=1, vote=True, candidate="3")
+    with raises(PacketTypeMismatchException):
+        ChunckedData(42, **base)
+    # bool is a subclass of int, the subclasses are accepted as before
+    assert ChunckedData(-3, **base, requestId=1, action=True, target=True)['target'] is True
+    # The trusted packets are not checked
+    assert ChunckedData.trusted(-7, **base, vote=True).content == \
+        dict(base, vote=True)
+
+
+def test_decodeValidation():
+    content = dict(base, requestId=1, vote=True, candidate="3")
+    payload = GzipCodec().encode(-7, content)
+    with raises(PacketDecodeError):
+        ChunckedData.fromFrame(Frame(-7, GzipCodec.id, payload))
+    with raises(PacketDecodeError):
+        ChunckedData.fromFrame(Frame(42, BinaryCodec.id, b''))
+    # The extra fields of the binary codec cannot override the fields in the schema
+    codec = getCodec('binary')
+    payload = codec.encode(-7, dict(base, requestId=1, vote=True, candidate=3))
+    forged = payload[:-1] + bytes([len('{"candidate":"3"}')]) + b'{"candidate":"3"}'
+    assert ChunckedData.fromFrame(Frame(-7, codec.id, forged))['candidate'] == 3
+
+
+def test_benchmark():
+    repeat = 20000
+    content = dict(base, requestId=1, vote=True, candidate=3)
+    frames = {}
+    for codec in (GzipCodec(), BinaryCodec()):
+        frames[codec.name] = Frame(-7, codec.id, codec.encode(-7, content))
+    print()
+    print("%-24s%14s" % ('operation', 'packets/s'))
+    for name, func in (
+        ('build', lambda: ChunckedData(-7, **content)),
+        ('build trusted', lambda: ChunckedData.trusted(-7, **content)),
+        ('parse gzip', lambda: ChunckedData.fromFrame(frames['gzip'])),
+        ('parse binary', lambda: ChunckedData.fromFrame(frames['binary'])),
+    ):
+        start = time.perf_counter()
+        for i in range(repeat):
+            func()
+        print("%-24s%14.0f" % (name, repeat / (time.perf_counter() - start)))
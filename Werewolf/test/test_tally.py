@@ -0,0 +1,82 @@
+from ..server import tally as tallyModule
+from ..server.rules import getVotingResult, mergeVotingResult
+from ..server.tally import Tally, leadersBatch, tallyBatch
+import random
+import time
+
+SEATS = 12
+
+
+def randomRounds(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    votes = [[rng.randint(0, SEATS) for i in range(SEATS - 1)] for j in range(count)]
+    police = [rng.randint(0, SEATS) for j in range(count)]
+    return votes, police
+
+
+def reference(votes, police):
+    return getVotingResult(mergeVotingResult([_ for _ in votes if _], police or None))
+
+
+def test_tally():
+    tally = Tally(SEATS, [1, 2, 3])
+    assert tally.leaders() == [] and tally.result() == {}
+    assert tally.add(2) and tally.add(3)
+    # The abstentions, the other seats and the other values are dropped
+    assert not tally.add(0) and not tally.add(4) and not tally.add(13) and not tally.add('1')
+    assert tally.leaders() == [2, 3]
+    assert tally.addPolice(3)
+    assert tally.result() == {2: 1.0, 3: 2.5} and tally.leaders() == [3]
+    tally.clear()
+    assert tally.leaders() == []
+
+
+def test_sameAsMerge():
+    votes, police = randomRounds(2000)
+    for row, seat in zip(votes, police):
+        tally = Tally(SEATS)
+        for _ in row:
+            tally.add(_)
+        tally.addPolice(seat)
+        assert tally.leaders() == sorted(reference(row, seat))
+        assert tally.result() == dict(mergeVotingResult([_ for _ in row if _], seat or None))
+
+
+def test_batch():
+    votes, police = randomRounds(500, 1)
+    valid = [[seat % 3 != 0 for seat in range(SEATS + 1)] for row in votes]
+    expected = []
+    for row, seat, mask in zip(votes, police, valid):
+        tally = Tally(SEATS, [_ for _ in range(SEATS + 1) if mask[_]])
+        for _ in row:
+            tally.add(_)
+        tally.addPolice(seat)
+        expected.append(tally.leaders())
+    assert leadersBatch(tallyBatch(votes, SEATS, police, valid)) == expected
+    # The same result without NumPy
+    numpy, tallyModule.numpy = tallyModule.numpy, None
+    try:
+        assert leadersBatch(tallyBatch(votes, SEATS, police, valid)) == expected
+    finally:
+        tallyModule.numpy = numpy
+
+
+def test_benchmark():
+    votes, police = randomRounds(20000, 2)
+    start = time.perf_counter()
+    for row, seat in zip(votes, police):
+        reference(row, seat)
+    merge = time.perf_counter() - start
+    start = time.perf_counter()
+    for row, seat in zip(votes, police):
+        tally = Tally(SEATS)
+        for _ in row:
+            tally.add(_)
+        tally.addPolice(seat)
+        tally.leaders()
+    single = time.perf_counter() - start
+    start = time.perf_counter()
+    leadersBatch(tallyBatch(votes, SEATS, police))
+    batch = time.perf_counter() - start
+    print("%d rounds: mergeVotingResult %.3fs, Tally %.3fs, tallyBatch %.3fs (NumPy %s)" % (
+        len(votes), merge, single, batch, "on" if tallyModule.numpy is not None else "off"))
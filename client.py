@@ -12,4 +12,9 @@ if __name__ == "__main__":
             input("Please enter the port of the server:\n"))
     except:
         serverPort = 21567
-    launchClient(serverAddr, serverPort)
+    try:
+        room = int(
+            input("Please enter the room number (leave empty if the server is not a lobby):\n"))
+    except:
+        room = None
+    launchClient(serverAddr, serverPort, room)